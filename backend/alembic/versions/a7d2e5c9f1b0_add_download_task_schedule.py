@@ -0,0 +1,30 @@
+"""add_download_task_schedule
+
+Revision ID: a7d2e5c9f1b0
+Revises: f3a9c6d1b8e4
+Create Date: 2026-10-16 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e5c9f1b0'
+down_revision: Union[str, None] = 'f3a9c6d1b8e4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('download_tasks', sa.Column('schedule', sa.String(length=100), nullable=True))
+    op.add_column('download_tasks', sa.Column('next_run_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_download_tasks_next_run_at'), 'download_tasks', ['next_run_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_download_tasks_next_run_at'), table_name='download_tasks')
+    op.drop_column('download_tasks', 'next_run_at')
+    op.drop_column('download_tasks', 'schedule')
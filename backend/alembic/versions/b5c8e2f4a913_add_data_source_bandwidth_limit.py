@@ -0,0 +1,26 @@
+"""add_data_source_bandwidth_limit
+
+Revision ID: b5c8e2f4a913
+Revises: 33a3d9f0060f
+Create Date: 2026-10-16 19:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5c8e2f4a913'
+down_revision: Union[str, None] = '33a3d9f0060f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('data_sources', sa.Column('bandwidth_limit', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('data_sources', 'bandwidth_limit')
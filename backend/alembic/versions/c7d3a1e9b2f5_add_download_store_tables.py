@@ -0,0 +1,73 @@
+"""add_download_store_tables
+
+Revision ID: c7d3a1e9b2f5
+Revises: b5c8e2f4a913
+Create Date: 2026-10-16 20:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7d3a1e9b2f5'
+down_revision: Union[str, None] = 'b5c8e2f4a913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stored_objects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('algorithm', sa.String(length=20), nullable=False),
+    sa.Column('checksum', sa.String(length=128), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('storage_path', sa.String(length=500), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('last_used_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('algorithm', 'checksum', name='uq_stored_objects_checksum')
+    )
+    op.create_index(op.f('ix_stored_objects_id'), 'stored_objects', ['id'], unique=False)
+
+    op.create_table('stored_object_urls',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('lookup_key', sa.String(length=64), nullable=False),
+    sa.Column('url', sa.Text(), nullable=False),
+    sa.Column('validator', sa.String(length=255), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['object_id'], ['stored_objects.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('lookup_key')
+    )
+    op.create_index(op.f('ix_stored_object_urls_id'), 'stored_object_urls', ['id'], unique=False)
+    op.create_index(op.f('ix_stored_object_urls_object_id'), 'stored_object_urls', ['object_id'], unique=False)
+
+    op.create_table('stored_object_refs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('object_id', sa.Integer(), nullable=False),
+    sa.Column('task_id', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=1000), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.ForeignKeyConstraint(['object_id'], ['stored_objects.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_stored_object_refs_id'), 'stored_object_refs', ['id'], unique=False)
+    op.create_index(op.f('ix_stored_object_refs_object_id'), 'stored_object_refs', ['object_id'], unique=False)
+    op.create_index(op.f('ix_stored_object_refs_task_id'), 'stored_object_refs', ['task_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stored_object_refs_task_id'), table_name='stored_object_refs')
+    op.drop_index(op.f('ix_stored_object_refs_object_id'), table_name='stored_object_refs')
+    op.drop_index(op.f('ix_stored_object_refs_id'), table_name='stored_object_refs')
+    op.drop_table('stored_object_refs')
+    op.drop_index(op.f('ix_stored_object_urls_object_id'), table_name='stored_object_urls')
+    op.drop_index(op.f('ix_stored_object_urls_id'), table_name='stored_object_urls')
+    op.drop_table('stored_object_urls')
+    op.drop_index(op.f('ix_stored_objects_id'), table_name='stored_objects')
+    op.drop_table('stored_objects')
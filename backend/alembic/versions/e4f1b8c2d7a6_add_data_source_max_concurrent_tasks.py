@@ -0,0 +1,26 @@
+"""add_data_source_max_concurrent_tasks
+
+Revision ID: e4f1b8c2d7a6
+Revises: c7d3a1e9b2f5
+Create Date: 2026-10-16 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4f1b8c2d7a6'
+down_revision: Union[str, None] = 'c7d3a1e9b2f5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('data_sources', sa.Column('max_concurrent_tasks', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('data_sources', 'max_concurrent_tasks')
@@ -0,0 +1,32 @@
+"""add_download_task_leases
+
+Revision ID: f3a9c6d1b8e4
+Revises: e4f1b8c2d7a6
+Create Date: 2026-10-16 22:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c6d1b8e4'
+down_revision: Union[str, None] = 'e4f1b8c2d7a6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('download_tasks', sa.Column('worker_id', sa.String(length=255), nullable=True))
+    op.add_column('download_tasks', sa.Column('heartbeat_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('download_tasks', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_download_tasks_lease_expires_at'), 'download_tasks', ['lease_expires_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_download_tasks_lease_expires_at'), table_name='download_tasks')
+    op.drop_column('download_tasks', 'lease_expires_at')
+    op.drop_column('download_tasks', 'heartbeat_at')
+    op.drop_column('download_tasks', 'worker_id')
@@ -1,14 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
+from datetime import datetime
 from app.db.session import get_db
 from app.schemas.data_source import DataSourceCreate, DataSourceResponse, DataSourceUpdate
-from app.schemas.download_task import DownloadTaskCreate, DownloadTaskResponse
+from app.schemas.download_task import (
+    BatchOperationResponse, BatchTaskResult, DownloadTaskCreate, DownloadTaskResponse
+)
 from app.schemas.common import MessageResponse
+from app.schemas.nc_file import NCFileResponse
 from app.crud.crud_data_source import data_source as crud_data_source
 from app.crud.crud_download_task import download_task as crud_download_task
+from app.crud.crud_nc_file import nc_file as crud_nc_file
 from app.services.data_download_service import download_service
 from app.services.task_scheduler import task_scheduler
+from app.services.http_client_pool import http_client_pool
+from app.services.ftp_pool import ftp_pool
+from app.services.sftp_pool import sftp_pool
+from app.services.bandwidth_limiter import bandwidth_limiter
+from app.services.download_store import download_store
+from app.services.http_directory_crawler import http_directory_crawler
+from app.utils.cron import CronSchedule, CronError
 
 router = APIRouter()
 
@@ -54,7 +66,29 @@ async def update_data_source(
     if not source:
         raise HTTPException(status_code=404, detail="Data source not found")
     
-    return crud_data_source.update(db, db_obj=source, obj_in=source_update)
+    updated = crud_data_source.update(db, db_obj=source, obj_in=source_update)
+    # URL或认证信息可能已变化，重建该数据源的共享HTTP会话
+    await http_client_pool.close_session(source_id)
+    ftp_pool.close_source(source_id)
+    sftp_pool.close_source(source_id)
+    http_directory_crawler.invalidate(source_id)
+    bandwidth_limiter.set_source_limit(source_id, updated.bandwidth_limit)
+    return updated
+
+@router.put("/sources/{source_id}/bandwidth", response_model=MessageResponse)
+async def update_source_bandwidth_limit(
+    source_id: int,
+    limit: int = Query(..., ge=0, description="Bytes per second (0 = unlimited)"),
+    db: Session = Depends(get_db)
+):
+    """设置数据源下载限速，立即作用于该数据源正在运行的任务"""
+    source = crud_data_source.get(db, id=source_id)
+    if not source:
+        raise HTTPException(status_code=404, detail="Data source not found")
+    
+    crud_data_source.update(db, db_obj=source, obj_in={"bandwidth_limit": limit or None})
+    bandwidth_limiter.set_source_limit(source_id, limit)
+    return {"message": f"Bandwidth limit for data source {source_id} set to {limit} B/s"}
 
 @router.delete("/sources/{source_id}", response_model=MessageResponse)
 async def delete_data_source(source_id: int, db: Session = Depends(get_db)):
@@ -64,6 +98,10 @@ async def delete_data_source(source_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Data source not found")
     
     crud_data_source.remove(db, id=source_id)
+    await http_client_pool.close_session(source_id)
+    ftp_pool.close_source(source_id)
+    sftp_pool.close_source(source_id)
+    http_directory_crawler.invalidate(source_id)
     return {"message": "Data source deleted successfully"}
 
 @router.get("/tasks", response_model=List[DownloadTaskResponse])
@@ -90,9 +128,17 @@ async def create_download_task(
     source = crud_data_source.get(db, id=task.source_id)
     if not source:
         raise HTTPException(status_code=400, detail="Data source not found")
+    if task.schedule:
+        _validate_schedule(task.schedule)
     
     return crud_download_task.create(db, obj_in=task)
 
+def _validate_schedule(schedule: str):
+    try:
+        CronSchedule.parse(schedule).next_after(datetime.utcnow())
+    except CronError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
+
 @router.get("/tasks/{task_id}", response_model=DownloadTaskResponse)
 async def get_download_task(task_id: int, db: Session = Depends(get_db)):
     """获取特定下载任务详情"""
@@ -101,6 +147,15 @@ async def get_download_task(task_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Download task not found")
     return task
 
+@router.get("/tasks/{task_id}/nc-files", response_model=List[NCFileResponse])
+async def get_download_task_nc_files(task_id: int, db: Session = Depends(get_db)):
+    """获取下载任务（options.convert）转换生成的 NetCDF 文件"""
+    task = crud_download_task.get(db, id=task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Download task not found")
+    nc_file_ids = (task.task_metadata or {}).get('nc_file_ids') or []
+    return crud_nc_file.get_by_ids(db, ids=nc_file_ids)
+
 @router.post("/tasks/{task_id}/start", response_model=MessageResponse)
 async def start_download_task(task_id: int, db: Session = Depends(get_db)):
     """启动下载任务"""
@@ -108,15 +163,23 @@ async def start_download_task(task_id: int, db: Session = Depends(get_db)):
     if not task:
         raise HTTPException(status_code=404, detail="Download task not found")
     
-    if task.status not in ["pending", "paused", "failed"]:
+    if not download_service.is_startable(task):
         raise HTTPException(status_code=400, detail="Task cannot be started in current status")
     
     success = await download_service.start_download(db, task_id)
     if not success:
+        _raise_if_running_elsewhere(db, task_id)
         raise HTTPException(status_code=500, detail="Failed to start download task")
     
     return {"message": f"Download task {task_id} started"}
 
+def _raise_if_running_elsewhere(db: Session, task_id: int):
+    """启动失败是因为任务已由其他副本运行时返回 409"""
+    db.expire_all()
+    task = crud_download_task.get(db, id=task_id)
+    if task and task.status == "running" and task.worker_id and task.worker_id != download_service.worker_id:
+        raise HTTPException(status_code=409, detail=f"Task is already running on worker {task.worker_id}")
+
 @router.post("/tasks/{task_id}/pause", response_model=MessageResponse)
 async def pause_download_task(task_id: int, db: Session = Depends(get_db)):
     """暂停下载任务"""
@@ -145,6 +208,7 @@ async def resume_download_task(task_id: int, db: Session = Depends(get_db)):
     
     success = await download_service.resume_download(db, task_id)
     if not success:
+        _raise_if_running_elsewhere(db, task_id)
         raise HTTPException(status_code=500, detail="Failed to resume download task")
     
     return {"message": f"Download task {task_id} resumed"}
@@ -173,96 +237,63 @@ async def delete_download_task(task_id: int, db: Session = Depends(get_db)):
     if task.status == "running":
         await download_service.cancel_download(db, task_id)
     
+    # 释放该任务对下载存储对象的引用，对象由垃圾回收清理
+    download_store.release_task(db, task_id)
+    
     # 删除任务记录
     crud_download_task.remove(db, id=task_id)
     return {"message": f"Download task {task_id} deleted successfully"}
 
 # Batch operations
-@router.post("/tasks/batch/start", response_model=MessageResponse)
+def _batch_response(action: str, results: Dict[int, Optional[str]]) -> BatchOperationResponse:
+    """汇总批量操作的逐任务结果"""
+    failures = [f"Task {task_id}: {error}" for task_id, error in results.items() if error]
+    succeeded = len(results) - len(failures)
+    message = f"Successfully {action} {succeeded} tasks"
+    if failures:
+        shown = failures[:20]
+        message += f". Failed: {'; '.join(shown)}"
+        if len(failures) > len(shown):
+            message += f" (and {len(failures) - len(shown)} more)"
+    return BatchOperationResponse(
+        message=message,
+        succeeded=succeeded,
+        failed=len(failures),
+        results=[
+            BatchTaskResult(task_id=task_id, success=error is None, error=error)
+            for task_id, error in results.items()
+        ]
+    )
+
+@router.post("/tasks/batch/start", response_model=BatchOperationResponse)
 async def start_multiple_tasks(
     task_ids: List[int],
     priority: int = Query(5, ge=1, le=10, description="Priority (1=highest, 10=lowest)"),
     db: Session = Depends(get_db)
 ):
-    """批量启动下载任务"""
-    started_count = 0
-    failed_tasks = []
-    
-    for task_id in task_ids:
-        try:
-            task = crud_download_task.get(db, task_id)
-            if not task:
-                failed_tasks.append(f"Task {task_id}: not found")
-                continue
-                
-            if task.status not in ["pending", "paused", "failed"]:
-                failed_tasks.append(f"Task {task_id}: invalid status {task.status}")
-                continue
-            
-            # Add to scheduler queue with priority
-            await task_scheduler.add_task_to_queue(db, task_id, priority)
-            started_count += 1
-            
-        except Exception as e:
-            failed_tasks.append(f"Task {task_id}: {str(e)}")
-    
-    message = f"Successfully queued {started_count} tasks"
-    if failed_tasks:
-        message += f". Failed: {'; '.join(failed_tasks)}"
-    
-    return {"message": message}
+    """批量启动下载任务（一次查询校验、一条语句更新状态后统一入队）"""
+    results = await task_scheduler.add_tasks_to_queue(db, task_ids, priority)
+    return _batch_response("queued", results)
 
-@router.post("/tasks/batch/pause", response_model=MessageResponse)
+@router.post("/tasks/batch/pause", response_model=BatchOperationResponse)
 async def pause_multiple_tasks(
     task_ids: List[int],
     db: Session = Depends(get_db)
 ):
-    """批量暂停下载任务"""
-    paused_count = 0
-    failed_tasks = []
-    
-    for task_id in task_ids:
-        try:
-            success = await download_service.pause_download(db, task_id)
-            if success:
-                paused_count += 1
-            else:
-                failed_tasks.append(f"Task {task_id}: failed to pause")
-        except Exception as e:
-            failed_tasks.append(f"Task {task_id}: {str(e)}")
-    
-    message = f"Successfully paused {paused_count} tasks"
-    if failed_tasks:
-        message += f". Failed: {'; '.join(failed_tasks)}"
-    
-    return {"message": message}
+    """批量暂停运行中或排队中的下载任务"""
+    results = await download_service.pause_downloads(db, task_ids)
+    task_scheduler.remove_tasks_from_queue([task_id for task_id, error in results.items() if error is None])
+    return _batch_response("paused", results)
 
-@router.post("/tasks/batch/cancel", response_model=MessageResponse)
+@router.post("/tasks/batch/cancel", response_model=BatchOperationResponse)
 async def cancel_multiple_tasks(
     task_ids: List[int],
     db: Session = Depends(get_db)
 ):
     """批量取消下载任务"""
-    cancelled_count = 0
-    failed_tasks = []
-    
-    for task_id in task_ids:
-        try:
-            success = await download_service.cancel_download(db, task_id)
-            if success:
-                # Also remove from scheduler queue
-                await task_scheduler.remove_task_from_queue(task_id)
-                cancelled_count += 1
-            else:
-                failed_tasks.append(f"Task {task_id}: failed to cancel")
-        except Exception as e:
-            failed_tasks.append(f"Task {task_id}: {str(e)}")
-    
-    message = f"Successfully cancelled {cancelled_count} tasks"
-    if failed_tasks:
-        message += f". Failed: {'; '.join(failed_tasks)}"
-    
-    return {"message": message}
+    results = await download_service.cancel_downloads(db, task_ids)
+    task_scheduler.remove_tasks_from_queue([task_id for task_id, error in results.items() if error is None])
+    return _batch_response("cancelled", results)
 
 # Task priority management
 @router.put("/tasks/{task_id}/priority", response_model=MessageResponse)
@@ -276,33 +307,64 @@ async def update_task_priority(
     if not task:
         raise HTTPException(status_code=404, detail="Download task not found")
     
-    # Update task metadata
-    if not task.task_metadata:
-        task.task_metadata = {}
-    task.task_metadata['priority'] = priority
-    
-    crud_download_task.update(db, db_obj=task, obj_in={"task_metadata": task.task_metadata})
-    
-    # If task is pending, update queue position
-    if task.status == "pending":
-        await task_scheduler.remove_task_from_queue(task_id)
-        await task_scheduler.add_task_to_queue(db, task_id, priority)
+    # 写入 task_metadata，排队中的任务同时调整队列位置
+    await task_scheduler.update_task_priority(db, task_id, priority)
     
     return {"message": f"Task {task_id} priority updated to {priority}"}
 
+@router.put("/tasks/{task_id}/schedule", response_model=DownloadTaskResponse)
+async def update_task_schedule(
+    task_id: int,
+    schedule: Optional[str] = Query(None, description="Cron expression in UTC, e.g. '0 3 * * *' or @hourly; omit to remove"),
+    db: Session = Depends(get_db)
+):
+    """设置或移除任务的定时计划，按计划重复运行，每次只下载上次成功运行之后的新文件"""
+    task = crud_download_task.get(db, task_id)
+    if not task:
+        raise HTTPException(status_code=404, detail="Download task not found")
+    if schedule:
+        _validate_schedule(schedule)
+    
+    return crud_download_task.set_schedule(db, task_id=task_id, schedule=schedule or None)
+
+# Bandwidth shaping
+@router.get("/bandwidth")
+async def get_bandwidth_status():
+    """获取限速配置及各运行任务的当前下载速率（字节/秒）"""
+    return bandwidth_limiter.get_status()
+
+@router.put("/bandwidth", response_model=MessageResponse)
+async def update_global_bandwidth_limit(
+    limit: int = Query(..., ge=0, description="Bytes per second across all downloads (0 = unlimited)")
+):
+    """调整全局下载限速（运行时生效，重启后恢复为 DOWNLOAD_BANDWIDTH_LIMIT）"""
+    bandwidth_limiter.set_global_limit(limit)
+    return {"message": f"Global bandwidth limit set to {limit} B/s"}
+
+# Content-addressed download store
+@router.get("/store")
+async def get_download_store_stats(db: Session = Depends(get_db)):
+    """获取下载存储统计（对象数、占用空间、去重节省的空间）"""
+    return download_store.get_stats(db)
+
+@router.post("/store/gc")
+async def collect_download_store_garbage(db: Session = Depends(get_db)):
+    """回收下载存储中不再被任何任务文件引用的对象"""
+    return download_store.collect_garbage(db)
+
 # Scheduler status
 @router.get("/scheduler/status")
-async def get_scheduler_status():
-    """获取任务调度器状态"""
-    return task_scheduler.get_queue_status()
+async def get_scheduler_status(db: Session = Depends(get_db)):
+    """获取任务调度器状态（含各任务的预计耗时和完成时间）"""
+    return task_scheduler.get_queue_status(db)
 
 @router.post("/scheduler/start", response_model=MessageResponse)
-async def start_scheduler(db: Session = Depends(get_db)):
+async def start_scheduler():
     """启动任务调度器"""
     if not task_scheduler.scheduler_running:
         # Start scheduler in background
         import asyncio
-        asyncio.create_task(task_scheduler.start_scheduler(db))
+        asyncio.create_task(task_scheduler.start_scheduler())
         return {"message": "Task scheduler started"}
     else:
         return {"message": "Task scheduler is already running"}
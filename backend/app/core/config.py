@@ -22,6 +22,7 @@ class Settings(BaseSettings):
     UPLOAD_DIR: str = "./uploads"
     NETCDF_DIR: str = "./data/netcdf"
     DOWNLOAD_DIR: str = "./data/downloads"
+    DOWNLOAD_STORE_DIR: str = "./data/download_store"
     ALGORITHM_DIR: str = "./data/algorithms"
     CONTAINER_WORK_DIR: str = "./data/container_work"
     
@@ -32,7 +33,79 @@ class Settings(BaseSettings):
     # Algorithm execution
     MAX_CONCURRENT_TASKS: int = 10
     TASK_TIMEOUT: int = 3600  # 1 hour
-    
+
+    # Download scheduler (queue, leases, recurring tasks)
+    DOWNLOAD_MAX_TASKS_PER_SOURCE: int = 3  # running download tasks per data source (0 = unlimited)
+    DOWNLOAD_MAX_TASKS_PER_HOST: int = 4  # running download tasks per remote hostname, across sources (0 = unlimited)
+    DOWNLOAD_PRIORITY_AGING_INTERVAL: float = 600.0  # seconds queued per one-level priority boost (0 = no aging)
+    DOWNLOAD_SPACE_RECHECK_INTERVAL: float = 60.0  # re-check free space this often while tasks wait for disk
+    DOWNLOAD_SCHEDULER_AUTOSTART: bool = True  # start the scheduler on boot after restoring the persisted queue
+    DOWNLOAD_WORKER_ID: str = ""  # lease owner name of this process; empty = hostname:pid (set a stable id to reclaim own tasks on restart)
+    DOWNLOAD_LEASE_SECONDS: int = 60  # running tasks not renewed for this long are taken over by other replicas
+    DOWNLOAD_HEARTBEAT_INTERVAL: float = 20.0  # seconds between lease renewals of running downloads
+    DOWNLOAD_QUEUE_SYNC_INTERVAL: float = 15.0  # seconds between queue syncs with tasks queued or orphaned by other replicas
+    DOWNLOAD_SCHEDULE_CHECK_INTERVAL: float = 30.0  # seconds between checks for due recurring (cron) download tasks
+    DOWNLOAD_QUEUE_POLICY: str = "priority"  # priority (strict priority + aging) or sjf (also demote long jobs by estimated duration)
+    DOWNLOAD_SJF_SECONDS_PER_LEVEL: float = 3600.0  # sjf: estimated transfer seconds per one-level priority demotion
+    DOWNLOAD_SJF_MAX_LEVELS: float = 5.0  # sjf: cap on the demotion, so aging still lets huge jobs run
+    DOWNLOAD_THROUGHPUT_SMOOTHING: float = 0.3  # weight of the newest run in a source's throughput average
+    DOWNLOAD_THROUGHPUT_DEFAULT_RATE: int = 10 * 1024 * 1024  # bytes/s assumed for ETAs before any throughput history
+    DOWNLOAD_THROUGHPUT_HISTORY_TASKS: int = 500  # recent tasks read at startup to seed throughput history
+
+    # Data download
+    DOWNLOAD_PROGRESS_FLUSH_INTERVAL: float = 0.5  # seconds between progress commits
+    DOWNLOAD_PROGRESS_FLUSH_PERCENT: float = 1.0  # or whenever progress advances this much
+    DOWNLOAD_RESUME_CHECKPOINT_INTERVAL: float = 10.0  # seconds between persisting in-flight resume offsets
+    DOWNLOAD_RESUME_CHECKPOINT_BYTES: int = 64 * 1024 * 1024  # or whenever this much more has been written
+    DOWNLOAD_MAX_PARALLEL_FILES: int = 4  # files fetched concurrently per directory task
+    DOWNLOAD_MAX_CONNECTIONS_PER_HOST: int = 8  # across all tasks hitting the same host
+    DOWNLOAD_SEGMENTS: int = 1  # connections per single-file HTTP download (1 = no segmentation)
+    DOWNLOAD_SEGMENT_MIN_SIZE: int = 64 * 1024 * 1024  # only segment files at least this large
+    DOWNLOAD_BANDWIDTH_LIMIT: int = 0  # bytes/s across all downloads (0 = unlimited), adjustable at runtime
+    DOWNLOAD_BANDWIDTH_BURST_SECONDS: float = 1.0  # token bucket capacity, in seconds of the configured rate
+    DOWNLOAD_VERIFY_CHECKSUMS: bool = True  # fetch .sha256/.md5 sidecars and fail files that do not match
+    DOWNLOAD_CHECKSUM_ALGORITHM: str = "sha256"  # hash computed while streaming when there is no sidecar ("" = off)
+    DOWNLOAD_STORE_ENABLED: bool = False  # content-addressed dedup store; tasks can override with options.dedup
+    DOWNLOAD_STORE_LINK_MODE: str = "auto"  # auto (reflink, then hardlink), reflink or hardlink
+    DOWNLOAD_RETRY_BASE_DELAY: float = 1.0  # seconds; retry n waits a random time up to base * 2^(n-1)
+    DOWNLOAD_RETRY_MAX_DELAY: float = 60.0  # cap on a single backoff (also bounds honoured Retry-After)
+    DOWNLOAD_EXTRACT_ARCHIVES: bool = False  # unpack .gz/.bz2/.xz/.zip/.tar.* while streaming (options.extract overrides)
+    DOWNLOAD_CONVERSION_QUEUE_SIZE: int = 8  # downloaded files waiting for conversion before downloads back off
+    DOWNLOAD_CONVERSION_WORKERS: int = 2  # files converted concurrently per task with options.convert
+    DOWNLOAD_PREFLIGHT_ENABLED: bool = True  # size queued tasks (HEAD/SIZE/stat) before the scheduler starts them
+    DOWNLOAD_PREFLIGHT_CONCURRENCY: int = 16  # size requests in flight per task during pre-flight
+    DOWNLOAD_PREFLIGHT_MAX_TASKS: int = 8  # tasks sized at the same time (bounds DB sessions after bulk enqueues)
+    DOWNLOAD_MIN_FREE_SPACE: int = 1024 * 1024 * 1024  # bytes always left free on the DOWNLOAD_DIR volume
+
+    # OPeNDAP subsetting
+    OPENDAP_SLICE_MAX_BYTES: int = 32 * 1024 * 1024  # largest hyperslab fetched in one .dods request
+    OPENDAP_PARALLEL_SLICES: int = 4  # slice requests in flight per task
+
+    # Shared HTTP client pool
+    HTTP_POOL_MAX_CONNECTIONS: int = 100  # per data source session
+    HTTP_POOL_DNS_CACHE_TTL: int = 300  # seconds
+    HTTP_POOL_KEEPALIVE_TIMEOUT: float = 30.0  # seconds an idle connection is kept open
+    HTTP_POOL_DEFAULT_TIMEOUT: int = 300  # connect/read timeout when a task has none
+
+    # HTTP directory listing
+    HTTP_LISTING_MAX_DEPTH: int = 0  # subdirectory levels to crawl (0 = only the given directory)
+    HTTP_LISTING_CONCURRENCY: int = 8  # index pages fetched in parallel
+    HTTP_LISTING_CACHE_TTL: int = 300  # seconds a listing is reused before revalidation (0 = no cache)
+    HTTP_LISTING_CACHE_MAX_PAGES: int = 2000
+
+    # FTP connection pool
+    FTP_POOL_MAX_CONNECTIONS_PER_SOURCE: int = 4  # logged-in sessions per data source
+    FTP_POOL_IDLE_TIMEOUT: float = 60.0  # seconds before an idle session is closed
+    FTP_POOL_CONNECT_TIMEOUT: float = 30.0
+
+    # SFTP transfers
+    SFTP_WINDOW_SIZE: int = 16 * 1024 * 1024  # SSH channel window; larger keeps long-RTT links busy
+    SFTP_MAX_PACKET_SIZE: int = 32768
+    SFTP_BUFFER_SIZE: int = 1024 * 1024  # local read/write buffer per file
+    SFTP_MAX_CONCURRENT_PREFETCH: int = 64  # outstanding read requests per file
+    SFTP_MAX_CHANNELS_PER_TASK: int = 4  # parallel SFTP channels over one SSH transport
+    SFTP_KEEPALIVE_INTERVAL: int = 30  # seconds
+
     @property
     def DATABASE_URL(self) -> str:
         return f"mysql+pymysql://{self.DATABASE_USER}:{self.DATABASE_PASSWORD}@{self.DATABASE_HOST}:{self.DATABASE_PORT}/{self.DATABASE_NAME}"
@@ -47,6 +120,7 @@ class Settings(BaseSettings):
             Path(self.UPLOAD_DIR),
             Path(self.NETCDF_DIR),
             Path(self.DOWNLOAD_DIR),
+            Path(self.DOWNLOAD_STORE_DIR),
             Path(self.ALGORITHM_DIR),
             Path(self.CONTAINER_WORK_DIR)
         ]
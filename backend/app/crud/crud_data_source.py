@@ -10,6 +10,11 @@ class CRUDDataSource:
     def get_multi(self, db: Session, *, skip: int = 0, limit: int = 100) -> List[DataSource]:
         return db.query(DataSource).filter(DataSource.is_active == True).offset(skip).limit(limit).all()
 
+    def get_by_ids(self, db: Session, *, ids: List[int]) -> List[DataSource]:
+        if not ids:
+            return []
+        return db.query(DataSource).filter(DataSource.id.in_(ids)).all()
+
     def get_by_name(self, db: Session, *, name: str) -> Optional[DataSource]:
         return db.query(DataSource).filter(DataSource.name == name).first()
 
@@ -21,7 +26,9 @@ class CRUDDataSource:
             protocol=obj_in.protocol,
             auth_required=obj_in.auth_required,
             username=obj_in.username,
-            password=obj_in.password  # In production, this should be encrypted
+            password=obj_in.password,  # In production, this should be encrypted
+            bandwidth_limit=obj_in.bandwidth_limit,
+            max_concurrent_tasks=obj_in.max_concurrent_tasks
         )
         db.add(db_obj)
         db.commit()
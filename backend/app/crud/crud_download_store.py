@@ -0,0 +1,108 @@
+import hashlib
+from typing import List, Optional, Dict, Any, Iterator
+from sqlalchemy.orm import Session
+from sqlalchemy import func
+from app.models.download_store import StoredObject, StoredObjectUrl, StoredObjectRef
+
+class CRUDDownloadStore:
+    def _lookup_key(self, url: str, validator: str) -> str:
+        return hashlib.sha256(f"{url}\n{validator}".encode('utf-8')).hexdigest()
+
+    def get(self, db: Session, id: int) -> Optional[StoredObject]:
+        return db.query(StoredObject).filter(StoredObject.id == id).first()
+
+    def get_by_checksum(self, db: Session, *, algorithm: str, checksum: str) -> Optional[StoredObject]:
+        return db.query(StoredObject).filter(
+            StoredObject.algorithm == algorithm,
+            StoredObject.checksum == checksum
+        ).first()
+
+    def get_by_url(self, db: Session, *, url: str, validator: str) -> Optional[StoredObject]:
+        entry = db.query(StoredObjectUrl).filter(
+            StoredObjectUrl.lookup_key == self._lookup_key(url, validator)
+        ).first()
+        return entry.stored_object if entry else None
+
+    def create(self, db: Session, *, algorithm: str, checksum: str, size: int, storage_path: str) -> StoredObject:
+        db_obj = StoredObject(
+            algorithm=algorithm,
+            checksum=checksum,
+            size=size,
+            storage_path=storage_path,
+            ref_count=0
+        )
+        db.add(db_obj)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def add_url(self, db: Session, *, db_obj: StoredObject, url: str, validator: str) -> None:
+        """登记 URL + 校验头；同一键已指向其他对象时改为指向当前对象"""
+        lookup_key = self._lookup_key(url, validator)
+        entry = db.query(StoredObjectUrl).filter(StoredObjectUrl.lookup_key == lookup_key).first()
+        if entry is None:
+            db.add(StoredObjectUrl(object_id=db_obj.id, lookup_key=lookup_key, url=url, validator=validator))
+        elif entry.object_id != db_obj.id:
+            entry.object_id = db_obj.id
+        db.commit()
+
+    def set_ref(self, db: Session, *, db_obj: StoredObject, task_id: int, path: str) -> None:
+        """记录任务保存目录中的文件引用了该对象，并维护引用计数"""
+        ref = db.query(StoredObjectRef).filter(
+            StoredObjectRef.task_id == task_id,
+            StoredObjectRef.path == path
+        ).first()
+        if ref is not None and ref.object_id == db_obj.id:
+            db_obj.last_used_at = func.now()
+            db.commit()
+            return
+
+        if ref is not None:
+            # 文件被新内容覆盖，释放对旧对象的引用
+            ref.stored_object.ref_count = StoredObject.ref_count - 1
+            ref.object_id = db_obj.id
+        else:
+            db.add(StoredObjectRef(object_id=db_obj.id, task_id=task_id, path=path))
+        db_obj.ref_count = StoredObject.ref_count + 1
+        db_obj.last_used_at = func.now()
+        db.commit()
+
+    def remove_refs(self, db: Session, *, refs: List[StoredObjectRef]) -> None:
+        for ref in refs:
+            ref.stored_object.ref_count = StoredObject.ref_count - 1
+            db.delete(ref)
+        db.commit()
+
+    def get_ref(self, db: Session, *, task_id: int, path: str) -> Optional[StoredObjectRef]:
+        return db.query(StoredObjectRef).filter(
+            StoredObjectRef.task_id == task_id,
+            StoredObjectRef.path == path
+        ).first()
+
+    def get_refs_by_task(self, db: Session, *, task_id: int) -> List[StoredObjectRef]:
+        return db.query(StoredObjectRef).filter(StoredObjectRef.task_id == task_id).all()
+
+    def iter_refs(self, db: Session, batch_size: int = 1000) -> Iterator[StoredObjectRef]:
+        return db.query(StoredObjectRef).yield_per(batch_size)
+
+    def get_unreferenced(self, db: Session) -> List[StoredObject]:
+        return db.query(StoredObject).filter(StoredObject.ref_count <= 0).all()
+
+    def remove(self, db: Session, *, db_obj: StoredObject) -> None:
+        db.delete(db_obj)
+        db.commit()
+
+    def get_stats(self, db: Session) -> Dict[str, Any]:
+        objects, stored_bytes, referenced_bytes = db.query(
+            func.count(StoredObject.id),
+            func.coalesce(func.sum(StoredObject.size), 0),
+            func.coalesce(func.sum(StoredObject.size * StoredObject.ref_count), 0)
+        ).one()
+        return {
+            "objects": objects,
+            "stored_bytes": int(stored_bytes),
+            "referenced_bytes": int(referenced_bytes),
+            "saved_bytes": max(int(referenced_bytes) - int(stored_bytes), 0)
+        }
+
+download_store = CRUDDownloadStore()
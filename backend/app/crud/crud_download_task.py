@@ -1,8 +1,10 @@
+from datetime import datetime, timedelta
 from typing import List, Optional, Union, Dict, Any
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, func
 from app.models.download_task import DownloadTask
 from app.schemas.download_task import DownloadTaskCreate, DownloadTaskUpdate
+from app.utils.cron import CronSchedule
 
 class CRUDDownloadTask:
     def get(self, db: Session, id: int) -> Optional[DownloadTask]:
@@ -26,9 +28,20 @@ class CRUDDownloadTask:
             
         return query.order_by(DownloadTask.created_at.desc()).offset(skip).limit(limit).all()
 
+    def get_by_ids(self, db: Session, *, ids: List[int]) -> List[DownloadTask]:
+        if not ids:
+            return []
+        return db.query(DownloadTask).filter(DownloadTask.id.in_(ids)).all()
+
+    def get_recent(self, db: Session, *, limit: int = 100) -> List[DownloadTask]:
+        return db.query(DownloadTask).order_by(DownloadTask.id.desc()).limit(limit).all()
+
     def get_by_status(self, db: Session, *, status: str) -> List[DownloadTask]:
         return db.query(DownloadTask).filter(DownloadTask.status == status).all()
 
+    def get_by_statuses(self, db: Session, *, statuses: List[str]) -> List[DownloadTask]:
+        return db.query(DownloadTask).filter(DownloadTask.status.in_(statuses)).all()
+
     def create(self, db: Session, *, obj_in: DownloadTaskCreate) -> DownloadTask:
         db_obj = DownloadTask(
             source_id=obj_in.source_id,
@@ -36,7 +49,10 @@ class CRUDDownloadTask:
             filename_pattern=obj_in.filename_pattern,
             max_retries=obj_in.max_retries,
             timeout=obj_in.timeout,
-            status="pending"
+            status="pending",
+            task_metadata={"options": obj_in.options.model_dump(exclude_none=True)} if obj_in.options else None,
+            schedule=obj_in.schedule,
+            next_run_at=CronSchedule.parse(obj_in.schedule).next_after(datetime.utcnow()) if obj_in.schedule else None
         )
         db.add(db_obj)
         db.commit()
@@ -55,26 +71,228 @@ class CRUDDownloadTask:
         db.refresh(db_obj)
         return db_obj
 
-    def update_progress(self, db: Session, *, task_id: int, progress: float, downloaded_size: int = None) -> DownloadTask:
+    def update_progress(
+        self, 
+        db: Session, 
+        *, 
+        task_id: int, 
+        progress: float, 
+        downloaded_size: int = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ) -> DownloadTask:
         db_obj = self.get(db, task_id)
         if db_obj:
             db_obj.progress = progress
             if downloaded_size is not None:
                 db_obj.downloaded_size = downloaded_size
+            if metadata:
+                self._merge_metadata(db_obj, metadata)
             db.commit()
             db.refresh(db_obj)
         return db_obj
 
+    def update_metadata(
+        self, db: Session, *, task_id: int, metadata: Dict[str, Any], status: Optional[str] = None
+    ) -> DownloadTask:
+        db_obj = self.get(db, task_id)
+        if db_obj:
+            self._merge_metadata(db_obj, metadata)
+            if status:
+                self._apply_status(db_obj, status)
+            db.commit()
+            db.refresh(db_obj)
+        return db_obj
+
+    def _merge_metadata(self, db_obj: DownloadTask, metadata: Dict[str, Any]):
+        # Assign a new dict so SQLAlchemy detects the JSON change; None removes a key
+        merged = dict(db_obj.task_metadata or {})
+        for key, value in metadata.items():
+            if value is None:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        db_obj.task_metadata = merged
+
     def set_status(self, db: Session, *, task_id: int, status: str, error_message: str = None) -> DownloadTask:
         db_obj = self.get(db, task_id)
         if db_obj:
-            db_obj.status = status
+            self._apply_status(db_obj, status)
             if error_message:
                 db_obj.error_message = error_message
             db.commit()
             db.refresh(db_obj)
         return db_obj
 
+    def set_status_bulk(
+        self, db: Session, *, ids: List[int], status: str, from_statuses: Optional[List[str]] = None
+    ) -> int:
+        """一条 UPDATE 语句修改多个任务的状态（可限定只修改处于 from_statuses 的行），返回受影响的行数"""
+        if not ids:
+            return 0
+        values = {DownloadTask.status: status}
+        if status != "running":
+            values.update({DownloadTask.worker_id: None, DownloadTask.lease_expires_at: None})
+        query = db.query(DownloadTask).filter(DownloadTask.id.in_(ids))
+        if from_statuses:
+            query = query.filter(DownloadTask.status.in_(from_statuses))
+        count = query.update(values, synchronize_session=False)
+        db.commit()
+        return count
+
+    def enqueue_bulk(
+        self, db: Session, *, ids: List[int], priority: int, queued_at: str, from_statuses: List[str]
+    ) -> int:
+        """一条 UPDATE 把仍处于 from_statuses 的任务置为 pending，返回受影响的行数
+
+        task_metadata 在数据库中以 JSON_SET 只写入 priority 和 queued_at 两个键，
+        不会用旧快照覆盖并发写入的 resume/preflight 等其他键；已被其他副本认领的任务不受影响。
+        """
+        if not ids:
+            return 0
+        metadata = func.json_set(
+            func.coalesce(DownloadTask.task_metadata, func.json_object()),
+            '$.priority', priority, '$.queued_at', queued_at
+        )
+        count = (
+            db.query(DownloadTask)
+            .filter(DownloadTask.id.in_(ids), DownloadTask.status.in_(from_statuses))
+            .update({
+                DownloadTask.status: "pending",
+                DownloadTask.worker_id: None,
+                DownloadTask.lease_expires_at: None,
+                DownloadTask.task_metadata: metadata
+            }, synchronize_session=False)
+        )
+        db.commit()
+        return count
+
+    def set_schedule(self, db: Session, *, task_id: int, schedule: Optional[str]) -> DownloadTask:
+        """设置或清除任务的 cron 计划，并计算下次运行时间"""
+        db_obj = self.get(db, task_id)
+        if db_obj:
+            db_obj.schedule = schedule
+            db_obj.next_run_at = CronSchedule.parse(schedule).next_after(datetime.utcnow()) if schedule else None
+            db.commit()
+            db.refresh(db_obj)
+        return db_obj
+
+    def get_due_schedules(self, db: Session, *, now: datetime) -> List[DownloadTask]:
+        """锁定到期的定时任务（SKIP LOCKED，多个副本不会物化同一次运行），调用方修改后需 commit 释放"""
+        return (
+            db.query(DownloadTask)
+            .filter(DownloadTask.schedule.isnot(None), DownloadTask.next_run_at <= now)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+    def _apply_status(self, db_obj: DownloadTask, status: str):
+        # 离开 running 状态即释放租约
+        db_obj.status = status
+        if status != "running":
+            db_obj.worker_id = None
+            db_obj.lease_expires_at = None
+
+    def claim(self, db: Session, *, task_id: int, worker_id: str, lease_seconds: int) -> Optional[DownloadTask]:
+        """原子地认领 pending 任务：SELECT ... FOR UPDATE SKIP LOCKED 锁定该行，置为 running 并写入租约
+
+        任务已被其他进程锁定、认领或不再是 pending 时返回 None。
+        """
+        db_obj = (
+            db.query(DownloadTask)
+            .filter(DownloadTask.id == task_id, DownloadTask.status == "pending")
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if db_obj is None:
+            db.rollback()
+            return None
+        self._set_lease(db_obj, worker_id, lease_seconds)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def acquire_lease(self, db: Session, *, task_id: int, worker_id: str, lease_seconds: int) -> Optional[DownloadTask]:
+        """置为 running 并写入本进程的租约（直接启动/恢复任务时使用）
+
+        以 SELECT ... FOR UPDATE 锁定该行后判断：任务正由其他进程持有未过期的租约运行时不修改并返回 None，
+        同一任务不会在两个副本上同时运行。
+        """
+        db_obj = db.query(DownloadTask).filter(DownloadTask.id == task_id).with_for_update().first()
+        if db_obj is None or not self._lease_available(db_obj, worker_id):
+            db.rollback()
+            return None
+        self._set_lease(db_obj, worker_id, lease_seconds)
+        db.commit()
+        db.refresh(db_obj)
+        return db_obj
+
+    def _lease_available(self, db_obj: DownloadTask, worker_id: str) -> bool:
+        if db_obj.status != "running" or db_obj.worker_id in (None, worker_id):
+            return True
+        return db_obj.lease_expires_at is not None and db_obj.lease_expires_at.replace(tzinfo=None) < datetime.utcnow()
+
+    def _set_lease(self, db_obj: DownloadTask, worker_id: str, lease_seconds: int):
+        now = datetime.utcnow()
+        db_obj.status = "running"
+        db_obj.worker_id = worker_id
+        db_obj.heartbeat_at = now
+        db_obj.lease_expires_at = now + timedelta(seconds=lease_seconds)
+
+    def renew_leases(self, db: Session, *, ids: List[int], worker_id: str, lease_seconds: int) -> List[int]:
+        """为本进程运行中的任务续约，返回仍由本进程持有的任务 ID
+
+        租约已被其他进程接管、或任务已在别处被暂停/取消的任务不在返回值中；worker_id 为空的运行中任务
+        （迁移前启动的任务）由本进程接手续约。
+        """
+        if not ids:
+            return []
+        now = datetime.utcnow()
+        held = (
+            db.query(DownloadTask)
+            .filter(
+                DownloadTask.id.in_(ids),
+                DownloadTask.status == "running",
+                or_(DownloadTask.worker_id == worker_id, DownloadTask.worker_id.is_(None))
+            )
+        )
+        held.update({
+            DownloadTask.worker_id: worker_id,
+            DownloadTask.heartbeat_at: now,
+            DownloadTask.lease_expires_at: now + timedelta(seconds=lease_seconds)
+        }, synchronize_session=False)
+        db.commit()
+        return [
+            row.id for row in db.query(DownloadTask.id).filter(
+                DownloadTask.id.in_(ids), DownloadTask.status == "running", DownloadTask.worker_id == worker_id
+            )
+        ]
+
+    def release_stale_leases(self, db: Session, *, worker_id: str, exclude_ids: List[int]) -> List[int]:
+        """把失去持有者的运行中任务改回 pending 以便重新排队，返回这些任务 ID
+
+        失去持有者指：租约已过期（进程已退出或失联）、没有租约（迁移前遗留），或由本进程持有却不在
+        exclude_ids（本进程实际运行的下载）中（进程以相同 worker_id 重启）。各行先以 SKIP LOCKED 锁定，
+        多个进程同时接管时每个任务只会被释放一次。
+        """
+        query = db.query(DownloadTask).filter(
+            DownloadTask.status == "running",
+            or_(
+                DownloadTask.worker_id.is_(None),
+                DownloadTask.worker_id == worker_id,
+                DownloadTask.lease_expires_at < datetime.utcnow()
+            )
+        )
+        if exclude_ids:
+            query = query.filter(~DownloadTask.id.in_(exclude_ids))
+        stale = query.with_for_update(skip_locked=True).all()
+        now = datetime.utcnow().isoformat()
+        for db_obj in stale:
+            self._apply_status(db_obj, "pending")
+            if not (db_obj.task_metadata or {}).get('queued_at'):
+                self._merge_metadata(db_obj, {"queued_at": now})
+        db.commit()
+        return [db_obj.id for db_obj in stale]
+
     def remove(self, db: Session, *, id: int) -> DownloadTask:
         obj = db.query(DownloadTask).get(id)
         if obj:
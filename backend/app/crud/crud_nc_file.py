@@ -72,6 +72,11 @@ class CRUDNCFile:
     def get_by_filename(self, db: Session, *, filename: str) -> Optional[NCFile]:
         return db.query(NCFile).filter(NCFile.original_filename == filename).first()
 
+    def get_by_ids(self, db: Session, *, ids: List[int]) -> List[NCFile]:
+        if not ids:
+            return []
+        return db.query(NCFile).filter(NCFile.id.in_(ids)).order_by(NCFile.id).all()
+
     def create(self, db: Session, *, obj_in: Union[NCFileCreate, Dict[str, Any]]) -> NCFile:
         if isinstance(obj_in, dict):
             create_data = obj_in
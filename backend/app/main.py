@@ -1,7 +1,13 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.v1 import api_router
 from app.core.config import settings
+from app.services.http_client_pool import http_client_pool
+from app.services.ftp_pool import ftp_pool
+from app.services.sftp_pool import sftp_pool
+from app.services.data_download_service import download_service
+from app.services.task_scheduler import task_scheduler
 
 app = FastAPI(
     title="Ocean Data Platform API",
@@ -23,8 +29,23 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 
 @app.on_event("startup")
 async def startup_event():
-    """Create necessary directories on startup"""
+    """Create necessary directories and shared download clients on startup"""
     settings.create_directories()
+    await http_client_pool.startup()
+    # 从数据库恢复下载队列（包括上次退出时中断的任务）
+    await task_scheduler.restore_queue()
+    if settings.DOWNLOAD_SCHEDULER_AUTOSTART:
+        asyncio.create_task(task_scheduler.start_scheduler())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled download connections on shutdown"""
+    # 停止调度并中断进行中的下载，进度和续传偏移量写库后任务回到队列
+    await task_scheduler.stop_scheduler()
+    await download_service.suspend_all()
+    await http_client_pool.shutdown()
+    ftp_pool.close_all()
+    sftp_pool.close_all()
 
 @app.get("/")
 async def root():
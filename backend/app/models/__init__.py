@@ -1,4 +1,5 @@
 from app.models.data_source import DataSource
 from app.models.download_task import DownloadTask
 from app.models.nc_file import NCFile, ConversionTask
-from app.models.algorithm import Algorithm, AlgorithmExecution
\ No newline at end of file
+from app.models.algorithm import Algorithm, AlgorithmExecution
+from app.models.download_store import StoredObject, StoredObjectUrl, StoredObjectRef
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Text
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
@@ -9,10 +9,12 @@ class DataSource(Base):
     name = Column(String(255), nullable=False, index=True)
     url = Column(Text, nullable=False)
     description = Column(Text)
-    protocol = Column(String(50), default="HTTP")  # HTTP, FTP, SFTP
+    protocol = Column(String(50), default="HTTP")  # HTTP, FTP, SFTP, OPENDAP
     auth_required = Column(Boolean, default=False)
     username = Column(String(255))
     password = Column(String(255))  # Should be encrypted in production
     is_active = Column(Boolean, default=True)
+    bandwidth_limit = Column(BigInteger, nullable=True)  # bytes/s, NULL or 0 = unlimited
+    max_concurrent_tasks = Column(Integer, nullable=True)  # NULL = DOWNLOAD_MAX_TASKS_PER_SOURCE, 0 = unlimited
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
\ No newline at end of file
@@ -0,0 +1,49 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Text, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db.base_class import Base
+
+
+class StoredObject(Base):
+    """内容寻址存储中的一个文件，按校验和唯一"""
+    __tablename__ = "stored_objects"
+    __table_args__ = (UniqueConstraint("algorithm", "checksum", name="uq_stored_objects_checksum"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    algorithm = Column(String(20), nullable=False)  # md5, sha256
+    checksum = Column(String(128), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    storage_path = Column(String(500), nullable=False)  # path inside DOWNLOAD_STORE_DIR
+    ref_count = Column(Integer, default=0, nullable=False)  # number of linked files in task save paths
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    urls = relationship("StoredObjectUrl", back_populates="stored_object", cascade="all, delete-orphan")
+    refs = relationship("StoredObjectRef", back_populates="stored_object", cascade="all, delete-orphan")
+
+
+class StoredObjectUrl(Base):
+    """远端 URL + 校验头(ETag/Last-Modified/mtime) 到存储对象的索引"""
+    __tablename__ = "stored_object_urls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    object_id = Column(Integer, ForeignKey("stored_objects.id", ondelete="CASCADE"), nullable=False, index=True)
+    lookup_key = Column(String(64), nullable=False, unique=True)  # sha256(url + validator)
+    url = Column(Text, nullable=False)
+    validator = Column(String(255), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    stored_object = relationship("StoredObject", back_populates="urls")
+
+
+class StoredObjectRef(Base):
+    """下载任务保存目录中链接到存储对象的文件（引用计数的依据）"""
+    __tablename__ = "stored_object_refs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    object_id = Column(Integer, ForeignKey("stored_objects.id", ondelete="CASCADE"), nullable=False, index=True)
+    task_id = Column(Integer, nullable=False, index=True)
+    path = Column(String(1000), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    stored_object = relationship("StoredObject", back_populates="refs")
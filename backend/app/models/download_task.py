@@ -21,6 +21,13 @@ class DownloadTask(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     started_at = Column(DateTime(timezone=True))
     completed_at = Column(DateTime(timezone=True))
+    # 多副本调度：运行中任务由认领它的进程持有租约，进程定期续约，租约过期后其他进程可接管
+    worker_id = Column(String(255))
+    heartbeat_at = Column(DateTime(timezone=True))
+    lease_expires_at = Column(DateTime(timezone=True), index=True)
+    # 定时任务：cron 表达式（UTC）及下次运行时间，由 TaskScheduler 到期时入队
+    schedule = Column(String(100))
+    next_run_at = Column(DateTime(timezone=True), index=True)
     
     # Relationship
     data_source = relationship("DataSource", backref="download_tasks")
\ No newline at end of file
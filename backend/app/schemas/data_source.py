@@ -6,10 +6,12 @@ class DataSourceBase(BaseModel):
     name: str
     url: str
     description: Optional[str] = None
-    protocol: str = "HTTP"  # HTTP, FTP, SFTP
+    protocol: str = "HTTP"  # HTTP, FTP, SFTP, OPENDAP
     auth_required: bool = False
     username: Optional[str] = None
     password: Optional[str] = None
+    bandwidth_limit: Optional[int] = None  # 下载限速（字节/秒），为空或0表示不限速
+    max_concurrent_tasks: Optional[int] = None  # 同时运行的下载任务数上限，为空取默认值，0表示不限
 
 class DataSourceCreate(DataSourceBase):
     pass
@@ -22,6 +24,8 @@ class DataSourceUpdate(BaseModel):
     auth_required: Optional[bool] = None
     username: Optional[str] = None
     password: Optional[str] = None
+    bandwidth_limit: Optional[int] = None
+    max_concurrent_tasks: Optional[int] = None
 
 class DataSourceResponse(DataSourceBase):
     id: int
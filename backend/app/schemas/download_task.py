@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
 
@@ -11,6 +11,24 @@ class TaskStatus(str, Enum):
     FAILED = "failed"
     CANCELLED = "cancelled"
 
+class DownloadOptions(BaseModel):
+    """下载任务可选参数，保存在 task_metadata['options'] 中"""
+    parallel_files: Optional[int] = None  # 目录下载时同时传输的文件数
+    segments: Optional[int] = None  # 单文件HTTP下载的分段连接数
+    incremental: Optional[bool] = None  # 目录增量同步：跳过未变化的远端文件
+    max_depth: Optional[int] = None  # HTTP目录递归下载的子目录层数（默认取 HTTP_LISTING_MAX_DEPTH）
+    dedup: Optional[bool] = None  # 使用内容寻址存储跨任务去重（默认取 DOWNLOAD_STORE_ENABLED）
+    extract: Optional[bool] = None  # 边下载边解压/解包压缩文件，只保留解出的文件（默认取 DOWNLOAD_EXTRACT_ARCHIVES）
+    member_pattern: Optional[str] = None  # 解出的压缩包成员文件名通配符（默认取 filename_pattern）
+    convert: Optional[bool] = None  # 文件下载完成后立即转换为 CF-1.8 NetCDF，与剩余文件的下载并行
+    conversion_options: Optional[Dict[str, Any]] = None  # 传给转换任务的 conversion_options
+    variables: Optional[List[str]] = None  # OPeNDAP：只下载这些变量（默认全部数据变量）
+    bbox: Optional[List[float]] = None  # OPeNDAP：经纬度范围 [west, south, east, north]，west > east 表示跨越 180° 经线
+    time_start: Optional[str] = None  # OPeNDAP：时间窗口起点（ISO 8601）
+    time_end: Optional[str] = None  # OPeNDAP：时间窗口终点（ISO 8601）
+    output_filename: Optional[str] = None  # OPeNDAP：输出文件名（默认 <数据集名>_subset.nc）
+    watermark: Optional[bool] = None  # 定时任务：只下载文件名排序在上次成功运行水位线之后的文件（默认开启）
+
 class DownloadTaskBase(BaseModel):
     source_id: int
     save_path: str
@@ -19,13 +37,26 @@ class DownloadTaskBase(BaseModel):
     timeout: int = 300  # seconds
 
 class DownloadTaskCreate(DownloadTaskBase):
-    pass
+    options: Optional[DownloadOptions] = None
+    schedule: Optional[str] = None  # cron 表达式（UTC），如 "0 3 * * *" 或 @hourly；设置后按计划重复运行
 
 class DownloadTaskUpdate(BaseModel):
     status: Optional[TaskStatus] = None
     progress: Optional[float] = None
     error_message: Optional[str] = None
 
+class BatchTaskResult(BaseModel):
+    task_id: int
+    success: bool
+    error: Optional[str] = None
+
+class BatchOperationResponse(BaseModel):
+    """批量操作结果：汇总信息及每个任务的结果"""
+    message: str
+    succeeded: int
+    failed: int
+    results: List[BatchTaskResult]
+
 class DownloadTaskResponse(DownloadTaskBase):
     id: int
     status: TaskStatus
@@ -37,6 +68,8 @@ class DownloadTaskResponse(DownloadTaskBase):
     started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
     task_metadata: Optional[Dict[str, Any]] = None
+    schedule: Optional[str] = None
+    next_run_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """令牌桶限速器（字节/秒），线程安全，可同时用于事件循环和FTP/SFTP工作线程
+
+    允许令牌数透支为负：消费者先记账，再按欠额等待，这样并发消费者按到达顺序公平分摊带宽。
+    rate 为 0 表示不限速。
+    """
+
+    def __init__(self, rate: int = 0):
+        self._lock = threading.Lock()
+        self.rate = 0
+        self.capacity = 0.0
+        self._tokens = 0.0
+        self._updated_at = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate: Optional[int]):
+        """运行时调整速率，已透支的令牌按新速率偿还"""
+        with self._lock:
+            self._refill()
+            self.rate = max(int(rate or 0), 0)
+            self.capacity = self.rate * settings.DOWNLOAD_BANDWIDTH_BURST_SECONDS
+            self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, nbytes: int) -> float:
+        """记账 nbytes 字节，返回调用方需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill()
+            self._tokens -= nbytes
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+
+class RateMeter:
+    """按固定采样间隔计算的指数平滑传输速率（字节/秒）"""
+
+    def __init__(self, interval: float = 1.0, smoothing: float = 0.5):
+        self._lock = threading.Lock()
+        self.interval = interval
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self.total = 0  # 累计字节数
+        self.started_at = time.monotonic()
+        self._pending = 0
+        self._sampled_at = self.started_at
+
+    def add(self, nbytes: int):
+        with self._lock:
+            self.total += nbytes
+            self._pending += nbytes
+            self._sample(time.monotonic())
+
+    def _sample(self, now: float):
+        elapsed = now - self._sampled_at
+        if elapsed < self.interval:
+            return
+        current = self._pending / elapsed
+        self.rate = current if self.rate == 0 else self.smoothing * current + (1 - self.smoothing) * self.rate
+        self._pending = 0
+        self._sampled_at = now
+
+    def current_rate(self) -> float:
+        # 没有新数据时采样值为 0，速率随之衰减，不会一直报告旧速率
+        with self._lock:
+            self._sample(time.monotonic())
+            return self.rate
+
+
+class BandwidthLimiter:
+    """下载带宽整形：全局令牌桶 + 每个数据源的令牌桶
+
+    每个数据块需同时从全局桶和所属数据源的桶中取得令牌；两个桶的速率均可在运行时调整。
+    同时为每个运行中的任务记录当前传输速率，供接口和进度推送展示。
+    """
+
+    def __init__(self):
+        self.global_bucket = TokenBucket(settings.DOWNLOAD_BANDWIDTH_LIMIT)
+        self._source_buckets: Dict[int, TokenBucket] = {}
+        # task_id -> (source_id, 速率计)
+        self._tasks: Dict[int, Tuple[int, RateMeter]] = {}
+        self._lock = threading.Lock()
+
+    def set_global_limit(self, rate: Optional[int]):
+        """设置全局限速（字节/秒），0 或 None 表示不限速"""
+        self.global_bucket.set_rate(rate)
+        logger.info(f"Global download bandwidth limit set to {self.global_bucket.rate} B/s")
+
+    def set_source_limit(self, source_id: int, rate: Optional[int]):
+        """设置数据源限速（字节/秒），0 或 None 表示不限速"""
+        with self._lock:
+            bucket = self._source_buckets.get(source_id)
+            if bucket is None:
+                bucket = self._source_buckets[source_id] = TokenBucket()
+        if bucket.rate != (rate or 0):
+            bucket.set_rate(rate)
+            logger.info(f"Download bandwidth limit for data source {source_id} set to {bucket.rate} B/s")
+
+    def get_source_limit(self, source_id: int) -> int:
+        bucket = self._source_buckets.get(source_id)
+        return bucket.rate if bucket else 0
+
+    def is_limited(self, task_id: int) -> bool:
+        """任务当前是否受全局或数据源限速约束"""
+        entry = self._tasks.get(task_id)
+        return self.global_bucket.rate > 0 or bool(entry and self.get_source_limit(entry[0]) > 0)
+
+    def register_task(self, task_id: int, source_id: int):
+        with self._lock:
+            self._tasks[task_id] = (source_id, RateMeter())
+
+    def unregister_task(self, task_id: int) -> Optional[Tuple[int, float]]:
+        """注销任务，返回其本次运行实际传输的 (字节数, 秒数)"""
+        with self._lock:
+            entry = self._tasks.pop(task_id, None)
+        if entry is None:
+            return None
+        meter = entry[1]
+        return meter.total, time.monotonic() - meter.started_at
+
+    def _reserve(self, task_id: int, nbytes: int) -> float:
+        entry = self._tasks.get(task_id)
+        if entry is None:
+            return self.global_bucket.reserve(nbytes)
+        source_id, meter = entry
+        meter.add(nbytes)
+        delay = self.global_bucket.reserve(nbytes)
+        source_bucket = self._source_buckets.get(source_id)
+        if source_bucket is not None:
+            delay = max(delay, source_bucket.reserve(nbytes))
+        return delay
+
+    async def throttle(self, task_id: int, nbytes: int):
+        """在事件循环中记账一个数据块，超出限速时异步等待"""
+        delay = self._reserve(task_id, nbytes)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def throttle_blocking(self, task_id: int, nbytes: int, stop_event: Optional[threading.Event] = None):
+        """在工作线程中记账一个数据块，超出限速时阻塞等待（stop_event 置位时立即返回）"""
+        delay = self._reserve(task_id, nbytes)
+        if delay > 0:
+            if stop_event is not None:
+                stop_event.wait(delay)
+            else:
+                time.sleep(delay)
+
+    def get_task_rate(self, task_id: int) -> float:
+        """任务当前传输速率（字节/秒）"""
+        entry = self._tasks.get(task_id)
+        return round(entry[1].current_rate(), 1) if entry else 0.0
+
+    def get_status(self) -> Dict:
+        """限速配置及各运行任务的当前速率"""
+        with self._lock:
+            tasks = dict(self._tasks)
+            sources = {source_id: bucket.rate for source_id, bucket in self._source_buckets.items() if bucket.rate > 0}
+        return {
+            "global_limit": self.global_bucket.rate,
+            "source_limits": sources,
+            "task_rates": {
+                task_id: {"source_id": source_id, "rate": round(meter.current_rate(), 1)}
+                for task_id, (source_id, meter) in tasks.items()
+            }
+        }
+
+
+# Global instance
+bandwidth_limiter = BandwidthLimiter()
@@ -124,6 +124,41 @@ class DataConversionService:
             crud_conversion_task.set_status(db, task_id=task_id, status="failed", error_message=str(e))
             return False
 
+    async def run_conversion_in_thread(self, db: Session, task_id: int) -> Optional[int]:
+        """在线程池中执行转换任务并等待完成，返回生成的 NCFile id（失败时返回 None）
+
+        转换器内部是同步的 pandas/xarray 计算，在工作线程自己的事件循环中运行，
+        不会阻塞调用方（如下载流水线）所在的事件循环。
+        """
+        task = crud_conversion_task.get(db, task_id)
+        if not task:
+            logger.error(f"Conversion task {task_id} not found")
+            return None
+
+        loop = asyncio.get_event_loop()
+        validation_result = await loop.run_in_executor(
+            None, validation_service.validate_file_upload, task.original_file_path, task.original_filename
+        )
+        if not validation_result.is_valid:
+            error_msg = "File validation failed: " + "; ".join(
+                [error.message for error in validation_result.validation_errors]
+            )
+            crud_conversion_task.set_status(db, task_id=task_id, status="failed", error_message=error_msg)
+            return None
+
+        crud_conversion_task.set_status(db, task_id=task_id, status="processing")
+        crud_conversion_task.update(db, db_obj=task, obj_in={"started_at": datetime.utcnow()})
+
+        conversion_coroutine = self._run_conversion(task_id, task.original_file_path,
+                                                    task.original_filename, task.original_format,
+                                                    task.conversion_options or {})
+        await loop.run_in_executor(None, asyncio.run, conversion_coroutine)
+
+        # 转换结果由工作线程中的独立会话写入
+        db.expire_all()
+        task = crud_conversion_task.get(db, task_id)
+        return task.nc_file_id if task and task.status == "completed" else None
+
     async def _run_conversion(self, task_id: int, file_path: str, filename: str, 
                             file_format: str, options: Dict[str, Any]):
         """Run the actual conversion process"""
@@ -2,19 +2,41 @@ import asyncio
 import aiohttp
 import aiofiles
 import ftplib
+import glob
+import io
+import os
 import paramiko
 import re
+import socket
+import stat
+import threading
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Optional, Callable, Dict, Any, List
-from urllib.parse import urlparse, urljoin
+from typing import Optional, Callable, Dict, Any, List, Set, Tuple
+from urllib.parse import urlparse
 from sqlalchemy.orm import Session
-from bs4 import BeautifulSoup
 import logging
+from datetime import datetime
 
 from app.crud.crud_download_task import download_task as crud_download_task
 from app.crud.crud_data_source import data_source as crud_data_source
 from app.core.config import settings
 from app.db.session import SessionLocal
+from app.services.progress_aggregator import ProgressAggregator
+from app.services.http_client_pool import http_client_pool
+from app.services.ftp_pool import ftp_pool
+from app.services.sftp_pool import sftp_pool
+from app.services.bandwidth_limiter import bandwidth_limiter
+from app.services.throughput_tracker import throughput_tracker
+from app.services.download_store import download_store
+from app.services.http_directory_crawler import http_directory_crawler
+from app.services.download_conversion_pipeline import DownloadConversionPipeline
+from app.services.opendap_subset import opendap_subsetter, SubsetRequest
+from app.utils.checksum import (
+    SIDECAR_ALGORITHMS, ChecksumMismatchError, new_hasher, update_from_file, hash_file, parse_sidecar
+)
+from app.utils.retry import RetryPolicy, HttpStatusError, RemoteFileChangedError, parse_retry_after
+from app.utils.archive_stream import StreamExtractor, detect_archive
 
 logger = logging.getLogger(__name__)
 
@@ -23,9 +45,187 @@ def get_websocket_manager():
     from app.services.websocket_manager import websocket_manager
     return websocket_manager
 
+# HTTP 流式解包时攒够该字节数再交给线程池解压写盘
+EXTRACT_BATCH_SIZE = 1024 * 1024
+# 可以取消的任务状态
+CANCELLABLE_STATUSES = ("pending", "running", "paused", "failed")
+
+
+class _ExtractingWriter:
+    """接口与 aiofiles 文件对象一致的写入器：数据块在线程池中交给 StreamExtractor 解压/解包"""
+
+    def __init__(self, extractor: StreamExtractor):
+        self.extractor = extractor
+        self.buffer = bytearray()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            await self.flush()
+
+    async def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= EXTRACT_BATCH_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self.buffer:
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            await asyncio.get_event_loop().run_in_executor(None, self.extractor.feed, data)
+
+
+class _DirectoryProgress:
+    """目录下载的总体进度：有预检得到的文件大小时按字节加权，否则各文件权重相同；可在工作线程中调用"""
+
+    def __init__(self, names: List[str], sizes: Optional[Dict[str, Optional[int]]] = None):
+        sizes = sizes or {}
+        known = [sizes[name] for name in names if sizes.get(name)]
+        # 预检未取到大小的文件按已知文件的平均大小计
+        default = sum(known) / len(known) if known else 1.0
+        self.weights = {name: float(sizes.get(name) or default) for name in names}
+        self.total = sum(self.weights.values()) or 1.0
+        self._done = 0.0
+        self._fractions: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def report(self, name: str, fraction: float) -> float:
+        """更新单个文件的完成比例，返回总体进度百分比"""
+        with self._lock:
+            self._done += (fraction - self._fractions.get(name, 0.0)) * self.weights.get(name, 0.0)
+            self._fractions[name] = fraction
+            return min(self._done / self.total * 100, 100.0)
+
+
 class DownloadService:
     def __init__(self):
         self.active_downloads: Dict[int, asyncio.Task] = {}
+        # 每个主机的连接数限制，在所有任务间共享
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        # 请求暂停（而非取消）的任务，取消信号到达时据此写入 paused 状态
+        self._pause_requested: Set[int] = set()
+        # 应用关闭时中断的任务，写回 pending 以便重启后重新排队续传
+        self._suspend_requested: Set[int] = set()
+        # 开启 options.convert 的任务对应的下载-转换流水线
+        self._conversion_pipelines: Dict[int, DownloadConversionPipeline] = {}
+        # 任务结束（完成/失败/取消/暂停）时调用的回调 callback(task_id, status)
+        self._finish_listeners: List[Callable[[int, str], None]] = []
+        # 运行中任务的租约持有者标识；多个副本共享数据库时据此区分各进程的任务
+        self.worker_id = settings.DOWNLOAD_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+        # 租约已被其他进程接管（或任务在其他副本被暂停/取消）的任务：停止下载但不再写入状态
+        self._abandon_requested: Set[int] = set()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+    
+    def add_finish_listener(self, listener: Callable[[int, str], None]):
+        """登记任务结束回调（在事件循环中同步调用，不应阻塞），调度器据此立即填补空出的并发槽位"""
+        self._finish_listeners.append(listener)
+    
+    def _notify_finished(self, task_id: int, status: str):
+        for listener in self._finish_listeners:
+            try:
+                listener(task_id, status)
+            except Exception as e:
+                logger.error(f"Download finish listener failed for task {task_id}: {e}")
+    
+    def _get_task_option(self, task, key: str, default: Any = None) -> Any:
+        """读取 task_metadata['options'] 中的下载参数"""
+        options = (task.task_metadata or {}).get('options') or {}
+        value = options.get(key)
+        return default if value is None else value
+    
+    def is_startable(self, task) -> bool:
+        """任务当前状态是否允许启动（增量同步任务完成后可再次运行以同步新文件）"""
+        if task.status in ("pending", "paused", "failed"):
+            return True
+        return task.status == "completed" and bool(self._get_task_option(task, 'incremental', False))
+    
+    def _get_save_path(self, task) -> Path:
+        """获取任务保存目录（确保使用相对路径，避免权限问题）"""
+        if task.save_path.startswith('/'):
+            return Path('.' + task.save_path)
+        return Path(task.save_path)
+    
+    def _part_path(self, filepath: Path) -> Path:
+        """未完成下载的临时文件路径"""
+        return filepath.with_name(filepath.name + '.part')
+    
+    def _discard_partial_files(self, save_path: Path, resume_state: Dict[str, Any]):
+        """删除取消任务遗留的 .part 文件"""
+        for entry in resume_state.values():
+            if entry.get('completed') or not entry.get('filename'):
+                continue
+            try:
+                # 递归目录下载的文件位于子目录中
+                for part_path in save_path.rglob(glob.escape(entry['filename'] + '.part')):
+                    part_path.unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Failed to remove partial file for {entry['filename']}: {e}")
+    
+    def _has_resumable_part(self, progress: ProgressAggregator, remote_path: str, file_size: int) -> bool:
+        """FTP/SFTP：上次运行（暂停或进程重启前）登记过该文件的 .part 且远端大小未变时，首次尝试即续传"""
+        entry = (progress.metadata.get('resume') or {}).get(remote_path)
+        return bool(entry and file_size and not entry.get('completed') and entry.get('size') == file_size)
+    
+    def _is_unchanged(self, manifest_entry: Optional[Dict[str, Any]], filepath: Path, **remote) -> bool:
+        """增量同步：本地文件（或从压缩包解出的文件）存在且清单中的大小/修改时间与远端一致时视为未变化"""
+        if not manifest_entry:
+            return False
+        if manifest_entry.get('extracted') is not None:
+            if not all(Path(path).exists() for path in manifest_entry['extracted']):
+                return False
+        elif not filepath.exists() or filepath.stat().st_size != manifest_entry.get('size'):
+            return False
+        return all(
+            value is not None and manifest_entry.get(key) == value
+            for key, value in remote.items()
+        )
+    
+    def _extracts(self, task, filepath: Path) -> bool:
+        """任务开启解压（options.extract，默认取 DOWNLOAD_EXTRACT_ARCHIVES）且文件是压缩包"""
+        return bool(self._get_task_option(task, 'extract', settings.DOWNLOAD_EXTRACT_ARCHIVES)) and (
+            detect_archive(filepath.name) is not None
+        )
+    
+    def _create_extractor(self, task, filepath: Path) -> Optional[StreamExtractor]:
+        """为需要解压的文件创建流式解包器，成员解出到压缩包所在目录，压缩包本身不落盘
+
+        tar/zip 成员按 options.member_pattern 筛选；未设置时使用任务的 filename_pattern，
+        但该模式匹配压缩包本身时视为用于选择压缩包，不再筛选成员。
+        """
+        if not self._extracts(task, filepath):
+            return None
+        member_regex = None
+        if detect_archive(filepath.name)[0] != 'file':
+            member_pattern = self._get_task_option(task, 'member_pattern')
+            if member_pattern:
+                member_regex = re.compile(self._get_file_pattern(member_pattern), re.IGNORECASE)
+            else:
+                task_regex = re.compile(self._get_file_pattern(task.filename_pattern), re.IGNORECASE)
+                if not task_regex.match(filepath.name):
+                    member_regex = task_regex
+        member_filter = (lambda name: bool(member_regex.match(name))) if member_regex else None
+        return StreamExtractor(filepath.name, filepath.parent, member_filter)
+    
+    def _record_extracted(self, progress: ProgressAggregator, filepath: Path, extractor: StreamExtractor):
+        """记录从压缩包解出的文件（task_metadata['extracted']），可在工作线程中调用"""
+        progress.set_metadata_item('extracted', str(filepath), [str(path) for path in extractor.outputs])
+        logger.info(
+            f"Extracted {len(extractor.outputs)} files from {filepath.name} "
+            f"({extractor.skipped_members} members skipped)"
+        )
+    
+    def _extracted_files(self, progress: ProgressAggregator, filepath: Path) -> Optional[List[str]]:
+        """压缩包解出的文件路径；文件未解压时返回 None"""
+        return (progress.metadata.get('extracted') or {}).get(str(filepath))
+    
+    def _get_host_semaphore(self, host: Optional[str]) -> asyncio.Semaphore:
+        """获取主机级并发信号量"""
+        key = host or ''
+        if key not in self._host_semaphores:
+            self._host_semaphores[key] = asyncio.Semaphore(settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST)
+        return self._host_semaphores[key]
     
     def _is_directory_url(self, url: str) -> bool:
         """判断URL是否为目录（不以文件扩展名结尾）"""
@@ -44,39 +244,27 @@ class DownloadService:
         pattern = pattern.replace('?', '.')
         return f'^{pattern}$'
     
-    async def _extract_files_from_directory(self, session: aiohttp.ClientSession, url: str, pattern: str) -> List[str]:
-        """从目录页面提取符合模式的文件链接"""
-        try:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to access directory: HTTP {response.status}")
-                
-                html_content = await response.text()
-                soup = BeautifulSoup(html_content, 'html.parser')
-                
-                file_links = []
-                regex_pattern = re.compile(pattern, re.IGNORECASE)
-                
-                # 查找所有链接
-                for link in soup.find_all('a', href=True):
-                    href = link['href']
-                    filename = href.split('/')[-1]
-                    
-                    # 匹配文件名模式
-                    if regex_pattern.match(filename):
-                        # 构建完整URL
-                        if href.startswith('http'):
-                            file_url = href
-                        else:
-                            file_url = urljoin(url, href)
-                        file_links.append(file_url)
-                
-                return file_links
-                
-        except Exception as e:
-            logger.error(f"Failed to extract files from directory {url}: {e}")
-            raise
-
+    def _listing_depth(self, task) -> int:
+        """HTTP 目录递归下载的子目录层数"""
+        return max(0, int(self._get_task_option(task, 'max_depth', settings.HTTP_LISTING_MAX_DEPTH)))
+    
+    def _directory_progress(self, task, progress: ProgressAggregator, names: List[str]) -> _DirectoryProgress:
+        """构建目录下载的总体进度计算器；预检得到的总大小同时作为任务总字节数"""
+        preflight = (task.task_metadata or {}).get('preflight') or {}
+        if preflight.get('total_size'):
+            progress.set_total_size(preflight['total_size'])
+        return _DirectoryProgress(names, preflight.get('files'))
+    
+    def _relative_download_path(self, root_url: str, file_url: str) -> str:
+        """目录中的文件相对于根目录的保存路径（递归下载时保留子目录结构）"""
+        root = urlparse(root_url if root_url.endswith('/') else root_url + '/')
+        parsed = urlparse(file_url)
+        if parsed.netloc == root.netloc and parsed.path.startswith(root.path):
+            relative = parsed.path[len(root.path):]
+            if relative and '..' not in relative.split('/'):
+                return relative
+        return Path(parsed.path).name
+    
     async def start_download(self, db: Session, task_id: int) -> bool:
         """Start a download task"""
         try:
@@ -91,14 +279,19 @@ class DownloadService:
                 logger.error(f"Data source {task.source_id} not found")
                 return False
 
-            # Update task status to running
-            crud_download_task.set_status(db, task_id=task_id, status="running")
+            # Update task status to running（同时写入本进程的租约；任务正在其他副本上运行时不启动）
+            if not crud_download_task.acquire_lease(
+                db, task_id=task_id, worker_id=self.worker_id, lease_seconds=settings.DOWNLOAD_LEASE_SECONDS
+            ):
+                logger.warning(f"Task {task_id} is already running on another worker")
+                return False
             
             # Create download task based on protocol
             download_task_coroutine = self._create_download_task(db, task, data_source)
             
             # Store the task for potential cancellation
             self.active_downloads[task_id] = asyncio.create_task(download_task_coroutine)
+            self._ensure_heartbeat()
             
             return True
             
@@ -108,16 +301,131 @@ class DownloadService:
             return False
 
     async def pause_download(self, db: Session, task_id: int) -> bool:
-        """Pause a download task"""
+        """Pause a download task (partial files are kept for byte-range resume)"""
         if task_id in self.active_downloads:
+            self._pause_requested.add(task_id)
             self.active_downloads[task_id].cancel()
             del self.active_downloads[task_id]
             crud_download_task.set_status(db, task_id=task_id, status="paused")
             return True
+        task = crud_download_task.get(db, task_id)
+        if task and task.status == "running" and task.worker_id and task.worker_id != self.worker_id:
+            # 任务在其他副本上运行：改为 paused 后，持有者在下次续约时发现并停止下载（保留续传偏移量）
+            crud_download_task.set_status(db, task_id=task_id, status="paused")
+            return True
         return False
 
+    async def pause_downloads(self, db: Session, task_ids: List[int]) -> Dict[int, Optional[str]]:
+        """批量暂停运行中或排队中的任务，返回 {task_id: 失败原因或 None}
+
+        一次查询校验状态，一条 UPDATE 写入 paused（只修改仍处于 running/pending 的行）；本进程运行的下载随后取消，
+        保留 .part 文件和续传偏移量，其他副本上运行的任务由持有者在下次续约时停止。
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        tasks = {task.id: task for task in crud_download_task.get_by_ids(db, ids=task_ids)}
+        results: Dict[int, Optional[str]] = {}
+        pausable = []
+        for task_id in task_ids:
+            task = tasks.get(task_id)
+            if task is None:
+                results[task_id] = "not found"
+            elif task.status not in ("running", "pending"):
+                results[task_id] = f"invalid status {task.status}"
+            else:
+                pausable.append(task_id)
+                results[task_id] = None
+        crud_download_task.set_status_bulk(db, ids=pausable, status="paused", from_statuses=["running", "pending"])
+        for task_id in pausable:
+            download = self.active_downloads.pop(task_id, None)
+            if download is not None:
+                self._pause_requested.add(task_id)
+                download.cancel()
+        return results
+
+    async def cancel_downloads(self, db: Session, task_ids: List[int]) -> Dict[int, Optional[str]]:
+        """批量取消任务，返回 {task_id: 失败原因或 None}
+
+        一次查询校验状态，按是否在运行分两条 UPDATE 写入 cancelled（只修改仍处于原状态的行）；本进程运行的下载随后取消，
+        由下载协程清理分片文件，其他副本上运行的任务由持有者在下次续约时停止。未在运行的任务在确认已取消后
+        删除遗留的分片文件，并只从 task_metadata 中移除 resume 键。
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        tasks = {task.id: task for task in crud_download_task.get_by_ids(db, ids=task_ids)}
+        results: Dict[int, Optional[str]] = {}
+        cancellable, idle = [], []
+        for task_id in task_ids:
+            task = tasks.get(task_id)
+            if task is None:
+                results[task_id] = "not found"
+            elif task.status not in CANCELLABLE_STATUSES:
+                results[task_id] = f"invalid status {task.status}"
+            else:
+                cancellable.append(task_id)
+                if task.status != "running" and task_id not in self.active_downloads:
+                    idle.append(task_id)
+                results[task_id] = None
+        # 未运行的任务只在仍未运行时取消，之后才能安全地删除其分片文件
+        idle_statuses = [status for status in CANCELLABLE_STATUSES if status != "running"]
+        crud_download_task.set_status_bulk(db, ids=idle, status="cancelled", from_statuses=idle_statuses)
+        crud_download_task.set_status_bulk(
+            db, ids=[task_id for task_id in cancellable if task_id not in idle], status="cancelled",
+            from_statuses=list(CANCELLABLE_STATUSES)
+        )
+        for task_id in cancellable:
+            download = self.active_downloads.pop(task_id, None)
+            if download is not None:
+                download.cancel()
+
+        # 重新读取：校验之后被启动的任务保持 running，不能删除它正在写入的分片文件
+        db.expire_all()
+        for task in crud_download_task.get_by_ids(db, ids=idle):
+            resume_state = (task.task_metadata or {}).get('resume')
+            if task.status == "cancelled" and resume_state:
+                self._discard_partial_files(self._get_save_path(task), resume_state)
+                crud_download_task.update_metadata(db, task_id=task.id, metadata={"resume": None})
+        return results
+
+    def _ensure_heartbeat(self):
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def _heartbeat_loop(self):
+        """有下载运行期间定期为其续约；发现租约已丢失的任务时停止本地下载，避免两个进程写同一任务"""
+        while self.active_downloads:
+            await asyncio.sleep(settings.DOWNLOAD_HEARTBEAT_INTERVAL)
+            task_ids = list(self.active_downloads)
+            if not task_ids:
+                break
+            db = SessionLocal()
+            try:
+                held = set(crud_download_task.renew_leases(
+                    db, ids=task_ids, worker_id=self.worker_id, lease_seconds=settings.DOWNLOAD_LEASE_SECONDS
+                ))
+            except Exception as e:
+                logger.warning(f"Failed to renew download leases: {e}")
+                continue
+            finally:
+                db.close()
+            for task_id in task_ids:
+                download = self.active_downloads.get(task_id)
+                if task_id not in held and download is not None:
+                    logger.warning(f"Lease on download task {task_id} was lost, stopping the local download")
+                    self._abandon_requested.add(task_id)
+                    download.cancel()
+
+    async def suspend_all(self, timeout: float = 10.0):
+        """应用关闭时中断所有进行中的下载：写入最终进度和续传偏移量后把任务写回 pending"""
+        tasks = dict(self.active_downloads)
+        if not tasks:
+            return
+        self._suspend_requested.update(tasks)
+        for download in tasks.values():
+            download.cancel()
+        await asyncio.wait(list(tasks.values()), timeout=timeout)
+        logger.info(f"Suspended {len(tasks)} running downloads for shutdown")
+
     async def resume_download(self, db: Session, task_id: int) -> bool:
-        """Resume a paused download task"""
+        """Resume a paused download task from the offsets recorded in task_metadata['resume']"""
         return await self.start_download(db, task_id)
 
     async def cancel_download(self, db: Session, task_id: int) -> bool:
@@ -125,47 +433,272 @@ class DownloadService:
         if task_id in self.active_downloads:
             self.active_downloads[task_id].cancel()
             del self.active_downloads[task_id]
+        else:
+            # 已暂停/失败的任务不再续传，清理遗留的分片文件
+            task = crud_download_task.get(db, task_id)
+            if task and task.task_metadata and task.task_metadata.get('resume'):
+                self._discard_partial_files(self._get_save_path(task), task.task_metadata['resume'])
+                crud_download_task.update_metadata(db, task_id=task_id, metadata={"resume": None})
         crud_download_task.set_status(db, task_id=task_id, status="cancelled")
         return True
 
+    async def preflight(self, db: Session, task_id: int) -> Optional[int]:
+        """预检：并发获取待下载文件的大小（HTTP HEAD / FTP MLSD 或 SIZE / SFTP stat）
+
+        估算的总字节数写入 DownloadTask.file_size，各文件大小记录在 task_metadata['preflight']，
+        目录下载据此按字节计算总体进度，调度器据此判断磁盘空间是否足够。无法获得大小时返回 None。
+        """
+        task = crud_download_task.get(db, task_id)
+        data_source = crud_data_source.get(db, task.source_id) if task else None
+        if not task or not data_source:
+            return None
+
+        protocol = data_source.protocol.upper()
+        if protocol == "HTTP" or protocol == "HTTPS":
+            sizes = await self._preflight_http(task, data_source)
+        elif protocol == "FTP":
+            sizes = await self._preflight_ftp(task, data_source)
+        elif protocol == "SFTP":
+            sizes = await self._preflight_sftp(task, data_source)
+        else:
+            # OPeNDAP 裁剪结果的大小在规划切片时才能确定
+            return None
+
+        known = [size for size in sizes.values() if size]
+        if not known:
+            return None
+        # 未取到大小的文件按平均大小估算
+        total_size = sum(known) + (len(sizes) - len(known)) * (sum(known) // len(known))
+        metadata = dict(task.task_metadata or {})
+        metadata['preflight'] = {
+            'total_size': total_size,
+            'files': sizes,
+            'unknown_files': len(sizes) - len(known),
+            'sized_at': datetime.utcnow().isoformat()
+        }
+        crud_download_task.update(db, db_obj=task, obj_in={"file_size": total_size, "task_metadata": metadata})
+        logger.info(f"Pre-flight sized task {task_id}: {len(sizes)} files, {total_size} bytes")
+        return total_size
+
+    async def _preflight_http(self, task, data_source) -> Dict[str, Optional[int]]:
+        session = await http_client_pool.get_session(data_source)
+        timeout = http_client_pool.request_timeout(task.timeout)
+        url = data_source.url
+        if not self._is_directory_url(url):
+            file_size, _, _ = await self._probe_http_file(session, url, timeout=timeout)
+            return {Path(urlparse(url).path).name or "downloaded_file": file_size or None}
+
+        # 目录列表进入缓存，随后的下载直接复用
+        file_urls = await RetryPolicy.for_task(task).run(
+            lambda attempt: http_directory_crawler.list_files(
+                session, task.source_id, url, self._get_file_pattern(task.filename_pattern),
+                max_depth=self._listing_depth(task), timeout=timeout
+            ),
+            f"listing of {url}"
+        )
+        semaphore = asyncio.Semaphore(max(1, settings.DOWNLOAD_PREFLIGHT_CONCURRENCY))
+
+        async def size_one(file_url: str) -> Tuple[str, Optional[int]]:
+            async with semaphore:
+                file_size, _, _ = await self._probe_http_file(session, file_url, timeout=timeout)
+            return self._relative_download_path(url, file_url), file_size or None
+
+        return dict(await asyncio.gather(*(size_one(file_url) for file_url in file_urls)))
+
+    async def _preflight_ftp(self, task, data_source) -> Dict[str, Optional[int]]:
+        parsed_url = urlparse(data_source.url)
+        loop = asyncio.get_event_loop()
+        if not self._is_directory_url(data_source.url):
+            def size_file():
+                with ftp_pool.connection(data_source, parsed_url) as ftp:
+                    return self._ftp_size(ftp, parsed_url.path)
+            return {Path(parsed_url.path).name: await loop.run_in_executor(None, size_file)}
+
+        remote_dir = parsed_url.path or '/'
+        regex_pattern = re.compile(self._get_file_pattern(task.filename_pattern), re.IGNORECASE)
+
+        def list_sizes() -> Dict[str, Optional[int]]:
+            with ftp_pool.connection(data_source, parsed_url) as ftp:
+                try:
+                    # MLSD 一次返回所有条目的类型和大小
+                    return {
+                        name: int(facts['size']) if facts.get('size') else None
+                        for name, facts in ftp.mlsd(remote_dir, facts=['type', 'size'])
+                        if facts.get('type') == 'file' and regex_pattern.match(name)
+                    }
+                except ftplib.error_perm:
+                    ftp.cwd(remote_dir)
+                    return {name: None for name in ftp.nlst() if regex_pattern.match(name)}
+
+        sizes = await loop.run_in_executor(None, list_sizes)
+        unknown = [name for name, size in sizes.items() if size is None]
+        if unknown:
+            # 服务器不支持 MLSD 时，在连接池的多个连接上并发发送 SIZE
+            workers = max(1, min(
+                settings.FTP_POOL_MAX_CONNECTIONS_PER_SOURCE, settings.DOWNLOAD_PREFLIGHT_CONCURRENCY, len(unknown)
+            ))
+
+            def size_batch(names: List[str]) -> Dict[str, Optional[int]]:
+                with ftp_pool.connection(data_source, parsed_url) as ftp:
+                    return {name: self._ftp_size(ftp, f"{remote_dir.rstrip('/')}/{name}") for name in names}
+
+            for result in await asyncio.gather(*(
+                loop.run_in_executor(None, size_batch, unknown[i::workers]) for i in range(workers)
+            )):
+                sizes.update(result)
+        return sizes
+
+    async def _preflight_sftp(self, task, data_source) -> Dict[str, Optional[int]]:
+        parsed_url = urlparse(data_source.url)
+        remote_path = parsed_url.path or '/'
+        directory = self._is_directory_url(data_source.url)
+        regex_pattern = re.compile(self._get_file_pattern(task.filename_pattern), re.IGNORECASE)
+
+        def list_sizes() -> Dict[str, Optional[int]]:
+            sftp = sftp_pool.open_sftp(data_source, parsed_url)
+            try:
+                if not directory:
+                    return {Path(remote_path).name: sftp.stat(remote_path).st_size or None}
+                # listdir_attr 一次返回所有条目的大小
+                return {
+                    attr.filename: attr.st_size or None
+                    for attr in sftp.listdir_attr(remote_path)
+                    if not stat.S_ISDIR(attr.st_mode or 0) and regex_pattern.match(attr.filename)
+                }
+            finally:
+                sftp.close()
+
+        return await asyncio.get_event_loop().run_in_executor(None, list_sizes)
+
     async def _create_download_task(self, db: Session, task, data_source):
         """Create appropriate download task based on protocol"""
         # Create a new database session for the long-running download task
         async_db = SessionLocal()
+        # 进度聚合器：按时间/进度阈值合并写库，取消或失败时也会写入最终状态
+        task_metadata = task.task_metadata or {}
+        progress = ProgressAggregator(
+            async_db, task.id, self._send_progress_update,
+            metadata={
+                "resume": dict(task_metadata.get('resume') or {}),
+                "manifest": dict(task_metadata.get('manifest') or {}),
+                "checksums": dict(task_metadata.get('checksums') or {}),
+                "conversions": dict(task_metadata.get('conversions') or {}),
+                "nc_file_ids": list(task_metadata.get('nc_file_ids') or []),
+                "extracted": dict(task_metadata.get('extracted') or {}),
+                "high_water_mark": task_metadata.get('high_water_mark')
+            }
+        )
+        # 边下载边转换：完成的文件进入有界队列，任务在全部转换结束后才标记为完成
+        if self._get_task_option(task, 'convert', False):
+            pipeline = DownloadConversionPipeline(
+                task.id, progress, conversion_options=self._get_task_option(task, 'conversion_options')
+            )
+            pipeline.start()
+            self._conversion_pipelines[task.id] = pipeline
+            progress.add_completion_hook(pipeline.drain)
+        # 同步数据源限速配置并登记任务，数据块循环据此限速和统计当前速率
+        bandwidth_limiter.set_source_limit(data_source.id, data_source.bandwidth_limit)
+        bandwidth_limiter.register_task(task.id, data_source.id)
         try:
             protocol = data_source.protocol.upper()
             
             if protocol == "HTTP" or protocol == "HTTPS":
-                await self._download_http(async_db, task, data_source)
+                await self._download_http(async_db, task, data_source, progress)
             elif protocol == "FTP":
-                await self._download_ftp(async_db, task, data_source)
+                await self._download_ftp(async_db, task, data_source, progress)
             elif protocol == "SFTP":
-                await self._download_sftp(async_db, task, data_source)
+                await self._download_sftp(async_db, task, data_source, progress)
+            elif protocol == "OPENDAP":
+                await self._download_opendap(async_db, task, data_source, progress)
             else:
                 raise ValueError(f"Unsupported protocol: {protocol}")
                 
         except asyncio.CancelledError:
-            logger.info(f"Download task {task.id} was cancelled")
-            crud_download_task.set_status(async_db, task_id=task.id, status="cancelled")
+            if task.id in self._abandon_requested:
+                # 任务已由其他进程接管或在其他副本上被暂停/取消，状态以数据库为准
+                self._abandon_requested.discard(task.id)
+                logger.info(f"Download task {task.id} stopped after losing its lease")
+            elif task.id in self._pause_requested:
+                # 暂停：保留 .part 文件和续传偏移量
+                self._pause_requested.discard(task.id)
+                logger.info(f"Download task {task.id} was paused")
+                await progress.finish(status="paused")
+            elif task.id in self._suspend_requested:
+                # 应用关闭：保留 .part 文件和续传偏移量，任务回到队列
+                self._suspend_requested.discard(task.id)
+                logger.info(f"Download task {task.id} was interrupted by shutdown and will resume after restart")
+                if not (task.task_metadata or {}).get('queued_at'):
+                    progress.set_metadata('queued_at', datetime.utcnow().isoformat())
+                await progress.finish(status="pending")
+            else:
+                logger.info(f"Download task {task.id} was cancelled")
+                self._discard_partial_files(self._get_save_path(task), progress.metadata.get('resume') or {})
+                progress.set_metadata('resume', None)
+                await progress.finish(status="cancelled")
         except Exception as e:
             logger.error(f"Download task {task.id} failed: {e}")
-            crud_download_task.set_status(async_db, task_id=task.id, status="failed", error_message=str(e))
+            await progress.finish(status="failed", error_message=str(e))
         finally:
+            transfer = bandwidth_limiter.unregister_task(task.id)
+            if transfer and progress.status:
+                self._record_throughput(async_db, task, *transfer)
+            pipeline = self._conversion_pipelines.pop(task.id, None)
+            if pipeline is not None:
+                await pipeline.close()
             # Clean up database session
             async_db.close()
-            # Clean up active downloads
-            if task.id in self.active_downloads:
+            # Clean up active downloads（任务可能已被暂停后重新启动，只移除本协程自己的登记）
+            if self.active_downloads.get(task.id) is asyncio.current_task():
                 del self.active_downloads[task.id]
+            self._notify_finished(task.id, progress.status or "failed")
+
+    def _after_high_water_mark(self, task, progress: ProgressAggregator, items: List[Any],
+                               key: Callable[[Any], str], failed: List[str]) -> List[Any]:
+        """定时任务：只保留名称（相对路径）按字典序排在上次运行水位线之后的文件
 
-    async def _download_http(self, db: Session, task, data_source):
+        适用于按日期/时间命名的逐日、逐时数据文件。水位线在本次运行成功完成时才推进，
+        失败、暂停或取消的运行不推进，下次运行会重新获取这些文件。
+        failed 由调用方在单个文件下载失败时追加其名称：目录运行中个别文件失败时任务仍为 completed，
+        水位线只推进到最小的失败名称之前，失败的文件在下次运行中重新获取。
+        """
+        if not task.schedule or not self._get_task_option(task, 'watermark', True):
+            return items
+        mark = progress.metadata.get('high_water_mark')
+        selected = [item for item in items if mark is None or key(item) > mark]
+        if selected:
+            names = [key(item) for item in selected]
+
+            async def advance_high_water_mark():
+                lowest_failed = min(failed) if failed else None
+                succeeded = [name for name in names if lowest_failed is None or name < lowest_failed]
+                if succeeded:
+                    progress.set_metadata('high_water_mark', max(succeeded))
+
+            progress.add_completion_hook(advance_high_water_mark)
+        logger.info(f"Task {task.id}: {len(selected)} of {len(items)} files are newer than high-water mark {mark!r}")
+        return selected
+
+    async def _finish_up_to_date(self, task, progress: ProgressAggregator):
+        """定时任务本次运行没有新文件"""
+        logger.info(f"Scheduled task {task.id} has no new files since the last run")
+        progress.set_metadata('resume', None)
+        await progress.finish(status="completed", files_downloaded=0, total_files=0)
+
+    def _record_throughput(self, db: Session, task, nbytes: int, seconds: float):
+        """把本次运行的吞吐计入数据源历史，并写入 task_metadata['throughput'] 供重启后和其他副本恢复"""
+        if not throughput_tracker.record(task.source_id, nbytes, seconds):
+            return
+        try:
+            crud_download_task.update_metadata(db, task_id=task.id, metadata={
+                "throughput": {"bytes": nbytes, "seconds": round(seconds, 3), "recorded_at": datetime.utcnow().isoformat()}
+            })
+        except Exception as e:
+            logger.warning(f"Failed to persist throughput of task {task.id}: {e}")
+
+    async def _download_http(self, db: Session, task, data_source, progress: ProgressAggregator):
         """Download file(s) using HTTP/HTTPS - supports both single files and directories"""
         url = data_source.url
-        
-        # 确保使用相对路径，避免权限问题
-        if task.save_path.startswith('/'):
-            save_path = Path('.' + task.save_path)
-        else:
-            save_path = Path(task.save_path)
+        save_path = self._get_save_path(task)
             
         # 创建目录
         try:
@@ -174,576 +707,1481 @@ class DownloadService:
             logger.error(f"Permission denied creating directory {save_path}: {e}")
             raise Exception(f"无法创建下载目录: {save_path}，请检查权限")
 
-        async with aiohttp.ClientSession() as session:
-            # 判断是目录还是单文件
-            if self._is_directory_url(url):
-                await self._download_directory(db, session, task, url, save_path)
-            else:
-                await self._download_single_file(db, session, task, url, save_path)
+        # 使用按数据源共享的连接池会话（复用 keep-alive 连接和 DNS 缓存）
+        session = await http_client_pool.get_session(data_source)
+        
+        # 判断是目录还是单文件
+        if self._is_directory_url(url):
+            await self._download_directory(db, session, task, url, save_path, progress)
+        else:
+            await self._download_single_file(db, session, task, url, save_path, progress)
 
-    async def _download_single_file(self, db: Session, session: aiohttp.ClientSession, task, url: str, save_path: Path):
+    async def _download_single_file(self, db: Session, session: aiohttp.ClientSession, task, url: str, save_path: Path,
+                                    progress: ProgressAggregator):
         """下载单个文件"""
         parsed_url = urlparse(url)
         filename = Path(parsed_url.path).name or "downloaded_file"
         filepath = save_path / filename
 
-        async with session.get(url) as response:
-            if response.status != 200:
-                raise Exception(f"HTTP {response.status}: {response.reason}")
-            
-            total_size = int(response.headers.get('content-length', 0))
-            if total_size > 0:
-                fresh_task = crud_download_task.get(db, task.id)
-                if fresh_task:
-                    crud_download_task.update(db, db_obj=fresh_task, obj_in={"file_size": total_size})
-
-            downloaded_size = 0
-            
-            async with aiofiles.open(filepath, 'wb') as f:
-                async for chunk in response.content.iter_chunked(8192):
-                    await f.write(chunk)
-                    downloaded_size += len(chunk)
-                    
-                    # Update progress
-                    if total_size > 0:
-                        progress = (downloaded_size / total_size) * 100
-                        crud_download_task.update_progress(
-                            db, task_id=task.id, progress=progress, downloaded_size=downloaded_size
-                        )
-                        
-                        # Send WebSocket progress update
-                        await self._send_progress_update(task.id, {
-                            "progress": progress,
-                            "downloaded_size": downloaded_size,
-                            "total_size": total_size,
-                            "status": "running",
-                            "current_file": filename
-                        })
+        progress.update(current_file=filename)
+        await self._fetch_http_file_with_retry(
+            db, session, task, url, filepath, progress,
+            on_chunk=lambda downloaded_size, total_size: progress.set_total_size(total_size),
+            segments=int(self._get_task_option(task, 'segments', settings.DOWNLOAD_SEGMENTS))
+        )
+        await self._submit_for_conversion(task.id, filepath, filename)
 
         # Mark as completed
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
-        
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": downloaded_size,
-            "total_size": total_size,
-            "status": "completed",
-            "files_downloaded": 1
-        })
+        progress.set_metadata('resume', None)
+        await progress.finish(status="completed", files_downloaded=1)
 
-    async def _download_directory(self, db: Session, session: aiohttp.ClientSession, task, url: str, save_path: Path):
+    async def _download_directory(self, db: Session, session: aiohttp.ClientSession, task, url: str, save_path: Path,
+                                  progress: ProgressAggregator):
         """下载目录中所有符合模式的文件"""
         pattern = self._get_file_pattern(task.filename_pattern)
         
         # 获取目录中的文件列表
-        file_urls = await self._extract_files_from_directory(session, url, pattern)
+        listed_names: Set[str] = set()
+        file_urls = await RetryPolicy.for_task(task).run(
+            lambda attempt: http_directory_crawler.list_files(
+                session, task.source_id, url, pattern,
+                max_depth=self._listing_depth(task),
+                timeout=http_client_pool.request_timeout(task.timeout),
+                all_names=listed_names
+            ),
+            f"listing of {url}"
+        )
         
         if not file_urls:
             raise Exception(f"在目录 {url} 中未找到符合模式 '{task.filename_pattern}' 的文件")
         
+        failed_files: List[str] = []
+        file_urls = self._after_high_water_mark(
+            task, progress, file_urls, lambda file_url: self._relative_download_path(url, file_url), failed_files
+        )
+        if not file_urls:
+            await self._finish_up_to_date(task, progress)
+            return
+        
         logger.info(f"Found {len(file_urls)} files to download from directory {url}")
         
         total_files = len(file_urls)
         downloaded_files = 0
-        total_downloaded_size = 0
+        incremental = bool(self._get_task_option(task, 'incremental', False))
+        manifest = progress.metadata.setdefault('manifest', {})
+        skipped_files = 0
+        skipped_bytes = 0
+        checksum_failures: List[str] = []
+        parallel_files = max(1, int(self._get_task_option(task, 'parallel_files', settings.DOWNLOAD_MAX_PARALLEL_FILES)))
+        task_semaphore = asyncio.Semaphore(parallel_files)
+        # 汇总并发下载的总体进度
+        tracker = self._directory_progress(
+            task, progress, [self._relative_download_path(url, file_url) for file_url in file_urls]
+        )
         
-        for i, file_url in enumerate(file_urls):
-            try:
-                filename = Path(urlparse(file_url).path).name
-                filepath = save_path / filename
-                
-                # 发送当前文件信息
-                await self._send_progress_update(task.id, {
-                    "progress": (i / total_files) * 100,
-                    "status": "running",
-                    "current_file": filename,
-                    "files_completed": i,
-                    "total_files": total_files
-                })
-                
-                async with session.get(file_url) as response:
-                    if response.status != 200:
-                        logger.warning(f"Failed to download {file_url}: HTTP {response.status}")
-                        continue
+        progress.update(progress=0.0, files_completed=0, total_files=total_files)
+        
+        async def download_one(file_url: str):
+            nonlocal downloaded_files, skipped_files, skipped_bytes
+            filename = self._relative_download_path(url, file_url)
+            filepath = save_path / filename
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            
+            # 增量同步：本地副本与清单一致时发送条件请求，304 表示远端未变化
+            conditional_headers = None
+            manifest_entry = manifest.get(filename) if incremental else None
+            if self._is_unchanged(manifest_entry, filepath):
+                conditional_headers = {}
+                if manifest_entry.get('etag'):
+                    conditional_headers['If-None-Match'] = manifest_entry['etag']
+                if manifest_entry.get('last_modified'):
+                    conditional_headers['If-Modified-Since'] = manifest_entry['last_modified']
+            
+            def on_chunk(downloaded_size: int, file_size: int):
+                fraction = min(downloaded_size / file_size, 1.0) if file_size > 0 else 0.0
+                progress.update(progress=tracker.report(filename, fraction), current_file=filename)
+            
+            async with task_semaphore:
+                try:
+                    result = await self._fetch_http_file_with_retry(
+                        db, session, task, file_url, filepath, progress,
+                        on_chunk=on_chunk, conditional_headers=conditional_headers or None,
+                        sidecar_names=listed_names
+                    )
+                    if result is None:
+                        skipped_files += 1
+                        skipped_bytes += manifest_entry.get('size') or 0
+                        logger.debug(f"Skipped unchanged file {filename}")
+                    else:
+                        downloaded_files += 1
+                        logger.info(f"Successfully downloaded {filename}")
+                        await self._submit_for_conversion(task.id, filepath, filename)
+                        if incremental:
+                            remote = progress.metadata['resume'].get(file_url) or {}
+                            progress.set_metadata_item('manifest', filename, {
+                                'size': result,
+                                'etag': remote.get('etag'),
+                                'last_modified': remote.get('last_modified'),
+                                'checksum': remote.get('checksum'),
+                                'extracted': remote.get('extracted')
+                            })
+                except asyncio.CancelledError:
+                    raise
+                except ChecksumMismatchError as e:
+                    checksum_failures.append(filename)
+                    logger.error(f"Checksum verification failed for {file_url}: {e}")
+                except Exception as e:
+                    logger.error(f"Failed to download file {file_url}: {e}")
+                    failed_files.append(filename)
+                    # 继续下载其他文件，不中断整个任务
+                finally:
+                    # 失败的文件也计为已处理，保证总体进度能到达100%
+                    progress.update(
+                        progress=tracker.report(filename, 1.0),
+                        files_completed=downloaded_files,
+                        files_skipped=skipped_files,
+                        total_files=total_files
+                    )
+            await progress.tick()
+        
+        await asyncio.gather(*(download_one(file_url) for file_url in file_urls))
+        
+        self._raise_for_checksum_failures(checksum_failures)
+        if downloaded_files == 0 and skipped_files == 0:
+            raise Exception("所有文件下载均失败")
+        
+        # Mark as completed
+        progress.set_metadata('resume', None)
+        self._record_sync_summary(progress, incremental, downloaded_files, skipped_files, skipped_bytes)
+        await progress.finish(
+            status="completed",
+            files_downloaded=downloaded_files,
+            files_skipped=skipped_files,
+            skipped_bytes=skipped_bytes,
+            total_files=total_files
+        )
+
+    async def _download_opendap(self, db: Session, task, data_source, progress: ProgressAggregator):
+        """从 OPeNDAP/THREDDS 端点按变量、经纬度范围和时间窗口在服务端裁剪，切片并发下载为本地 CF NetCDF 文件"""
+        save_path = self._get_save_path(task)
+        try:
+            save_path.mkdir(parents=True, exist_ok=True)
+        except PermissionError as e:
+            logger.error(f"Permission denied creating directory {save_path}: {e}")
+            raise Exception(f"无法创建下载目录: {save_path}，请检查权限")
+
+        url = data_source.url
+        bbox = self._get_task_option(task, 'bbox')
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError("bbox 必须为 [west, south, east, north]")
+        request = SubsetRequest(
+            variables=list(self._get_task_option(task, 'variables', [])),
+            bbox=[float(value) for value in bbox] if bbox else None,
+            time_start=self._get_task_option(task, 'time_start'),
+            time_end=self._get_task_option(task, 'time_end')
+        )
+        filename = self._get_task_option(task, 'output_filename') or opendap_subsetter.default_filename(url)
+        filepath = save_path / filename
+
+        session = await http_client_pool.get_session(data_source)
+        progress.update(current_file=filename)
+        await opendap_subsetter.download(
+            session, url, request, filepath, progress,
+            retry_policy=RetryPolicy.for_task(task),
+            timeout=http_client_pool.request_timeout(task.timeout),
+            host_semaphore=self._get_host_semaphore(urlparse(url).hostname)
+        )
+        await self._submit_for_conversion(task.id, filepath, filename)
+
+        progress.set_metadata('resume', None)
+        await progress.finish(status="completed", files_downloaded=1)
+
+    async def _submit_for_conversion(self, task_id: int, filepath: Path, name: str):
+        """任务开启 options.convert 时把下载完成的文件交给转换流水线（队列已满时等待）
+
+        压缩包已在下载时解出的，逐个提交解出的文件。
+        """
+        pipeline = self._conversion_pipelines.get(task_id)
+        if pipeline is None:
+            return
+        extracted = self._extracted_files(pipeline.progress, filepath)
+        if extracted is None:
+            await pipeline.submit(filepath, name)
+            return
+        for path in map(Path, extracted):
+            await pipeline.submit(path, str(Path(name).parent / path.relative_to(filepath.parent)))
+
+    def _record_sync_summary(self, progress: ProgressAggregator, incremental: bool,
+                             transferred_files: int, skipped_files: int, skipped_bytes: int):
+        """记录本次增量同步的跳过统计（task_metadata['sync']），供任务详情接口返回"""
+        if not incremental:
+            return
+        progress.set_metadata('sync', {
+            'transferred_files': transferred_files,
+            'skipped_files': skipped_files,
+            'skipped_bytes': skipped_bytes,
+            'synced_at': datetime.utcnow().isoformat()
+        })
+
+    async def _fetch_http_file(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        filepath: Path,
+        progress: ProgressAggregator,
+        on_chunk: Optional[Callable[[int, int], None]] = None,
+        segments: int = 1,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        conditional_headers: Optional[Dict[str, str]] = None,
+        checksum_algorithm: Optional[str] = None,
+        extractor: Optional[StreamExtractor] = None
+    ) -> Optional[int]:
+        """流式下载单个HTTP文件，返回文件字节数；条件请求返回304（远端未变化）时返回 None
+
+        数据先写入 .part 文件，偏移量和校验头(ETag/Last-Modified)记录在 task_metadata['resume'] 中；
+        重试或再次运行时以 Range + If-Range 续传，服务器文件已变化时自动回退为完整下载。
+        远端没有 ETag/Last-Modified 时仅凭文件总长度判断是否可续传。
+        on_chunk(downloaded_size, file_size) 在每个数据块写入后调用；segments > 1 时对大文件启用多连接分段下载。
+        指定 checksum_algorithm 时在数据块循环中增量计算摘要，结果记录在续传条目的 checksum 中。
+        传入 extractor 时数据块直接交给流式解包器，不写 .part 文件（解压状态无法续传，重试从头开始）。
+        """
+        resume_state = progress.metadata.setdefault('resume', {})
+        entry = resume_state.get(url) or {}
+        part_path = self._part_path(filepath)
+        
+        # 上次运行中已完成（或已解压）的文件直接跳过
+        if entry.get('completed') and (
+            all(Path(path).exists() for path in entry['extracted']) if entry.get('extracted') is not None
+            else filepath.exists() and filepath.stat().st_size == entry.get('size')
+        ):
+            progress.add(entry['size'])
+            if on_chunk:
+                on_chunk(entry['size'], entry['size'])
+            return entry['size']
+        
+        if segments > 1 and extractor is None:
+            file_size, accepts_ranges, validators = await self._probe_http_file(session, url, timeout=timeout)
+            if accepts_ranges and file_size >= settings.DOWNLOAD_SEGMENT_MIN_SIZE:
+                return await self._fetch_http_file_segmented(
+                    session, url, filepath, progress, file_size, validators, segments,
+                    on_chunk=on_chunk, timeout=timeout, checksum_algorithm=checksum_algorithm
+                )
+            logger.info(f"Server does not support segmented download for {url}, using a single connection")
+        
+        counted = 0
+        try:
+            async with self._get_host_semaphore(urlparse(url).hostname):
+                while True:
+                    offset = part_path.stat().st_size if entry and part_path.exists() and extractor is None else 0
+                    validator = self._get_resume_validator(entry)
+                    range_requested = bool(offset and (validator or entry.get('size')))
+                    if range_requested:
+                        headers = {'Range': f'bytes={offset}-'}
+                        if validator:
+                            headers['If-Range'] = validator
+                    else:
+                        headers = dict(conditional_headers or {})
                     
+                    async with session.get(url, headers=headers, timeout=timeout) as response:
+                        if response.status == 304 and conditional_headers and not range_requested:
+                            return None
+                        
+                        if response.status == 416 and range_requested:
+                            # 本地分片已超出远端文件长度，丢弃后重新下载
+                            logger.info(f"Range not satisfiable for {url}, restarting from byte 0")
+                            part_path.unlink(missing_ok=True)
+                            entry = {}
+                            continue
+                        
+                        if response.status == 206 and range_requested:
+                            range_start, file_size = self._parse_content_range(response.headers.get('content-range'))
+                            if range_start != offset:
+                                raise Exception(f"服务器返回的续传范围不匹配: {response.headers.get('content-range')}")
+                            if not validator and file_size != entry.get('size'):
+                                # 无校验头时以总长度判断远端文件是否变化
+                                logger.info(f"Remote file {url} changed size, restarting from byte 0")
+                                part_path.unlink(missing_ok=True)
+                                entry = {}
+                                continue
+                            mode = 'ab'
+                        elif response.status == 200:
+                            if range_requested:
+                                logger.info(f"Remote file {url} changed or range unsupported, restarting from byte 0")
+                            offset = 0
+                            file_size = int(response.headers.get('content-length', 0))
+                            mode = 'wb'
+                        else:
+                            raise HttpStatusError(
+                                response.status, response.reason,
+                                retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                            )
+                        
+                        entry = {
+                            'filename': filepath.name,
+                            'offset': offset,
+                            'size': file_size,
+                            'etag': response.headers.get('ETag') or (entry.get('etag') if mode == 'ab' else None),
+                            'last_modified': response.headers.get('Last-Modified') or (
+                                entry.get('last_modified') if mode == 'ab' else None
+                            )
+                        }
+                        resume_state[url] = entry
+                        progress.set_metadata('resume', resume_state)
+                        
+                        downloaded_size = offset
+                        progress.add(offset)
+                        counted = offset
+                        if on_chunk:
+                            on_chunk(downloaded_size, file_size)
+                        
+                        hasher = new_hasher(checksum_algorithm) if checksum_algorithm else None
+                        if hasher and offset:
+                            # 续传时先补算已下载部分的摘要
+                            await asyncio.get_event_loop().run_in_executor(
+                                None, update_from_file, hasher, part_path, offset
+                            )
+                        
+                        writer = _ExtractingWriter(extractor) if extractor else aiofiles.open(part_path, mode)
+                        async with writer as f:
+                            async for chunk in response.content.iter_chunked(8192):
+                                await f.write(chunk)
+                                if hasher:
+                                    hasher.update(chunk)
+                                downloaded_size += len(chunk)
+                                counted += len(chunk)
+                                entry['offset'] = downloaded_size
+                                progress.add(len(chunk))
+                                progress.checkpoint_metadata(len(chunk))
+                                if on_chunk:
+                                    on_chunk(downloaded_size, file_size)
+                                await bandwidth_limiter.throttle(progress.task_id, len(chunk))
+                                await progress.tick()
+                    break
+            
+            if file_size > 0 and downloaded_size != file_size:
+                raise Exception(f"文件传输不完整: {downloaded_size}/{file_size} 字节")
+            
+            if extractor is not None:
+                await asyncio.get_event_loop().run_in_executor(None, extractor.finish)
+                self._record_extracted(progress, filepath, extractor)
+            else:
+                part_path.replace(filepath)
+            resume_state[url] = {
+                'filename': filepath.name,
+                'completed': True,
+                'size': downloaded_size,
+                'etag': entry.get('etag'),
+                'last_modified': entry.get('last_modified'),
+                'checksum': {'algorithm': hasher.name, 'value': hasher.hexdigest()} if hasher else None,
+                'extracted': [str(path) for path in extractor.outputs] if extractor else None
+            }
+            progress.set_metadata('resume', resume_state)
+        except asyncio.CancelledError:
+            if extractor is not None:
+                extractor.discard()
+            raise
+        except Exception:
+            # 回退本次尝试计入的字节数，避免重试时重复统计（已写入 .part 的数据会在重试时续传）
+            progress.add(-counted)
+            if extractor is not None:
+                extractor.discard()
+            raise
+        
+        return downloaded_size
+
+    async def _probe_http_file(self, session: aiohttp.ClientSession, url: str,
+                               timeout: Optional[aiohttp.ClientTimeout] = None) -> Tuple[int, bool, Dict[str, Any]]:
+        """HEAD 请求获取文件大小、是否支持 Range 以及校验头"""
+        try:
+            async with self._get_host_semaphore(urlparse(url).hostname):
+                async with session.head(url, allow_redirects=True, timeout=timeout) as response:
+                    if response.status != 200:
+                        return 0, False, {}
                     file_size = int(response.headers.get('content-length', 0))
-                    downloaded_size = 0
+                    accepts_ranges = response.headers.get('Accept-Ranges', '').lower() == 'bytes'
+                    validators = {
+                        'etag': response.headers.get('ETag'),
+                        'last_modified': response.headers.get('Last-Modified')
+                    }
+                    return file_size, accepts_ranges, validators
+        except aiohttp.ClientError as e:
+            logger.warning(f"HEAD request failed for {url}: {e}")
+            return 0, False, {}
+
+    async def _fetch_http_file_segmented(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        filepath: Path,
+        progress: ProgressAggregator,
+        file_size: int,
+        validators: Dict[str, Any],
+        segments: int,
+        on_chunk: Optional[Callable[[int, int], None]] = None,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        checksum_algorithm: Optional[str] = None
+    ) -> int:
+        """多连接分段下载：将文件按 Range 切分为多段并发写入预分配的 .part 文件
+
+        每段的当前位置记录在 task_metadata['resume'] 中，远端文件未变化时可逐段续传；
+        任一分段失败时取消其余分段并抛出，由调用方的文件级重试重新探测后从各段已写入的位置续传，
+        不在分段内另行重试（两层重试会使尝试次数成倍增加）。
+        各段乱序写入无法流式计算摘要，需要校验时在文件完整后读取一次计算。
+        """
+        resume_state = progress.metadata.setdefault('resume', {})
+        entry = resume_state.get(url) or {}
+        part_path = self._part_path(filepath)
+        
+        same_remote_file = (
+            entry.get('segments')
+            and entry.get('size') == file_size
+            and part_path.exists()
+            and part_path.stat().st_size == file_size
+            and (entry.get('etag') or entry.get('last_modified'))
+            and entry.get('etag') == validators.get('etag')
+            and entry.get('last_modified') == validators.get('last_modified')
+        )
+        if same_remote_file:
+            ranges = entry['segments']
+        else:
+            # 每段为 [start, end, 当前位置]，预分配完整文件以便各段按偏移写入
+            segment_size = -(-file_size // segments)
+            ranges = [
+                [start, min(start + segment_size, file_size) - 1, start]
+                for start in range(0, file_size, segment_size)
+            ]
+            with open(part_path, 'wb') as f:
+                f.truncate(file_size)
+        
+        entry = {
+            'filename': filepath.name,
+            'size': file_size,
+            'etag': validators.get('etag'),
+            'last_modified': validators.get('last_modified'),
+            'segments': ranges
+        }
+        resume_state[url] = entry
+        progress.set_metadata('resume', resume_state)
+        
+        downloaded_size = sum(position - start for start, _, position in ranges)
+        counted = downloaded_size
+        progress.add(downloaded_size)
+        if on_chunk:
+            on_chunk(downloaded_size, file_size)
+        validator = self._get_resume_validator(entry)
+        
+        async def fetch_range(segment: List[int]):
+            nonlocal downloaded_size, counted
+            start, end, position = segment
+            if position > end:
+                return
+            headers = {'Range': f'bytes={position}-{end}'}
+            if validator:
+                headers['If-Range'] = validator
+            
+            async with self._get_host_semaphore(urlparse(url).hostname):
+                async with session.get(url, headers=headers, timeout=timeout) as response:
+                    if response.status == 200:
+                        # 远端文件已变化，文件级重试重新探测时发现校验头不同，从头下载
+                        raise RemoteFileChangedError(f"分段下载失败: 远端文件 {url} 已变化")
+                    if response.status != 206:
+                        raise HttpStatusError(
+                            response.status, response.reason,
+                            retry_after=parse_retry_after(response.headers.get('Retry-After'))
+                        )
+                    range_start, _ = self._parse_content_range(response.headers.get('content-range'))
+                    if range_start != position:
+                        raise Exception(f"服务器返回的分段范围不匹配: {response.headers.get('content-range')}")
                     
-                    async with aiofiles.open(filepath, 'wb') as f:
+                    async with aiofiles.open(part_path, 'r+b') as f:
+                        await f.seek(position)
                         async for chunk in response.content.iter_chunked(8192):
+                            chunk = chunk[:end + 1 - segment[2]]
+                            if not chunk:
+                                break
                             await f.write(chunk)
+                            segment[2] += len(chunk)
                             downloaded_size += len(chunk)
-                            total_downloaded_size += len(chunk)
-                            
-                            # 更新进度（文件级别 + 总体进度）
-                            file_progress = (downloaded_size / file_size * 100) if file_size > 0 else 0
-                            overall_progress = ((i + file_progress / 100) / total_files) * 100
-                            
-                            crud_download_task.update_progress(
-                                db, task_id=task.id, progress=overall_progress, downloaded_size=total_downloaded_size
-                            )
-                            
-                            # Send WebSocket progress update
-                            await self._send_progress_update(task.id, {
-                                "progress": overall_progress,
-                                "downloaded_size": total_downloaded_size,
-                                "status": "running",
-                                "current_file": filename,
-                                "file_progress": file_progress,
-                                "files_completed": i,
-                                "total_files": total_files
-                            })
-                
-                downloaded_files += 1
-                logger.info(f"Successfully downloaded {filename}")
-                
-            except Exception as e:
-                logger.error(f"Failed to download file {file_url}: {e}")
-                # 继续下载其他文件，不中断整个任务
-                continue
+                            counted += len(chunk)
+                            progress.add(len(chunk))
+                            progress.checkpoint_metadata(len(chunk))
+                            if on_chunk:
+                                on_chunk(downloaded_size, file_size)
+                            await bandwidth_limiter.throttle(progress.task_id, len(chunk))
+                            await progress.tick()
         
-        if downloaded_files == 0:
-            raise Exception("所有文件下载均失败")
+        try:
+            await self._gather_or_cancel([fetch_range(segment) for segment in ranges])
+            
+            # 校验所有分段均已完整写入
+            incomplete = [segment for segment in ranges if segment[2] != segment[1] + 1]
+            if incomplete or part_path.stat().st_size != file_size:
+                raise Exception(f"分段下载不完整: {len(incomplete)} 个分段未完成")
+            
+            part_path.replace(filepath)
+            checksum = None
+            if checksum_algorithm:
+                checksum = {
+                    'algorithm': checksum_algorithm,
+                    'value': await asyncio.get_event_loop().run_in_executor(
+                        None, hash_file, filepath, checksum_algorithm
+                    )
+                }
+            resume_state[url] = {
+                'filename': filepath.name,
+                'completed': True,
+                'size': file_size,
+                'etag': entry.get('etag'),
+                'last_modified': entry.get('last_modified'),
+                'checksum': checksum
+            }
+            progress.set_metadata('resume', resume_state)
+        except Exception:
+            progress.add(-counted)
+            raise
         
-        # Mark as completed
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
-        
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": total_downloaded_size,
-            "status": "completed",
-            "files_downloaded": downloaded_files,
-            "total_files": total_files
-        })
+        return file_size
+
+    async def _gather_or_cancel(self, coroutines: List) -> List[Any]:
+        """并发执行协程；任一失败时取消其余协程并等待其退出后再抛出异常"""
+        tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for pending_task in tasks:
+                pending_task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    def _get_resume_validator(self, entry: Dict[str, Any]) -> Optional[str]:
+        """选择 If-Range 校验值：强ETag优先，其次Last-Modified"""
+        etag = entry.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return entry.get('last_modified')
 
-    async def _download_ftp(self, db: Session, task, data_source):
+    def _parse_content_range(self, content_range: Optional[str]) -> Tuple[int, int]:
+        """解析 Content-Range: bytes start-end/total，返回 (start, total)"""
+        match = re.match(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', content_range or '')
+        if not match:
+            raise Exception(f"无效的 Content-Range 响应头: {content_range}")
+        total = int(match.group(3)) if match.group(3) != '*' else 0
+        return int(match.group(1)), total
+
+    async def _fetch_http_file_with_retry(
+        self,
+        db: Session,
+        session: aiohttp.ClientSession,
+        task,
+        url: str,
+        filepath: Path,
+        progress: ProgressAggregator,
+        on_chunk: Optional[Callable[[int, int], None]] = None,
+        segments: int = 1,
+        conditional_headers: Optional[Dict[str, str]] = None,
+        sidecar_names: Optional[Set[str]] = None
+    ) -> Optional[int]:
+        """按任务的 max_retries 对单个文件以带抖动的指数退避重试下载，请求超时取自任务的 timeout
+
+        每次重试都从 .part 文件中已接收的字节续传（分段下载时从各段的当前位置续传）。
+
+        远端存在 .sha256/.md5 校验文件时按其算法边下载边计算摘要并比对；不一致的文件删除后重新下载，
+        重试耗尽时抛出 ChecksumMismatchError。sidecar_names 为目录列表中的文件名，用于避免探测不存在的校验文件。
+        任务启用去重时，先按 URL + 校验头或校验和在内容寻址存储中查找，命中则直接链接，下载完成后纳入存储。
+        """
+        retry_policy = RetryPolicy.for_task(task)
+        timeout = http_client_pool.request_timeout(task.timeout)
+        expected = await self._fetch_http_sidecar(session, url, timeout=timeout, available=sidecar_names)
+        checksum_algorithm = self._checksum_algorithm(expected)
+        # 解压的文件不保留压缩包本身，无法纳入下载存储
+        use_store = download_store.is_enabled_for(task) and not self._extracts(task, filepath)
+        
+        if use_store and not conditional_headers:
+            _, _, validators = await self._probe_http_file(session, url, timeout=timeout)
+            linked_size = await self._link_from_store(
+                db, task, filepath, progress, url=url, validator=self._get_resume_validator(validators),
+                expected=expected
+            )
+            if linked_size is not None:
+                resume_state = progress.metadata.setdefault('resume', {})
+                resume_state[url] = {
+                    'filename': filepath.name,
+                    'completed': True,
+                    'size': linked_size,
+                    'etag': validators.get('etag'),
+                    'last_modified': validators.get('last_modified')
+                }
+                progress.set_metadata('resume', resume_state)
+                if on_chunk:
+                    on_chunk(linked_size, linked_size)
+                return linked_size
+        
+        async def fetch(attempt: int) -> Optional[int]:
+            extractor = self._create_extractor(task, filepath)
+            result = await self._fetch_http_file(
+                session, url, filepath, progress, on_chunk=on_chunk, segments=segments, timeout=timeout,
+                conditional_headers=conditional_headers, checksum_algorithm=checksum_algorithm,
+                extractor=extractor
+            )
+            if result is not None:
+                await self._verify_http_checksum(progress, url, filepath, expected, extractor=extractor)
+                if use_store:
+                    entry = progress.metadata['resume'].get(url) or {}
+                    await self._ingest_into_store(
+                        db, task, filepath, progress, url=url, validator=self._get_resume_validator(entry)
+                    )
+            return result
+        
+        return await retry_policy.run(fetch, url)
+
+    async def _fetch_http_sidecar(self, session: aiohttp.ClientSession, url: str,
+                                  timeout: Optional[aiohttp.ClientTimeout] = None,
+                                  available: Optional[Set[str]] = None) -> Optional[Dict[str, str]]:
+        """获取远端 .sha256/.md5 校验文件，返回 {'algorithm', 'value'}；不存在时返回 None"""
+        if not settings.DOWNLOAD_VERIFY_CHECKSUMS:
+            return None
+        parsed_url = urlparse(url)
+        filename = Path(parsed_url.path).name
+        for extension, algorithm in SIDECAR_ALGORITHMS.items():
+            if available is not None and filename + extension not in available:
+                continue
+            sidecar_url = parsed_url._replace(path=parsed_url.path + extension).geturl()
+            try:
+                async with self._get_host_semaphore(parsed_url.hostname):
+                    async with session.get(sidecar_url, timeout=timeout) as response:
+                        if response.status != 200:
+                            continue
+                        content = await response.text(errors='replace')
+            except aiohttp.ClientError as e:
+                logger.warning(f"Failed to fetch checksum file {sidecar_url}: {e}")
+                continue
+            value = parse_sidecar(content, filename, algorithm)
+            if value:
+                return {'algorithm': algorithm, 'value': value}
+        return None
+
+    async def _verify_http_checksum(self, progress: ProgressAggregator, url: str, filepath: Path,
+                                    expected: Optional[Dict[str, str]], extractor: Optional[StreamExtractor] = None):
+        """比对HTTP文件的流式摘要；不一致时清除续传条目，使重试从头下载"""
+        resume_state = progress.metadata.setdefault('resume', {})
+        entry = resume_state.get(url) or {}
+        actual = entry.get('checksum')
+        if expected and (not actual or actual.get('algorithm') != expected['algorithm']):
+            if entry.get('extracted') is not None:
+                # 压缩包已解压且未保留，无法补算摘要
+                return
+            # 上次运行已完成的文件没有对应算法的摘要，读取一次补算
+            actual = {
+                'algorithm': expected['algorithm'],
+                'value': await asyncio.get_event_loop().run_in_executor(
+                    None, hash_file, filepath, expected['algorithm']
+                )
+            }
+        try:
+            self._verify_checksum(progress, filepath, actual, expected, extractor=extractor)
+        except ChecksumMismatchError:
+            resume_state.pop(url, None)
+            progress.set_metadata('resume', resume_state)
+            raise
+
+    def _checksum_algorithm(self, expected: Optional[Dict[str, str]]) -> Optional[str]:
+        """流式计算所用的哈希算法：有校验文件时与其一致，否则使用 DOWNLOAD_CHECKSUM_ALGORITHM"""
+        if expected:
+            return expected['algorithm']
+        return settings.DOWNLOAD_CHECKSUM_ALGORITHM or None
+
+    def _verify_checksum(self, progress: ProgressAggregator, filepath: Path,
+                         actual: Optional[Dict[str, str]], expected: Optional[Dict[str, str]],
+                         extractor: Optional[StreamExtractor] = None):
+        """将文件摘要记录到 task_metadata['checksums']；与校验文件不一致时删除本地文件（及解出的文件）并抛出异常
+
+        可在工作线程中调用。
+        """
+        if not actual:
+            return
+        record = dict(actual)
+        if expected:
+            record['expected'] = expected['value']
+            record['verified'] = actual['value'] == expected['value']
+        progress.set_metadata_item('checksums', filepath.name, record)
+        if expected and not record['verified']:
+            filepath.unlink(missing_ok=True)
+            if extractor is not None:
+                extractor.discard()
+            raise ChecksumMismatchError(
+                f"{filepath.name} 校验和不匹配（{expected['algorithm']}）: 期望 {expected['value']}，实际 {actual['value']}"
+            )
+
+    async def _link_from_store(self, db: Session, task, filepath: Path, progress: ProgressAggregator,
+                               url: Optional[str] = None, validator: Optional[str] = None,
+                               expected: Optional[Dict[str, str]] = None) -> Optional[int]:
+        """文件已在内容寻址存储中时链接到保存目录，返回文件大小；未命中或与校验文件不一致时返回 None，由调用方从源站下载"""
+        try:
+            stored = download_store.find(db, url=url, validator=validator, checksum=expected)
+            if stored is None:
+                return None
+            size = await download_store.link_into(db, stored, task.id, filepath)
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Download store lookup failed for {filepath.name}, downloading instead: {e}")
+            return None
+        
+        checksum = {'algorithm': stored.algorithm, 'value': stored.checksum}
+        # 按 URL 命中的对象可能使用与校验文件不同的算法，此时只记录摘要
+        try:
+            self._verify_checksum(
+                progress, filepath, checksum,
+                expected if expected and expected['algorithm'] == stored.algorithm else None
+            )
+        except ChecksumMismatchError as e:
+            # 存储对象与远端校验文件不一致（如 URL 索引指向旧内容）：链接已删除，释放引用后从源站重新下载
+            logger.warning(f"Stored object {stored.id} does not match {filepath.name}, downloading instead: {e}")
+            try:
+                download_store.release_ref(db, task.id, filepath)
+            except Exception as release_error:
+                db.rollback()
+                logger.warning(f"Failed to release download store reference for {filepath.name}: {release_error}")
+            return None
+        progress.add(size)
+        logger.info(f"Linked {filepath.name} from download store (object {stored.id})")
+        return size
+
+    async def _ingest_into_store(self, db: Session, task, filepath: Path, progress: ProgressAggregator,
+                                 url: Optional[str] = None, validator: Optional[str] = None):
+        """将下载完成的文件纳入内容寻址存储；需要已记录的摘要，失败时不影响下载结果"""
+        checksum = (progress.metadata.get('checksums') or {}).get(filepath.name)
+        if not checksum:
+            return
+        try:
+            await download_store.ingest(
+                db, task.id, filepath, {'algorithm': checksum['algorithm'], 'value': checksum['value']},
+                url=url, validator=validator
+            )
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to add {filepath.name} to download store: {e}")
+
+    def _raise_for_checksum_failures(self, filenames: List[str]):
+        """目录下载中存在校验失败的文件时将整个任务标记为失败"""
+        if filenames:
+            shown = ', '.join(sorted(filenames)[:10])
+            raise ChecksumMismatchError(f"{len(filenames)} 个文件校验和不匹配: {shown}")
+
+    async def _download_ftp(self, db: Session, task, data_source, progress: ProgressAggregator):
         """Download file(s) using FTP - supports both single files and directories"""
         parsed_url = urlparse(data_source.url)
-        
-        # 确保使用相对路径，避免权限问题
-        if task.save_path.startswith('/'):
-            save_path = Path('.' + task.save_path)
-        else:
-            save_path = Path(task.save_path)
+        save_path = self._get_save_path(task)
         save_path.mkdir(parents=True, exist_ok=True)
         
         # 判断是目录还是单文件
         if self._is_directory_url(data_source.url):
-            await self._download_ftp_directory(db, task, data_source, parsed_url, save_path)
+            await self._download_ftp_directory(db, task, data_source, parsed_url, save_path, progress)
         else:
-            await self._download_ftp_single_file(db, task, data_source, parsed_url, save_path)
+            await self._download_ftp_single_file(db, task, data_source, parsed_url, save_path, progress)
 
-    async def _download_ftp_single_file(self, db: Session, task, data_source, parsed_url, save_path: Path):
-        """FTP单文件下载"""
-        def ftp_download():
-            ftp = ftplib.FTP()
-            try:
-                ftp.connect(parsed_url.hostname, parsed_url.port or 21)
-                
-                if data_source.auth_required:
-                    ftp.login(data_source.username, data_source.password)
-                else:
-                    ftp.login()
-                
-                filename = Path(parsed_url.path).name
-                filepath = save_path / filename
-                
+    async def _download_ftp_single_file(self, db: Session, task, data_source, parsed_url, save_path: Path,
+                                        progress: ProgressAggregator):
+        """FTP单文件下载（使用连接池中已登录的连接）"""
+        filename = Path(parsed_url.path).name
+        filepath = save_path / filename
+        # 任务被暂停/取消时通知工作线程中止传输
+        stop_event = threading.Event()
+        progress.update(current_file=filename)
+        
+        def ftp_download(resume: bool):
+            with ftp_pool.connection(data_source, parsed_url) as ftp:
                 # 获取文件大小
                 try:
-                    file_size = ftp.size(parsed_url.path)
+                    file_size = ftp.size(parsed_url.path) or 0
                     if file_size:
-                        fresh_task = crud_download_task.get(db, task.id)
-                        if fresh_task:
-                            crud_download_task.update(db, db_obj=fresh_task, obj_in={"file_size": file_size})
-                except:
+                        progress.set_total_size(file_size)
+                except ftplib.all_errors:
                     file_size = 0
                 
-                downloaded_size = 0
-                
-                def write_callback(data):
-                    nonlocal downloaded_size
-                    downloaded_size += len(data)
-                    
-                    # 更新进度
-                    if file_size > 0:
-                        progress = (downloaded_size / file_size) * 100
-                        crud_download_task.update_progress(
-                            db, task_id=task.id, progress=progress, downloaded_size=downloaded_size
-                        )
-                    
-                    return data
-                
-                with open(filepath, 'wb') as f:
-                    ftp.retrbinary(f'RETR {parsed_url.path}', lambda data: f.write(write_callback(data)))
-                
-                ftp.quit()
+                expected = self._ftp_fetch_sidecar(ftp, parsed_url.path)
+                algorithm = self._checksum_algorithm(expected)
+                hasher = new_hasher(algorithm) if algorithm else None
+                extractor = self._create_extractor(task, filepath)
+                downloaded_size = self._ftp_retrieve(
+                    ftp, parsed_url.path, filepath, progress, stop_event, hasher=hasher,
+                    resume=resume, file_size=file_size, timeout=task.timeout, extractor=extractor
+                )
+                if hasher:
+                    self._verify_checksum(
+                        progress, filepath, {'algorithm': hasher.name, 'value': hasher.hexdigest()}, expected,
+                        extractor=extractor
+                    )
                 return downloaded_size
-                
-            except Exception as e:
-                if ftp:
-                    ftp.quit()
-                raise e
 
-        # Run FTP download in thread pool
+        # Run FTP download in thread pool with periodic progress flushes
         loop = asyncio.get_event_loop()
-        downloaded_size = await loop.run_in_executor(None, ftp_download)
-        
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": downloaded_size,
-            "status": "completed",
-            "files_downloaded": 1
-        })
+        update_task = asyncio.create_task(self._flush_progress_periodically(progress))
         
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
+        try:
+            # 每次重试重新借出连接，并从 .part 中已接收的字节续传
+            await RetryPolicy.for_task(task).run(
+                lambda attempt: loop.run_in_executor(None, ftp_download, attempt > 0),
+                f"FTP file {parsed_url.path}"
+            )
+        except Exception:
+            # 重试耗尽的失败删除 .part；暂停/关闭引发的 CancelledError 保留它以便续传
+            self._part_path(filepath).unlink(missing_ok=True)
+            raise
+        finally:
+            stop_event.set()
+            update_task.cancel()
+        
+        if download_store.is_enabled_for(task) and not self._extracts(task, filepath):
+            await self._ingest_into_store(db, task, filepath, progress, url=data_source.url)
+        await self._submit_for_conversion(task.id, filepath, filename)
+        progress.set_metadata('resume', None)
+        await progress.finish(status="completed", files_downloaded=1)
 
-    async def _download_ftp_directory(self, db: Session, task, data_source, parsed_url, save_path: Path):
-        """FTP目录下载"""
+    async def _download_ftp_directory(self, db: Session, task, data_source, parsed_url, save_path: Path,
+                                      progress: ProgressAggregator):
+        """FTP目录下载：通过连接池中的多个连接并行传输"""
         pattern = self._get_file_pattern(task.filename_pattern)
         regex_pattern = re.compile(pattern, re.IGNORECASE)
+        incremental = bool(self._get_task_option(task, 'incremental', False))
+        manifest = dict(progress.metadata.get('manifest') or {})
+        remote_dir = parsed_url.path or '/'
+        use_store = download_store.is_enabled_for(task)
+        stop_event = threading.Event()
+        loop = asyncio.get_event_loop()
         
-        def ftp_list_and_download():
-            ftp = ftplib.FTP()
-            try:
-                ftp.connect(parsed_url.hostname, parsed_url.port or 21)
-                
-                if data_source.auth_required:
-                    ftp.login(data_source.username, data_source.password)
-                else:
-                    ftp.login()
-                
-                # 获取目录文件列表
-                ftp.cwd(parsed_url.path or '/')
-                files = ftp.nlst()
-                
-                # 过滤符合模式的文件
-                matching_files = [f for f in files if regex_pattern.match(f)]
-                
-                if not matching_files:
-                    raise Exception(f"在FTP目录中未找到符合模式 '{task.filename_pattern}' 的文件")
-                
-                logger.info(f"Found {len(matching_files)} files to download from FTP directory")
+        retry_policy = RetryPolicy.for_task(task)
+        
+        def list_files():
+            with ftp_pool.connection(data_source, parsed_url) as ftp:
+                ftp.cwd(remote_dir)
+                return ftp.nlst()
+        
+        # 获取目录文件列表并过滤符合模式的文件
+        files = await retry_policy.run(
+            lambda attempt: loop.run_in_executor(None, list_files), f"FTP listing of {remote_dir}"
+        )
+        matching_files = [f for f in files if regex_pattern.match(f)]
+        listed_names = {f.rsplit('/', 1)[-1] for f in files}
+        
+        if not matching_files:
+            raise Exception(f"在FTP目录中未找到符合模式 '{task.filename_pattern}' 的文件")
+        
+        failed_files: List[str] = []
+        matching_files = self._after_high_water_mark(task, progress, matching_files, lambda name: name, failed_files)
+        if not matching_files:
+            await self._finish_up_to_date(task, progress)
+            return
+        
+        logger.info(f"Found {len(matching_files)} files to download from FTP directory")
+        
+        total_files = len(matching_files)
+        downloaded_files = 0
+        skipped_files = 0
+        skipped_bytes = 0
+        checksum_failures: List[str] = []
+        parallel_files = max(1, min(
+            int(self._get_task_option(task, 'parallel_files', settings.DOWNLOAD_MAX_PARALLEL_FILES)),
+            settings.FTP_POOL_MAX_CONNECTIONS_PER_SOURCE
+        ))
+        worker_semaphore = asyncio.Semaphore(parallel_files)
+        # 各文件完成比例由工作线程更新，汇总为总体进度
+        tracker = self._directory_progress(task, progress, matching_files)
+        
+        def report_fraction(filename: str, fraction: float):
+            progress.update(progress=tracker.report(filename, fraction))
+        
+        def fetch_file(filename: str, resume: bool):
+            """在工作线程中下载单个文件，返回 (字节数, MDTM)；增量同步判定未变化时返回 None
+
+            resume 为 True（重试）时从 .part 中已接收的字节续传。
+            """
+            remote_file = f"{remote_dir.rstrip('/')}/{filename}"
+            filepath = save_path / filename
+            with ftp_pool.connection(data_source, parsed_url) as ftp:
+                # 获取文件大小
+                try:
+                    file_size = ftp.size(remote_file) or 0
+                except ftplib.all_errors:
+                    file_size = 0
                 
-                total_files = len(matching_files)
-                downloaded_files = 0
-                total_downloaded_size = 0
+                # 增量同步：SIZE/MDTM 与清单一致则跳过
+                mdtm = self._ftp_mdtm(ftp, remote_file) if incremental else None
+                if incremental and self._is_unchanged(manifest.get(filename), filepath, size=file_size, mtime=mdtm):
+                    return None
                 
-                for i, filename in enumerate(matching_files):
-                    try:
-                        filepath = save_path / filename
-                        
-                        # 获取文件大小
-                        try:
-                            file_size = ftp.size(filename)
-                        except:
-                            file_size = 0
-                        
-                        downloaded_size = 0
-                        
-                        def write_callback(data):
-                            nonlocal downloaded_size, total_downloaded_size
-                            downloaded_size += len(data)
-                            total_downloaded_size += len(data)
-                            
-                            # 更新进度（仅更新数据库，WebSocket在主线程中发送）
-                            file_progress = (downloaded_size / file_size * 100) if file_size > 0 else 0
-                            overall_progress = ((i + file_progress / 100) / total_files) * 100
-                            
-                            crud_download_task.update_progress(
-                                db, task_id=task.id, progress=overall_progress, downloaded_size=total_downloaded_size
-                            )
-                            
-                            return data
-                        
-                        with open(filepath, 'wb') as f:
-                            ftp.retrbinary(f'RETR {filename}', lambda data: f.write(write_callback(data)))
-                        
+                progress.update(current_file=filename)
+                expected = self._ftp_fetch_sidecar(ftp, remote_file, available=listed_names)
+                algorithm = self._checksum_algorithm(expected)
+                hasher = new_hasher(algorithm) if algorithm else None
+                extractor = self._create_extractor(task, filepath)
+                downloaded_size = self._ftp_retrieve(
+                    ftp, remote_file, filepath, progress, stop_event,
+                    on_data=lambda size: report_fraction(filename, size / file_size if file_size > 0 else 0.0),
+                    hasher=hasher, resume=resume, file_size=file_size, timeout=task.timeout, extractor=extractor
+                )
+                if hasher:
+                    self._verify_checksum(
+                        progress, filepath, {'algorithm': hasher.name, 'value': hasher.hexdigest()}, expected,
+                        extractor=extractor
+                    )
+                return downloaded_size, mdtm
+        
+        async def download_one(filename: str):
+            nonlocal downloaded_files, skipped_files, skipped_bytes
+            async with worker_semaphore:
+                try:
+                    result = await retry_policy.run(
+                        lambda attempt: loop.run_in_executor(None, fetch_file, filename, attempt > 0),
+                        f"FTP file {filename}"
+                    )
+                    if result is None:
+                        skipped_files += 1
+                        skipped_bytes += manifest[filename].get('size') or 0
+                    else:
                         downloaded_files += 1
                         logger.info(f"Successfully downloaded {filename} via FTP")
-                        
-                    except Exception as e:
-                        logger.error(f"Failed to download FTP file {filename}: {e}")
-                        continue
-                
-                ftp.quit()
-                return downloaded_files, total_downloaded_size, total_files
-                
-            except Exception as e:
-                if ftp:
-                    ftp.quit()
-                raise e
-
-        # Run FTP download in thread pool with periodic WebSocket updates
-        loop = asyncio.get_event_loop()
+                        if use_store and not self._extracts(task, save_path / filename):
+                            await self._ingest_into_store(
+                                db, task, save_path / filename, progress,
+                                url=f"{data_source.url.rstrip('/')}/{filename}",
+                                validator=f"{result[0]}:{result[1]}" if result[1] else None
+                            )
+                        await self._submit_for_conversion(task.id, save_path / filename, filename)
+                        if incremental:
+                            progress.set_metadata_item('manifest', filename, {
+                                'size': result[0],
+                                'mtime': result[1],
+                                'extracted': self._extracted_files(progress, save_path / filename)
+                            })
+                except asyncio.CancelledError:
+                    raise
+                except ChecksumMismatchError as e:
+                    checksum_failures.append(filename)
+                    logger.error(f"Checksum verification failed for FTP file {filename}: {e}")
+                except Exception as e:
+                    logger.error(f"Failed to download FTP file {filename}: {e}")
+                    failed_files.append(filename)
+                    self._part_path(save_path / filename).unlink(missing_ok=True)
+                finally:
+                    # 失败或跳过的文件也计为已处理
+                    report_fraction(filename, 1.0)
+                    progress.update(
+                        files_completed=downloaded_files,
+                        files_skipped=skipped_files,
+                        total_files=total_files
+                    )
+            await progress.tick()
         
-        # Start a task to send periodic WebSocket updates
-        update_task = asyncio.create_task(self._send_periodic_updates(db, task.id, lambda: True))
+        # Run transfers on pooled connections with periodic progress flushes
+        update_task = asyncio.create_task(self._flush_progress_periodically(progress))
         
         try:
-            downloaded_files, total_downloaded_size, total_files = await loop.run_in_executor(None, ftp_list_and_download)
+            await asyncio.gather(*(download_one(filename) for filename in matching_files))
         finally:
+            stop_event.set()
             update_task.cancel()
         
-        if downloaded_files == 0:
+        self._raise_for_checksum_failures(checksum_failures)
+        if downloaded_files == 0 and skipped_files == 0:
             raise Exception("所有FTP文件下载均失败")
         
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": total_downloaded_size,
-            "status": "completed",
-            "files_downloaded": downloaded_files,
-            "total_files": total_files
-        })
+        progress.set_metadata('resume', None)
+        self._record_sync_summary(progress, incremental, downloaded_files, skipped_files, skipped_bytes)
+        await progress.finish(
+            status="completed",
+            files_downloaded=downloaded_files,
+            files_skipped=skipped_files,
+            skipped_bytes=skipped_bytes,
+            total_files=total_files
+        )
+
+    def _ftp_retrieve(self, ftp: ftplib.FTP, remote_path: str, filepath: Path, progress: ProgressAggregator,
+                      stop_event: threading.Event, on_data: Optional[Callable[[int], None]] = None,
+                      hasher=None, resume: bool = False, file_size: int = 0, timeout: Optional[int] = None,
+                      extractor: Optional[StreamExtractor] = None) -> int:
+        """在工作线程中通过 RETR 下载文件；只更新进度聚合器，不访问数据库会话
+
+        传入 hasher 时随数据块增量计算摘要。resume 为 True（重试）时以 REST 从 .part 文件末尾续传，
+        服务器不支持 REST 时从头下载；timeout 为控制连接和数据连接的套接字超时（DownloadTask.timeout）。
+        传输失败或中止（暂停/关闭）时保留 .part 并在 task_metadata['resume'] 中登记，下次运行远端大小未变时直接续传；
+        取消任务时由 _discard_partial_files 删除。传入 extractor 时数据块直接解压/解包，不写 .part。
+        """
+        part_path = self._part_path(filepath)
+        resume = resume or self._has_resumable_part(progress, remote_path, file_size)
+        if timeout:
+            ftp.timeout = timeout
+            ftp.sock.settimeout(timeout)
+        
+        offset = part_path.stat().st_size if resume and extractor is None and part_path.exists() else 0
+        if offset and file_size and offset >= file_size:
+            offset = 0
+        if offset:
+            try:
+                ftp.voidcmd('TYPE I')
+                ftp.sendcmd(f'REST {offset}')
+            except ftplib.error_perm:
+                logger.info(f"FTP server does not support REST, restarting {remote_path} from byte 0")
+                offset = 0
+        if offset:
+            logger.info(f"Resuming FTP download of {remote_path} from byte {offset}")
+            if hasher:
+                update_from_file(hasher, part_path, offset)
         
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
+        downloaded_size = offset
+        progress.add(offset)
+        if on_data:
+            on_data(downloaded_size)
+        if extractor is None:
+            progress.set_metadata_item('resume', remote_path, {'filename': filepath.name, 'size': file_size})
+        
+        def write_callback(data):
+            nonlocal downloaded_size
+            if stop_event.is_set():
+                raise Exception("FTP传输已中止")
+            write(data)
+            if hasher:
+                hasher.update(data)
+            downloaded_size += len(data)
+            progress.add(len(data))
+            if on_data:
+                on_data(downloaded_size)
+            bandwidth_limiter.throttle_blocking(progress.task_id, len(data), stop_event)
+        
+        # 先写入 .part 再替换，不会改写可能与下载存储共享 inode 的旧文件
+        try:
+            with open(part_path, 'ab' if offset else 'wb') if extractor is None else nullcontext() as f:
+                write = f.write if extractor is None else extractor.feed
+                ftp.retrbinary(f'RETR {remote_path}', write_callback, rest=offset or None)
+            if file_size and downloaded_size != file_size:
+                raise Exception(f"文件传输不完整: {downloaded_size}/{file_size} 字节")
+            if extractor is not None:
+                extractor.finish()
+                self._record_extracted(progress, filepath, extractor)
+            else:
+                part_path.replace(filepath)
+                progress.set_metadata_item(
+                    'resume', remote_path, {'filename': filepath.name, 'size': file_size, 'completed': True}
+                )
+        except BaseException:
+            progress.add(-downloaded_size)
+            if extractor is not None:
+                extractor.discard()
+            raise
+        return downloaded_size
 
-    async def _download_sftp(self, db: Session, task, data_source):
+    def _ftp_fetch_sidecar(self, ftp: ftplib.FTP, remote_path: str,
+                           available: Optional[Set[str]] = None) -> Optional[Dict[str, str]]:
+        """在工作线程中读取FTP上的 .sha256/.md5 校验文件"""
+        if not settings.DOWNLOAD_VERIFY_CHECKSUMS:
+            return None
+        filename = remote_path.rsplit('/', 1)[-1]
+        for extension, algorithm in SIDECAR_ALGORITHMS.items():
+            if available is not None and filename + extension not in available:
+                continue
+            buffer = io.BytesIO()
+            try:
+                ftp.retrbinary(f'RETR {remote_path}{extension}', buffer.write)
+            except (ftplib.error_perm, ftplib.error_temp):
+                continue
+            value = parse_sidecar(buffer.getvalue().decode('utf-8', errors='replace'), filename, algorithm)
+            if value:
+                return {'algorithm': algorithm, 'value': value}
+        return None
+
+    def _ftp_size(self, ftp: ftplib.FTP, path: str) -> Optional[int]:
+        try:
+            return ftp.size(path) or None
+        except ftplib.all_errors:
+            return None
+
+    def _ftp_mdtm(self, ftp: ftplib.FTP, filename: str) -> Optional[str]:
+        """获取FTP文件修改时间（MDTM，格式 YYYYMMDDHHMMSS），服务器不支持时返回 None"""
+        try:
+            response = ftp.sendcmd(f'MDTM {filename}')
+        except ftplib.all_errors:
+            return None
+        return response.split()[-1] if response.startswith('213') else None
+
+    async def _download_sftp(self, db: Session, task, data_source, progress: ProgressAggregator):
         """Download file(s) using SFTP - supports both single files and directories"""
         parsed_url = urlparse(data_source.url)
-        
-        # 确保使用相对路径，避免权限问题
-        if task.save_path.startswith('/'):
-            save_path = Path('.' + task.save_path)
-        else:
-            save_path = Path(task.save_path)
+        save_path = self._get_save_path(task)
         save_path.mkdir(parents=True, exist_ok=True)
         
         # 判断是目录还是单文件
         if self._is_directory_url(data_source.url):
-            await self._download_sftp_directory(db, task, data_source, parsed_url, save_path)
+            await self._download_sftp_directory(db, task, data_source, parsed_url, save_path, progress)
         else:
-            await self._download_sftp_single_file(db, task, data_source, parsed_url, save_path)
+            await self._download_sftp_single_file(db, task, data_source, parsed_url, save_path, progress)
 
-    async def _download_sftp_single_file(self, db: Session, task, data_source, parsed_url, save_path: Path):
-        """SFTP单文件下载"""
-        def sftp_download():
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
+    async def _download_sftp_single_file(self, db: Session, task, data_source, parsed_url, save_path: Path,
+                                         progress: ProgressAggregator):
+        """SFTP单文件下载（共享 SSH 连接，预取流水线读取）"""
+        filename = Path(parsed_url.path).name
+        filepath = save_path / filename
+        # 任务被暂停/取消时通知工作线程中止传输
+        stop_event = threading.Event()
+        progress.update(current_file=filename)
+        
+        def sftp_download(resume: bool):
+            sftp = sftp_pool.open_sftp(data_source, parsed_url)
             try:
-                ssh.connect(
-                    hostname=parsed_url.hostname,
-                    port=parsed_url.port or 22,
-                    username=data_source.username,
-                    password=data_source.password
-                )
-                
-                sftp = ssh.open_sftp()
-                
-                filename = Path(parsed_url.path).name
-                filepath = save_path / filename
-                
                 # 获取文件大小
-                try:
-                    file_stat = sftp.stat(parsed_url.path)
-                    file_size = file_stat.st_size
-                    if file_size:
-                        fresh_task = crud_download_task.get(db, task.id)
-                        if fresh_task:
-                            crud_download_task.update(db, db_obj=fresh_task, obj_in={"file_size": file_size})
-                except:
-                    file_size = 0
-                
-                # 下载文件并跟踪进度
-                downloaded_size = 0
-                
-                def progress_callback(transferred, total):
-                    nonlocal downloaded_size
-                    downloaded_size = transferred
-                    
-                    # 更新进度
-                    if total > 0:
-                        progress = (transferred / total) * 100
-                        crud_download_task.update_progress(
-                            db, task_id=task.id, progress=progress, downloaded_size=transferred
-                        )
-                
-                sftp.get(parsed_url.path, str(filepath), callback=progress_callback)
-                
-                sftp.close()
-                ssh.close()
+                file_size = sftp.stat(parsed_url.path).st_size or 0
+                progress.set_total_size(file_size)
                 
+                expected = self._sftp_fetch_sidecar(sftp, parsed_url.path)
+                algorithm = self._checksum_algorithm(expected)
+                hasher = new_hasher(algorithm) if algorithm else None
+                extractor = self._create_extractor(task, filepath)
+                downloaded_size = self._sftp_retrieve(
+                    sftp, parsed_url.path, filepath, file_size, progress, stop_event, hasher=hasher,
+                    resume=resume, timeout=task.timeout, extractor=extractor
+                )
+                if hasher:
+                    self._verify_checksum(
+                        progress, filepath, {'algorithm': hasher.name, 'value': hasher.hexdigest()}, expected,
+                        extractor=extractor
+                    )
                 return downloaded_size
-                
-            except Exception as e:
-                if ssh:
-                    ssh.close()
-                raise e
+            finally:
+                sftp.close()
 
-        # Run SFTP download in thread pool
+        # Run SFTP download in thread pool with periodic progress flushes
         loop = asyncio.get_event_loop()
-        downloaded_size = await loop.run_in_executor(None, sftp_download)
-        
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": downloaded_size,
-            "status": "completed",
-            "files_downloaded": 1
-        })
+        update_task = asyncio.create_task(self._flush_progress_periodically(progress))
         
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
+        try:
+            # 每次重试打开新的 SFTP 通道，并从 .part 中已接收的字节续传
+            await RetryPolicy.for_task(task).run(
+                lambda attempt: loop.run_in_executor(None, sftp_download, attempt > 0),
+                f"SFTP file {parsed_url.path}"
+            )
+        except Exception:
+            # 重试耗尽的失败删除 .part；暂停/关闭引发的 CancelledError 保留它以便续传
+            self._part_path(filepath).unlink(missing_ok=True)
+            raise
+        finally:
+            stop_event.set()
+            update_task.cancel()
+        
+        if download_store.is_enabled_for(task) and not self._extracts(task, filepath):
+            await self._ingest_into_store(db, task, filepath, progress, url=data_source.url)
+        await self._submit_for_conversion(task.id, filepath, filename)
+        progress.set_metadata('resume', None)
+        await progress.finish(status="completed", files_downloaded=1)
 
-    async def _download_sftp_directory(self, db: Session, task, data_source, parsed_url, save_path: Path):
-        """SFTP目录下载"""
+    async def _download_sftp_directory(self, db: Session, task, data_source, parsed_url, save_path: Path,
+                                       progress: ProgressAggregator):
+        """SFTP目录下载：在同一 SSH 连接上通过多个 SFTP 通道并行传输"""
         pattern = self._get_file_pattern(task.filename_pattern)
         regex_pattern = re.compile(pattern, re.IGNORECASE)
+        incremental = bool(self._get_task_option(task, 'incremental', False))
+        manifest = dict(progress.metadata.get('manifest') or {})
+        remote_path = parsed_url.path or '/'
+        use_store = download_store.is_enabled_for(task)
+        stop_event = threading.Event()
+        loop = asyncio.get_event_loop()
         
-        def sftp_list_and_download():
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            
+        def list_files():
+            sftp = sftp_pool.open_sftp(data_source, parsed_url)
             try:
-                ssh.connect(
-                    hostname=parsed_url.hostname,
-                    port=parsed_url.port or 22,
-                    username=data_source.username,
-                    password=data_source.password
+                # listdir_attr 一次返回所有条目的属性，无需逐个 stat
+                entries = sftp.listdir_attr(remote_path)
+                matching = [
+                    attr for attr in entries
+                    if not stat.S_ISDIR(attr.st_mode or 0) and regex_pattern.match(attr.filename)
+                ]
+                return matching, {attr.filename for attr in entries}
+            finally:
+                sftp.close()
+        
+        retry_policy = RetryPolicy.for_task(task)
+        
+        # 获取目录文件列表并过滤符合模式的文件
+        matching_files, listed_names = await retry_policy.run(
+            lambda attempt: loop.run_in_executor(None, list_files), f"SFTP listing of {remote_path}"
+        )
+        
+        if not matching_files:
+            raise Exception(f"在SFTP目录中未找到符合模式 '{task.filename_pattern}' 的文件")
+        
+        failed_files: List[str] = []
+        matching_files = self._after_high_water_mark(
+            task, progress, matching_files, lambda attr: attr.filename, failed_files
+        )
+        if not matching_files:
+            await self._finish_up_to_date(task, progress)
+            return
+        
+        logger.info(f"Found {len(matching_files)} files to download from SFTP directory")
+        
+        total_files = len(matching_files)
+        downloaded_files = 0
+        skipped_files = 0
+        skipped_bytes = 0
+        checksum_failures: List[str] = []
+        channel_count = max(1, min(
+            int(self._get_task_option(task, 'parallel_files', settings.DOWNLOAD_MAX_PARALLEL_FILES)),
+            settings.SFTP_MAX_CHANNELS_PER_TASK,
+            total_files
+        ))
+        # 各文件完成比例由工作线程更新，汇总为总体进度
+        tracker = self._directory_progress(task, progress, [attr.filename for attr in matching_files])
+        
+        def report_fraction(filename: str, fraction: float):
+            progress.update(progress=tracker.report(filename, fraction))
+        
+        def fetch_file(sftp: paramiko.SFTPClient, attr, resume: bool) -> bool:
+            """在工作线程中下载单个文件；增量同步判定未变化时返回 False
+
+            resume 为 True（重试）时从 .part 中已接收的字节续传。
+            """
+            filename = attr.filename
+            local_filepath = save_path / filename
+            file_size = attr.st_size or 0
+            
+            # 增量同步：stat 的大小/修改时间与清单一致则跳过
+            if incremental and self._is_unchanged(
+                manifest.get(filename), local_filepath, size=file_size, mtime=attr.st_mtime
+            ):
+                return False
+            
+            progress.update(current_file=filename)
+            remote_file = f"{remote_path.rstrip('/')}/{filename}"
+            expected = self._sftp_fetch_sidecar(sftp, remote_file, available=listed_names)
+            algorithm = self._checksum_algorithm(expected)
+            hasher = new_hasher(algorithm) if algorithm else None
+            extractor = self._create_extractor(task, local_filepath)
+            self._sftp_retrieve(
+                sftp, remote_file, local_filepath, file_size, progress, stop_event,
+                on_data=lambda size: report_fraction(filename, size / file_size if file_size > 0 else 0.0),
+                hasher=hasher, resume=resume, timeout=task.timeout, extractor=extractor
+            )
+            if hasher:
+                self._verify_checksum(
+                    progress, local_filepath, {'algorithm': hasher.name, 'value': hasher.hexdigest()}, expected,
+                    extractor=extractor
                 )
-                
-                sftp = ssh.open_sftp()
-                
-                # 获取目录文件列表
-                remote_path = parsed_url.path or '/'
-                files = sftp.listdir(remote_path)
-                
-                # 过滤符合模式的文件
-                matching_files = []
-                for f in files:
-                    # 检查是否为文件（非目录）
-                    try:
-                        remote_file_path = f"{remote_path.rstrip('/')}/{f}"
-                        stat = sftp.stat(remote_file_path)
-                        if not stat.st_mode & 0o040000:  # 不是目录
-                            if regex_pattern.match(f):
-                                matching_files.append(f)
-                    except:
-                        continue
-                
-                if not matching_files:
-                    raise Exception(f"在SFTP目录中未找到符合模式 '{task.filename_pattern}' 的文件")
-                
-                logger.info(f"Found {len(matching_files)} files to download from SFTP directory")
-                
-                total_files = len(matching_files)
-                downloaded_files = 0
-                total_downloaded_size = 0
-                
-                for i, filename in enumerate(matching_files):
+            return True
+        
+        pending_files = iter(matching_files)
+        
+        async def channel_worker():
+            """每个工作协程持有一个 SFTP 通道，依次领取待下载文件"""
+            nonlocal downloaded_files, skipped_files, skipped_bytes
+            sftp = None
+            
+            async def transfer(attr, attempt: int) -> bool:
+                nonlocal sftp
+                if sftp is None:
+                    sftp = await loop.run_in_executor(None, sftp_pool.open_sftp, data_source, parsed_url)
+                try:
+                    return await loop.run_in_executor(None, fetch_file, sftp, attr, attempt > 0)
+                except Exception:
+                    # 通道可能已损坏，重试或下一个文件时重新打开
+                    sftp.close()
+                    sftp = None
+                    raise
+            
+            try:
+                for attr in pending_files:
+                    filename = attr.filename
+                    file_url = f"{data_source.url.rstrip('/')}/{filename}"
+                    # listdir_attr 已给出大小和修改时间，可在传输前按 URL + 校验头查找下载存储
+                    validator = f"{attr.st_size}:{attr.st_mtime}"
+                    # 解压的文件不保留压缩包本身，不使用下载存储
+                    file_uses_store = use_store and not self._extracts(task, save_path / filename)
                     try:
-                        remote_file_path = f"{remote_path.rstrip('/')}/{filename}"
-                        local_filepath = save_path / filename
-                        
-                        # 获取文件大小
-                        try:
-                            file_stat = sftp.stat(remote_file_path)
-                            file_size = file_stat.st_size
-                        except:
-                            file_size = 0
-                        
-                        downloaded_size = 0
-                        
-                        def progress_callback(transferred, total):
-                            nonlocal downloaded_size, total_downloaded_size
-                            # 计算此文件的下载进度
-                            file_progress = (transferred / total * 100) if total > 0 else 0
-                            
-                            # 更新总下载大小
-                            size_diff = transferred - downloaded_size
-                            total_downloaded_size += size_diff
-                            downloaded_size = transferred
-                            
-                            # 计算总体进度
-                            overall_progress = ((i + file_progress / 100) / total_files) * 100
-                            
-                            crud_download_task.update_progress(
-                                db, task_id=task.id, progress=overall_progress, downloaded_size=total_downloaded_size
-                            )
-                        
-                        sftp.get(remote_file_path, str(local_filepath), callback=progress_callback)
-                        
-                        downloaded_files += 1
-                        logger.info(f"Successfully downloaded {filename} via SFTP")
-                        
+                        if file_uses_store and not (incremental and self._is_unchanged(
+                            manifest.get(filename), save_path / filename, size=attr.st_size or 0, mtime=attr.st_mtime
+                        )):
+                            if await self._link_from_store(
+                                db, task, save_path / filename, progress, url=file_url, validator=validator
+                            ) is not None:
+                                downloaded_files += 1
+                                await self._submit_for_conversion(task.id, save_path / filename, filename)
+                                if incremental:
+                                    progress.set_metadata_item('manifest', filename, {
+                                        'size': attr.st_size,
+                                        'mtime': attr.st_mtime
+                                    })
+                                continue
+                        transferred = await retry_policy.run(
+                            lambda attempt: transfer(attr, attempt), f"SFTP file {filename}"
+                        )
+                        if transferred:
+                            downloaded_files += 1
+                            logger.info(f"Successfully downloaded {filename} via SFTP")
+                            if file_uses_store:
+                                await self._ingest_into_store(
+                                    db, task, save_path / filename, progress, url=file_url, validator=validator
+                                )
+                            await self._submit_for_conversion(task.id, save_path / filename, filename)
+                            if incremental:
+                                progress.set_metadata_item('manifest', filename, {
+                                    'size': attr.st_size,
+                                    'mtime': attr.st_mtime,
+                                    'extracted': self._extracted_files(progress, save_path / filename)
+                                })
+                        else:
+                            skipped_files += 1
+                            skipped_bytes += attr.st_size or 0
+                    except asyncio.CancelledError:
+                        raise
+                    except ChecksumMismatchError as e:
+                        checksum_failures.append(filename)
+                        logger.error(f"Checksum verification failed for SFTP file {filename}: {e}")
                     except Exception as e:
                         logger.error(f"Failed to download SFTP file {filename}: {e}")
-                        continue
-                
-                sftp.close()
-                ssh.close()
-                
-                return downloaded_files, total_downloaded_size, total_files
-                
-            except Exception as e:
-                if ssh:
-                    ssh.close()
-                raise e
-
-        # Run SFTP download in thread pool with periodic WebSocket updates
-        loop = asyncio.get_event_loop()
+                        failed_files.append(filename)
+                        self._part_path(save_path / filename).unlink(missing_ok=True)
+                    finally:
+                        report_fraction(filename, 1.0)
+                        progress.update(
+                            files_completed=downloaded_files,
+                            files_skipped=skipped_files,
+                            total_files=total_files
+                        )
+                    await progress.tick()
+            finally:
+                if sftp is not None:
+                    sftp.close()
         
-        # Start a task to send periodic WebSocket updates
-        update_task = asyncio.create_task(self._send_periodic_updates(db, task.id, lambda: True))
+        # Run transfers over parallel SFTP channels with periodic progress flushes
+        update_task = asyncio.create_task(self._flush_progress_periodically(progress))
         
         try:
-            downloaded_files, total_downloaded_size, total_files = await loop.run_in_executor(None, sftp_list_and_download)
+            await asyncio.gather(*(channel_worker() for _ in range(channel_count)))
         finally:
+            stop_event.set()
             update_task.cancel()
         
-        if downloaded_files == 0:
+        self._raise_for_checksum_failures(checksum_failures)
+        if downloaded_files == 0 and skipped_files == 0:
             raise Exception("所有SFTP文件下载均失败")
         
-        # Send completion update
-        await self._send_progress_update(task.id, {
-            "progress": 100.0,
-            "downloaded_size": total_downloaded_size,
-            "status": "completed",
-            "files_downloaded": downloaded_files,
-            "total_files": total_files
-        })
-        
-        crud_download_task.set_status(db, task_id=task.id, status="completed")
-        crud_download_task.update_progress(db, task_id=task.id, progress=100.0)
+        progress.set_metadata('resume', None)
+        self._record_sync_summary(progress, incremental, downloaded_files, skipped_files, skipped_bytes)
+        await progress.finish(
+            status="completed",
+            files_downloaded=downloaded_files,
+            files_skipped=skipped_files,
+            skipped_bytes=skipped_bytes,
+            total_files=total_files
+        )
+
+    def _sftp_retrieve(self, sftp: paramiko.SFTPClient, remote_path: str, filepath: Path, file_size: int,
+                       progress: ProgressAggregator, stop_event: threading.Event,
+                       on_data: Optional[Callable[[int], None]] = None, hasher=None,
+                       resume: bool = False, timeout: Optional[int] = None,
+                       extractor: Optional[StreamExtractor] = None) -> int:
+        """在工作线程中以预取流水线读取远端文件（同时保持多个未完成的读请求），传入 hasher 时增量计算摘要
+
+        resume 为 True（重试）时从 .part 文件末尾的偏移量继续读取；timeout 为通道读超时（DownloadTask.timeout）。
+        传输失败或中止（暂停/关闭）时保留 .part 并在 task_metadata['resume'] 中登记，下次运行远端大小未变时直接续传；
+        取消任务时由 _discard_partial_files 删除。传入 extractor 时数据块直接解压/解包，不写 .part。
+        """
+        part_path = self._part_path(filepath)
+        resume = resume or self._has_resumable_part(progress, remote_path, file_size)
+        if timeout:
+            sftp.get_channel().settimeout(timeout)
+        offset = part_path.stat().st_size if resume and extractor is None and part_path.exists() else 0
+        if offset and file_size and offset >= file_size:
+            offset = 0
+        if offset:
+            logger.info(f"Resuming SFTP download of {remote_path} from byte {offset}")
+            if hasher:
+                update_from_file(hasher, part_path, offset)
+        downloaded_size = offset
+        progress.add(offset)
+        if on_data:
+            on_data(downloaded_size)
+        if extractor is None:
+            progress.set_metadata_item('resume', remote_path, {'filename': filepath.name, 'size': file_size})
+        try:
+            with sftp.open(remote_path, 'rb', bufsize=settings.SFTP_BUFFER_SIZE) as remote_file:
+                if offset:
+                    remote_file.seek(offset)
+                # 限速时不预取：预取线程不受读取速度约束，会把整个文件缓冲到内存中
+                if not bandwidth_limiter.is_limited(progress.task_id):
+                    remote_file.prefetch(file_size or None, settings.SFTP_MAX_CONCURRENT_PREFETCH)
+                # 先写入 .part 再替换，不会改写可能与下载存储共享 inode 的旧文件
+                with open(part_path, 'ab' if offset else 'wb') if extractor is None else nullcontext() as f:
+                    write = f.write if extractor is None else extractor.feed
+                    while True:
+                        if stop_event.is_set():
+                            raise Exception("SFTP传输已中止")
+                        data = remote_file.read(settings.SFTP_BUFFER_SIZE)
+                        if not data:
+                            break
+                        write(data)
+                        if hasher:
+                            hasher.update(data)
+                        downloaded_size += len(data)
+                        progress.add(len(data))
+                        if on_data:
+                            on_data(downloaded_size)
+                        bandwidth_limiter.throttle_blocking(progress.task_id, len(data), stop_event)
+            
+            if file_size and downloaded_size != file_size:
+                raise Exception(f"文件传输不完整: {downloaded_size}/{file_size} 字节")
+            if extractor is not None:
+                extractor.finish()
+                self._record_extracted(progress, filepath, extractor)
+            else:
+                part_path.replace(filepath)
+                progress.set_metadata_item(
+                    'resume', remote_path, {'filename': filepath.name, 'size': file_size, 'completed': True}
+                )
+        except BaseException:
+            progress.add(-downloaded_size)
+            if extractor is not None:
+                extractor.discard()
+            raise
+        return downloaded_size
+
+    def _sftp_fetch_sidecar(self, sftp: paramiko.SFTPClient, remote_path: str,
+                            available: Optional[Set[str]] = None) -> Optional[Dict[str, str]]:
+        """在工作线程中读取SFTP上的 .sha256/.md5 校验文件"""
+        if not settings.DOWNLOAD_VERIFY_CHECKSUMS:
+            return None
+        filename = remote_path.rsplit('/', 1)[-1]
+        for extension, algorithm in SIDECAR_ALGORITHMS.items():
+            if available is not None and filename + extension not in available:
+                continue
+            try:
+                with sftp.open(remote_path + extension, 'rb') as sidecar:
+                    content = sidecar.read()
+            except IOError:
+                continue
+            value = parse_sidecar(content.decode('utf-8', errors='replace'), filename, algorithm)
+            if value:
+                return {'algorithm': algorithm, 'value': value}
+        return None
 
     async def _send_progress_update(self, task_id: int, update_data: dict):
         """Send real-time progress update via WebSocket"""
+        if update_data.get('status') == 'running':
+            update_data['download_rate'] = bandwidth_limiter.get_task_rate(task_id)
         try:
             websocket_manager = get_websocket_manager()
             await websocket_manager.send_task_update(task_id, update_data)
         except Exception as e:
             logger.error(f"Failed to send WebSocket update for task {task_id}: {e}")
 
-    async def _send_periodic_updates(self, db: Session, task_id: int, should_continue_func):
-        """Send periodic WebSocket updates for FTP/SFTP downloads"""
+    async def _flush_progress_periodically(self, progress: ProgressAggregator):
+        """Flush buffered progress for FTP/SFTP downloads running in worker threads"""
         try:
-            while should_continue_func():
-                await asyncio.sleep(2)  # Update every 2 seconds
-                
-                # Get current task progress from database
-                task = crud_download_task.get(db, task_id)
-                if task and task.status == "running":
-                    await self._send_progress_update(task_id, {
-                        "progress": task.progress,
-                        "downloaded_size": task.downloaded_size or 0,
-                        "status": "running"
-                    })
-                else:
-                    break
+            while True:
+                await asyncio.sleep(progress.flush_interval)
+                await progress.tick()
                     
         except asyncio.CancelledError:
             # Task was cancelled, which is expected
             pass
         except Exception as e:
-            logger.error(f"Error in periodic updates for task {task_id}: {e}")
+            logger.error(f"Error in periodic updates for task {progress.task_id}: {e}")
 
 # Global instance
 download_service = DownloadService()
\ No newline at end of file
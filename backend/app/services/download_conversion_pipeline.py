@@ -0,0 +1,134 @@
+import asyncio
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+from app.core.config import settings
+from app.crud.crud_nc_file import conversion_task as crud_conversion_task
+from app.db.session import SessionLocal
+from app.schemas.nc_file import ConversionTaskCreate
+from app.services.progress_aggregator import ProgressAggregator
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadConversionPipeline:
+    """下载-转换流水线
+
+    下载完成的文件放入有界队列，由若干转换工作协程依次创建转换任务并交给 DataConversionService，
+    转换与剩余文件的下载同时进行；队列已满时 submit 会等待，对下载施加背压。
+    每个文件的转换结果记录在 task_metadata['conversions'][文件名]，生成的 NCFile id 记录在
+    task_metadata['nc_file_ids']。
+    """
+
+    def __init__(
+        self,
+        task_id: int,
+        progress: ProgressAggregator,
+        conversion_options: Optional[Dict[str, Any]] = None,
+        workers: Optional[int] = None,
+        queue_size: Optional[int] = None
+    ):
+        self.task_id = task_id
+        self.progress = progress
+        self.conversion_options = conversion_options
+        self.worker_count = max(1, workers or settings.DOWNLOAD_CONVERSION_WORKERS)
+        self.queue: "asyncio.Queue[Tuple[Path, str]]" = asyncio.Queue(
+            maxsize=max(1, queue_size or settings.DOWNLOAD_CONVERSION_QUEUE_SIZE)
+        )
+        self.nc_file_ids: List[int] = list(progress.metadata.get('nc_file_ids') or [])
+        self.converted_files = 0
+        self.failed_files = 0
+        self._pending = 0  # 已提交但尚未转换完成的文件数
+        self._workers: List[asyncio.Task] = []
+        # 转换任务的数据库操作使用独立会话，不与下载共用
+        self._db = SessionLocal()
+
+    def start(self):
+        """启动转换工作协程"""
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.worker_count)]
+
+    async def submit(self, filepath: Path, name: str):
+        """提交一个已下载完成的文件，队列已满时等待"""
+        self.progress.set_metadata_item('conversions', name, {'status': 'queued'})
+        self._pending += 1
+        await self.queue.put((filepath, name))
+
+    async def drain(self) -> Dict[str, Any]:
+        """等待队列中的文件全部转换完成并停止工作协程，返回汇总字段"""
+        if self._pending:
+            self.progress.update(current_file=None, converting=True)
+            await self.progress.flush()
+        await self.queue.join()
+        await self.close()
+        self.progress.update(converting=False)
+        return {
+            'files_converted': self.converted_files,
+            'conversion_failures': self.failed_files
+        }
+
+    async def close(self):
+        """停止工作协程并释放会话（任务暂停/取消时调用；已在线程中运行的转换会继续完成）"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._db.close()
+
+    async def _worker(self):
+        while True:
+            filepath, name = await self.queue.get()
+            try:
+                await self._convert(filepath, name)
+            except Exception as e:
+                self.failed_files += 1
+                logger.error(f"Conversion of downloaded file {name} (task {self.task_id}) failed: {e}")
+                self.progress.set_metadata_item('conversions', name, {'status': 'failed', 'error': str(e)})
+            finally:
+                self._pending -= 1
+                self.queue.task_done()
+
+    async def _convert(self, filepath: Path, name: str):
+        # 避免在模块导入时加载 xarray/netCDF4 等转换依赖
+        from app.services.data_conversion_service import conversion_service
+
+        loop = asyncio.get_event_loop()
+        file_format = await loop.run_in_executor(None, conversion_service.detect_format, str(filepath))
+        if file_format not in conversion_service.supported_formats:
+            logger.info(f"Skipping conversion of {name}: unsupported format '{file_format}'")
+            self.progress.set_metadata_item('conversions', name, {'status': 'skipped', 'format': file_format})
+            return
+
+        conversion_task = crud_conversion_task.create(self._db, obj_in=ConversionTaskCreate(
+            original_file_path=str(filepath),
+            original_filename=filepath.name,
+            original_format=file_format,
+            conversion_options=self.conversion_options
+        ))
+        self.progress.set_metadata_item('conversions', name, {
+            'status': 'processing',
+            'conversion_task_id': conversion_task.id
+        })
+
+        nc_file_id = await conversion_service.run_conversion_in_thread(self._db, conversion_task.id)
+        if nc_file_id is None:
+            self.failed_files += 1
+            task = crud_conversion_task.get(self._db, conversion_task.id)
+            self.progress.set_metadata_item('conversions', name, {
+                'status': 'failed',
+                'conversion_task_id': conversion_task.id,
+                'error': task.error_message if task else None
+            })
+            return
+
+        self.converted_files += 1
+        if nc_file_id not in self.nc_file_ids:
+            self.nc_file_ids.append(nc_file_id)
+        self.progress.set_metadata('nc_file_ids', list(self.nc_file_ids))
+        self.progress.set_metadata_item('conversions', name, {
+            'status': 'completed',
+            'conversion_task_id': conversion_task.id,
+            'nc_file_id': nc_file_id
+        })
+        self.progress.update(files_converted=self.converted_files)
+        logger.info(f"Converted downloaded file {name} (task {self.task_id}) into NC file {nc_file_id}")
@@ -0,0 +1,203 @@
+import asyncio
+import os
+import shutil
+import stat
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.crud.crud_download_store import download_store as crud_download_store
+from app.models.download_store import StoredObject
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Linux ioctl：在支持的文件系统（btrfs、XFS 等）上创建共享数据块的写时复制副本
+FICLONE = 0x40049409
+
+
+class DownloadStore:
+    """内容寻址的下载存储，用于跨任务去重
+
+    文件按校验和存放在 DOWNLOAD_STORE_DIR/<algorithm>/<前两位>/<checksum>，同时以 URL + 校验头建立索引。
+    任务需要的文件已在存储中时，直接在其保存目录中创建 reflink 或硬链接，无需再次传输；
+    每个链接记录为一条引用，引用计数归零且没有任何链接文件时才会被垃圾回收。
+    """
+
+    def is_enabled_for(self, task) -> bool:
+        """任务是否使用存储：任务参数 dedup 优先，否则取 DOWNLOAD_STORE_ENABLED"""
+        options = (task.task_metadata or {}).get('options') or {}
+        dedup = options.get('dedup')
+        return settings.DOWNLOAD_STORE_ENABLED if dedup is None else bool(dedup)
+
+    def _object_path(self, algorithm: str, checksum: str) -> Path:
+        return Path(settings.DOWNLOAD_STORE_DIR) / algorithm / checksum[:2] / checksum
+
+    def find(self, db: Session, *, url: Optional[str] = None, validator: Optional[str] = None,
+             checksum: Optional[Dict[str, str]] = None) -> Optional[StoredObject]:
+        """按 URL + 校验头或校验和查找存储对象；对象文件已丢失时视为不存在"""
+        stored = None
+        if url and validator:
+            stored = crud_download_store.get_by_url(db, url=url, validator=validator)
+        if stored is None and checksum:
+            stored = crud_download_store.get_by_checksum(
+                db, algorithm=checksum['algorithm'], checksum=checksum['value']
+            )
+        if stored is None:
+            return None
+
+        object_path = Path(stored.storage_path)
+        if not object_path.exists() or object_path.stat().st_size != stored.size:
+            logger.warning(f"Stored object {stored.id} is missing or truncated on disk, ignoring it")
+            return None
+        return stored
+
+    async def link_into(self, db: Session, stored: StoredObject, task_id: int, dest: Path) -> int:
+        """在任务保存目录中创建指向存储对象的链接并登记引用，返回文件大小"""
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self._materialize, Path(stored.storage_path), dest)
+        crud_download_store.set_ref(db, db_obj=stored, task_id=task_id, path=str(dest))
+        return stored.size
+
+    async def ingest(self, db: Session, task_id: int, filepath: Path, checksum: Dict[str, str],
+                     url: Optional[str] = None, validator: Optional[str] = None) -> StoredObject:
+        """将刚下载的文件纳入存储
+
+        存储中已有相同内容时，用指向已有对象的链接替换该文件以释放重复空间；否则把文件链接进存储。
+        """
+        loop = asyncio.get_event_loop()
+        stored = self.find(db, checksum=checksum)
+        if stored is not None:
+            await loop.run_in_executor(None, self._materialize, Path(stored.storage_path), filepath)
+        else:
+            object_path = self._object_path(checksum['algorithm'], checksum['value'])
+            size = await loop.run_in_executor(None, self._store_file, filepath, object_path)
+            stored = crud_download_store.get_by_checksum(
+                db, algorithm=checksum['algorithm'], checksum=checksum['value']
+            )
+            if stored is None:
+                try:
+                    stored = crud_download_store.create(
+                        db, algorithm=checksum['algorithm'], checksum=checksum['value'],
+                        size=size, storage_path=str(object_path)
+                    )
+                except IntegrityError:
+                    # 并发任务已登记同一对象
+                    db.rollback()
+                    stored = crud_download_store.get_by_checksum(
+                        db, algorithm=checksum['algorithm'], checksum=checksum['value']
+                    )
+
+        if url and validator:
+            crud_download_store.add_url(db, db_obj=stored, url=url, validator=validator)
+        crud_download_store.set_ref(db, db_obj=stored, task_id=task_id, path=str(filepath))
+        return stored
+
+    def release_ref(self, db: Session, task_id: int, path: Path) -> bool:
+        """释放任务对某个文件的引用（链接的文件已被删除时调用），返回是否存在该引用"""
+        ref = crud_download_store.get_ref(db, task_id=task_id, path=str(path))
+        if ref is None:
+            return False
+        crud_download_store.remove_refs(db, refs=[ref])
+        return True
+
+    def release_task(self, db: Session, task_id: int) -> int:
+        """释放任务的所有引用（删除任务时调用），对象文件留待垃圾回收"""
+        refs = crud_download_store.get_refs_by_task(db, task_id=task_id)
+        crud_download_store.remove_refs(db, refs=refs)
+        return len(refs)
+
+    def collect_garbage(self, db: Session) -> Dict[str, Any]:
+        """回收不再被引用的对象
+
+        先清理链接文件已被删除的引用，再删除引用计数归零的对象及其 URL 索引。
+        """
+        stale_refs = [ref for ref in crud_download_store.iter_refs(db) if not Path(ref.path).exists()]
+        crud_download_store.remove_refs(db, refs=stale_refs)
+
+        removed_objects = 0
+        freed_bytes = 0
+        for stored in crud_download_store.get_unreferenced(db):
+            object_path = Path(stored.storage_path)
+            try:
+                if object_path.exists():
+                    # 硬链接仍存在时（引用记录丢失的情况）不释放空间，保留对象
+                    if object_path.stat().st_nlink > 1:
+                        continue
+                    object_path.unlink()
+                    freed_bytes += stored.size
+            except OSError as e:
+                logger.warning(f"Failed to remove stored object {object_path}: {e}")
+                continue
+            crud_download_store.remove(db, db_obj=stored)
+            removed_objects += 1
+
+        logger.info(f"Download store GC removed {removed_objects} objects, freed {freed_bytes} bytes")
+        return {
+            "stale_refs_removed": len(stale_refs),
+            "objects_removed": removed_objects,
+            "freed_bytes": freed_bytes
+        }
+
+    def get_stats(self, db: Session) -> Dict[str, Any]:
+        stats = crud_download_store.get_stats(db)
+        stats["enabled"] = settings.DOWNLOAD_STORE_ENABLED
+        stats["link_mode"] = settings.DOWNLOAD_STORE_LINK_MODE
+        return stats
+
+    def _store_file(self, filepath: Path, object_path: Path) -> int:
+        """把下载文件放入存储（与原文件共享 inode 或数据块），并设为只读防止经由链接被修改"""
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        if not object_path.exists():
+            tmp_path = object_path.with_name(object_path.name + '.tmp')
+            self._link_file(filepath, tmp_path)
+            os.replace(tmp_path, object_path)
+            os.chmod(object_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        else:
+            # 并发任务已先写入相同内容，让下载文件指向存储中的对象
+            self._materialize(object_path, filepath)
+        return object_path.stat().st_size
+
+    def _materialize(self, source: Path, dest: Path):
+        """以链接方式在 dest 生成 source 的副本，原子替换已有文件"""
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if dest.exists() and os.path.samefile(source, dest):
+            return
+        tmp_path = dest.with_name(dest.name + '.link')
+        tmp_path.unlink(missing_ok=True)
+        self._link_file(source, tmp_path)
+        os.replace(tmp_path, dest)
+
+    def _link_file(self, source: Path, dest: Path):
+        """按 DOWNLOAD_STORE_LINK_MODE 创建链接：reflink、hardlink 或 auto（先 reflink 再硬链接）
+
+        跨文件系统等无法链接的情况退化为复制，只节省网络传输。
+        """
+        mode = settings.DOWNLOAD_STORE_LINK_MODE
+        if mode in ("auto", "reflink"):
+            try:
+                self._reflink(source, dest)
+                return
+            except (OSError, ImportError) as e:
+                dest.unlink(missing_ok=True)
+                if mode == "reflink":
+                    logger.warning(f"Reflink not supported for {dest}, copying instead: {e}")
+                    shutil.copy2(source, dest)
+                    return
+        try:
+            os.link(source, dest)
+        except OSError as e:
+            logger.warning(f"Hardlink not possible for {dest}, copying instead: {e}")
+            shutil.copy2(source, dest)
+
+    def _reflink(self, source: Path, dest: Path):
+        import fcntl
+        with open(source, 'rb') as src, open(dest, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+# Global instance
+download_store = DownloadStore()
@@ -0,0 +1,106 @@
+import ftplib
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Iterator
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FTPConnectionPool:
+    """按数据源复用已登录的 FTP 连接
+
+    ftplib 是阻塞库，连接的借出/归还都在线程池中进行。每个数据源的并发连接数受信号量限制，
+    空闲连接在超过 FTP_POOL_IDLE_TIMEOUT 后关闭，借出前用 NOOP 检查连接是否仍然可用。
+    """
+
+    def __init__(self):
+        self._idle: Dict[int, List[Tuple[ftplib.FTP, float]]] = {}
+        self._semaphores: Dict[int, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _get_semaphore(self, source_id: int) -> threading.BoundedSemaphore:
+        with self._lock:
+            if source_id not in self._semaphores:
+                self._semaphores[source_id] = threading.BoundedSemaphore(settings.FTP_POOL_MAX_CONNECTIONS_PER_SOURCE)
+            return self._semaphores[source_id]
+
+    @contextmanager
+    def connection(self, data_source, parsed_url) -> Iterator[ftplib.FTP]:
+        """借出一个已登录的连接，使用完毕后归还；出错的连接直接丢弃"""
+        semaphore = self._get_semaphore(data_source.id)
+        semaphore.acquire()
+        ftp = None
+        try:
+            ftp = self._checkout(data_source, parsed_url)
+            yield ftp
+        except BaseException:
+            self._close(ftp)
+            ftp = None
+            raise
+        finally:
+            if ftp is not None:
+                with self._lock:
+                    self._idle.setdefault(data_source.id, []).append((ftp, time.monotonic()))
+            semaphore.release()
+
+    def _checkout(self, data_source, parsed_url) -> ftplib.FTP:
+        while True:
+            with self._lock:
+                idle = self._idle.get(data_source.id) or []
+                if not idle:
+                    break
+                ftp, released_at = idle.pop()
+
+            if time.monotonic() - released_at > settings.FTP_POOL_IDLE_TIMEOUT:
+                self._close(ftp)
+                continue
+            try:
+                ftp.voidcmd('NOOP')
+                return ftp
+            except ftplib.all_errors:
+                self._close(ftp)
+
+        ftp = ftplib.FTP(timeout=settings.FTP_POOL_CONNECT_TIMEOUT)
+        ftp.connect(parsed_url.hostname, parsed_url.port or 21)
+        if data_source.auth_required:
+            ftp.login(data_source.username, data_source.password)
+        else:
+            ftp.login()
+        logger.debug(f"Opened FTP connection to {parsed_url.hostname} for data source {data_source.id}")
+        return ftp
+
+    def _close(self, ftp):
+        if ftp is None:
+            return
+        try:
+            ftp.quit()
+        except Exception:
+            ftp.close()
+
+    def close_source(self, source_id: int):
+        """关闭某个数据源的空闲连接（数据源配置变更时调用）"""
+        with self._lock:
+            idle = self._idle.pop(source_id, [])
+        for ftp, _ in idle:
+            self._close(ftp)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._lock:
+            idle = [ftp for connections in self._idle.values() for ftp, _ in connections]
+            self._idle.clear()
+        for ftp in idle:
+            self._close(ftp)
+
+    def get_stats(self) -> Dict:
+        """连接池统计信息"""
+        with self._lock:
+            return {source_id: len(connections) for source_id, connections in self._idle.items()}
+
+
+# Global instance
+ftp_pool = FTPConnectionPool()
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClientPool:
+    """按数据源复用的 aiohttp 客户端池
+
+    同一数据源的所有下载任务共享一个 ClientSession，从而复用 keep-alive 连接和 DNS 缓存。
+    会话在应用启动时初始化、关闭时释放；数据源配置变更后调用 close_session 使其重建。
+    """
+
+    def __init__(self):
+        self._sessions: Dict[int, aiohttp.ClientSession] = {}
+        # 配置变更后被替换的会话，可能仍被进行中的任务使用，关闭时统一释放
+        self._retired: List[aiohttp.ClientSession] = []
+        self._lock: Optional[asyncio.Lock] = None
+        self.started = False
+
+    async def startup(self):
+        """应用启动时调用"""
+        self._lock = asyncio.Lock()
+        self.started = True
+        logger.info("HTTP client pool started")
+
+    async def shutdown(self):
+        """应用关闭时关闭所有会话"""
+        sessions = list(self._sessions.values()) + self._retired
+        self._sessions.clear()
+        self._retired = []
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        self.started = False
+        logger.info(f"HTTP client pool stopped ({len(sessions)} sessions closed)")
+
+    async def get_session(self, data_source) -> aiohttp.ClientSession:
+        """获取（必要时创建）数据源对应的共享会话"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            session = self._sessions.get(data_source.id)
+            if session is None or session.closed:
+                session = self._create_session(data_source)
+                self._sessions[data_source.id] = session
+                logger.info(f"Created pooled HTTP session for data source {data_source.id}")
+            return session
+
+    async def close_session(self, source_id: int):
+        """替换某个数据源的会话（数据源URL或认证信息变更时调用）
+
+        进行中的任务继续使用旧会话直至完成，后续任务获得新会话。
+        """
+        session = self._sessions.pop(source_id, None)
+        if session and not session.closed:
+            self._retired.append(session)
+        self._retired = [retired for retired in self._retired if not retired.closed]
+
+    def request_timeout(self, timeout: Optional[int]) -> aiohttp.ClientTimeout:
+        """按 DownloadTask.timeout 构建单次请求超时：限制连接建立和读取空闲时间，不限制大文件总时长"""
+        seconds = timeout or settings.HTTP_POOL_DEFAULT_TIMEOUT
+        return aiohttp.ClientTimeout(total=None, sock_connect=seconds, sock_read=seconds)
+
+    def _create_session(self, data_source) -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(
+            limit=settings.HTTP_POOL_MAX_CONNECTIONS,
+            limit_per_host=settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=settings.HTTP_POOL_DNS_CACHE_TTL,
+            keepalive_timeout=settings.HTTP_POOL_KEEPALIVE_TIMEOUT
+        )
+        auth = None
+        if data_source.auth_required and data_source.username:
+            auth = aiohttp.BasicAuth(data_source.username, data_source.password or '')
+        return aiohttp.ClientSession(
+            connector=connector,
+            auth=auth,
+            timeout=self.request_timeout(None)
+        )
+
+    def get_stats(self) -> Dict:
+        """连接池统计信息"""
+        return {
+            "sessions": len(self._sessions),
+            "source_ids": list(self._sessions.keys())
+        }
+
+
+# Global instance
+http_client_pool = HttpClientPool()
@@ -0,0 +1,180 @@
+import asyncio
+import html
+import re
+import time
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urldefrag
+
+import aiohttp
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 匹配 <a ... href=...>，支持双引号、单引号和无引号属性值
+_HREF_RE = re.compile(
+    rb'<a\s[^>]*?href\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s>"\']+))',
+    re.IGNORECASE
+)
+_IGNORED_PREFIXES = ('?', '#', 'mailto:', 'javascript:')
+
+
+@dataclass
+class _CachedListing:
+    fetched_at: float
+    etag: Optional[str]
+    last_modified: Optional[str]
+    links: List[str]
+
+
+class HttpDirectoryCrawler:
+    """HTTP 目录索引爬取器（Apache/nginx autoindex、THREDDS HTML 目录等）
+
+    - 边接收边用正则提取链接，不构建完整的 DOM；
+    - 按层并发抓取子目录页面，递归深度可配置；
+    - 每个索引页按数据源缓存 HTTP_LISTING_CACHE_TTL 秒，过期后以 If-None-Match/If-Modified-Since 重新验证。
+    """
+
+    def __init__(self):
+        self._cache: "OrderedDict[Tuple[int, str], _CachedListing]" = OrderedDict()
+
+    async def list_files(
+        self,
+        session: aiohttp.ClientSession,
+        source_id: int,
+        url: str,
+        pattern: str,
+        max_depth: int = 0,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        all_names: Optional[Set[str]] = None
+    ) -> List[str]:
+        """列出目录（及 max_depth 层子目录）中文件名符合 pattern 的文件URL
+
+        all_names 用于收集所有页面中出现的文件名（判断校验文件是否存在）。
+        """
+        regex_pattern = re.compile(pattern, re.IGNORECASE)
+        root = url if url.endswith('/') else url + '/'
+        semaphore = asyncio.Semaphore(settings.HTTP_LISTING_CONCURRENCY)
+        visited = {root}
+        level = [root]
+        depth = 0
+        file_urls: Dict[str, None] = {}
+
+        while level:
+            listings = await asyncio.gather(*(
+                self._get_listing(session, source_id, page_url, timeout, semaphore) for page_url in level
+            ))
+            next_level = []
+            for links in listings:
+                for link in links:
+                    if self._is_subdirectory(link):
+                        # 只进入根目录之下的子目录，忽略上级目录和排序链接
+                        if depth < max_depth and link.startswith(root) and link not in visited:
+                            visited.add(link)
+                            next_level.append(link)
+                        continue
+
+                    filename = link.rstrip('/').rsplit('/', 1)[-1]
+                    if all_names is not None:
+                        all_names.add(filename)
+                    if regex_pattern.match(filename):
+                        file_urls[link] = None
+            level = next_level
+            depth += 1
+
+        logger.info(f"Listed {len(visited)} index pages under {url}, {len(file_urls)} matching files")
+        return list(file_urls)
+
+    def invalidate(self, source_id: Optional[int] = None):
+        """清除某个数据源（默认全部）的缓存目录列表"""
+        if source_id is None:
+            self._cache.clear()
+            return
+        for key in [key for key in self._cache if key[0] == source_id]:
+            del self._cache[key]
+
+    def _is_subdirectory(self, link: str) -> bool:
+        return link.endswith('/') or link.endswith('/catalog.html')
+
+    async def _get_listing(
+        self,
+        session: aiohttp.ClientSession,
+        source_id: int,
+        page_url: str,
+        timeout: Optional[aiohttp.ClientTimeout],
+        semaphore: asyncio.Semaphore
+    ) -> List[str]:
+        """获取单个索引页中的所有链接（绝对URL），优先使用缓存"""
+        key = (source_id, page_url)
+        cached = self._cache.get(key)
+        ttl = settings.HTTP_LISTING_CACHE_TTL
+        if cached and time.monotonic() - cached.fetched_at < ttl:
+            self._cache.move_to_end(key)
+            return cached.links
+
+        headers = {}
+        if cached and ttl > 0:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+
+        async with semaphore:
+            async with session.get(page_url, headers=headers, timeout=timeout) as response:
+                if response.status == 304 and cached:
+                    cached.fetched_at = time.monotonic()
+                    self._cache.move_to_end(key)
+                    return cached.links
+                if response.status != 200:
+                    raise Exception(f"Failed to access directory: HTTP {response.status}")
+
+                # 重定向（如补全末尾斜杠）后以最终URL解析相对链接
+                links = await self._parse_links(response.content, str(response.url))
+                listing = _CachedListing(
+                    fetched_at=time.monotonic(),
+                    etag=response.headers.get('ETag'),
+                    last_modified=response.headers.get('Last-Modified'),
+                    links=links
+                )
+
+        if ttl > 0:
+            self._cache[key] = listing
+            self._cache.move_to_end(key)
+            while len(self._cache) > settings.HTTP_LISTING_CACHE_MAX_PAGES:
+                self._cache.popitem(last=False)
+        return links
+
+    async def _parse_links(self, content: aiohttp.StreamReader, base_url: str) -> List[str]:
+        """流式提取页面中的链接"""
+        links: List[str] = []
+        buffer = b''
+        async for chunk in content.iter_chunked(64 * 1024):
+            buffer += chunk
+            # 最后一个 '<' 之后可能是被截断的标签，留到下一块再解析
+            cut = buffer.rfind(b'<')
+            if cut <= 0:
+                continue
+            self._collect_links(buffer[:cut], base_url, links)
+            buffer = buffer[cut:]
+        self._collect_links(buffer, base_url, links)
+        return links
+
+    def _collect_links(self, data: bytes, base_url: str, links: List[str]):
+        for match in _HREF_RE.finditer(data):
+            raw = match.group(1) or match.group(2) or match.group(3) or b''
+            href = html.unescape(raw.decode('utf-8', errors='replace')).strip()
+            if not href or href.startswith(_IGNORED_PREFIXES):
+                continue
+            link, _ = urldefrag(urljoin(base_url, href))
+            links.append(link)
+
+    def get_stats(self) -> Dict:
+        """缓存统计信息"""
+        return {"cached_pages": len(self._cache)}
+
+
+# Global instance
+http_directory_crawler = HttpDirectoryCrawler()
@@ -0,0 +1,469 @@
+import asyncio
+import itertools
+import logging
+import threading
+from dataclasses import dataclass, asdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote, urlparse
+
+import aiohttp
+import numpy as np
+from yarl import URL
+
+from app.core.config import settings
+from app.services.bandwidth_limiter import bandwidth_limiter
+from app.services.progress_aggregator import ProgressAggregator
+from app.utils.dap2 import (
+    DapArray, DapDataset, DapGrid, NATIVE_TYPES, hyperslab, parse_das, parse_dds, parse_dods
+)
+from app.utils.retry import HttpStatusError, RetryPolicy, parse_retry_after
+
+logger = logging.getLogger(__name__)
+
+# netCDF-C/HDF5 不是线程安全的，所有写文件操作串行执行
+_netcdf_lock = threading.Lock()
+
+_DAP_SUFFIXES = ('.html', '.dds', '.das', '.dods', '.info', '.ascii')
+_LAT_UNITS = {'degrees_north', 'degree_north', 'degree_n', 'degrees_n', 'degreen', 'degreesn'}
+_LON_UNITS = {'degrees_east', 'degree_east', 'degree_e', 'degrees_e', 'degreee', 'degreese'}
+
+
+@dataclass
+class SubsetRequest:
+    """服务端裁剪条件：变量列表（为空时取全部数据变量）、经纬度范围 [west, south, east, north] 和时间窗口"""
+    variables: List[str]
+    bbox: Optional[List[float]] = None
+    time_start: Optional[str] = None
+    time_end: Optional[str] = None
+
+    def signature(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class _Slice:
+    """一次 .dods 请求：源数据下标范围和写入输出变量的位置"""
+    variable: str
+    request_path: str
+    source: List[Tuple[int, int]]
+    target: Tuple[slice, ...]
+    nbytes: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.variable}:" + ','.join(str(start) for start, _ in self.source)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(stop - start + 1 for start, stop in self.source)
+
+
+class OpendapSubsetter:
+    """OPeNDAP (DAP2) 服务端裁剪下载
+
+    读取数据集的 DDS/DAS 和坐标变量，把变量、经纬度范围和时间窗口换算成下标范围，
+    再按 OPENDAP_SLICE_MAX_BYTES 拆分为多个超立方体切片并发请求 .dods，解码后直接写入本地 CF NetCDF 文件。
+    已写入的切片记录在续传条目中，暂停或失败后再次运行只请求剩余切片。
+    """
+
+    def dataset_url(self, url: str) -> str:
+        """去掉 OPeNDAP 表单/响应后缀，得到数据集URL"""
+        url = url.split('?', 1)[0]
+        for suffix in _DAP_SUFFIXES:
+            if url.endswith(suffix):
+                return url[:-len(suffix)]
+        return url
+
+    def default_filename(self, url: str) -> str:
+        stem = Path(urlparse(self.dataset_url(url)).path).name or "opendap"
+        for suffix in ('.nc4', '.nc', '.hdf', '.h5'):
+            if stem.endswith(suffix):
+                stem = stem[:-len(suffix)]
+                break
+        return f"{stem}_subset.nc"
+
+    async def download(
+        self,
+        session: aiohttp.ClientSession,
+        url: str,
+        request: SubsetRequest,
+        filepath: Path,
+        progress: ProgressAggregator,
+        retry_policy: RetryPolicy,
+        timeout: Optional[aiohttp.ClientTimeout] = None,
+        host_semaphore: Optional[asyncio.Semaphore] = None
+    ) -> int:
+        """下载裁剪后的数据到 filepath，返回文件字节数"""
+        url = self.dataset_url(url)
+        loop = asyncio.get_event_loop()
+        host_semaphore = host_semaphore or asyncio.Semaphore(settings.DOWNLOAD_MAX_CONNECTIONS_PER_HOST)
+
+        async def get(suffix: str, query: str = '') -> bytes:
+            target = URL(f"{url}{suffix}" + (f"?{query}" if query else ''), encoded=True)
+
+            async def fetch(attempt: int) -> bytes:
+                async with host_semaphore:
+                    async with session.get(target, timeout=timeout) as response:
+                        if response.status != 200:
+                            raise HttpStatusError(
+                                response.status, response.reason,
+                                parse_retry_after(response.headers.get('Retry-After'))
+                            )
+                        body = bytearray()
+                        async for chunk in response.content.iter_chunked(64 * 1024):
+                            body += chunk
+                            await bandwidth_limiter.throttle(progress.task_id, len(chunk))
+                        return bytes(body)
+
+            return await retry_policy.run(fetch, f"{url}{suffix}")
+
+        dds_text, das_text = await asyncio.gather(get('.dds'), get('.das'))
+        dataset = parse_dds(dds_text.decode('utf-8', errors='replace'))
+        attributes = parse_das(das_text.decode('utf-8', errors='replace'))
+
+        variables = self._select_variables(dataset, request.variables)
+        coordinate_paths = self._coordinate_paths(dataset)
+        dims: Dict[str, int] = {}
+        for variable in variables.values():
+            dims.update(variable.dims)
+
+        # 坐标变量是一维的，一次请求全部取回，用于换算下标和写入输出文件
+        wanted = [coordinate_paths[dim] for dim in dims if dim in coordinate_paths]
+        coordinates: Dict[str, np.ndarray] = {}
+        if wanted:
+            payload = await get('.dods', quote(','.join(wanted), safe=',.'))
+            arrays = await loop.run_in_executor(None, parse_dods, payload)
+            for dim in dims:
+                path = coordinate_paths.get(dim)
+                if path and path in arrays:
+                    coordinates[dim] = np.asarray(arrays[path]).reshape(-1)
+
+        dim_ranges = self._dimension_ranges(dims, coordinates, coordinate_paths, attributes, request)
+        slices = self._plan_slices(variables, dim_ranges)
+        total_bytes = sum(item.nbytes for item in slices)
+        progress.set_total_size(total_bytes)
+
+        # 续传：裁剪条件未变且 .part 文件可打开时跳过已写入的切片
+        resume_state = progress.metadata.setdefault('resume', {})
+        part_path = filepath.with_name(filepath.name + '.part')
+        entry = resume_state.get(url) or {}
+        done = set(entry.get('slices') or []) if entry.get('subset') == request.signature() else set()
+        nc = await loop.run_in_executor(None, self._open_output, part_path, bool(done))
+        if nc is None:
+            done = set()
+            nc = await loop.run_in_executor(
+                None, self._create_output, part_path, url, dataset, variables, dims,
+                coordinates, coordinate_paths, dim_ranges, attributes, request
+            )
+        entry = {'filename': filepath.name, 'subset': request.signature(), 'slices': sorted(done)}
+        resume_state[url] = entry
+        progress.set_metadata('resume', resume_state)
+
+        pending = [item for item in slices if item.key not in done]
+        progress.add(total_bytes - sum(item.nbytes for item in pending))
+        logger.info(
+            f"OPeNDAP subset of {url}: {len(variables)} variables, {len(slices)} slices "
+            f"({len(pending)} remaining), {total_bytes} bytes"
+        )
+
+        semaphore = asyncio.Semaphore(max(1, settings.OPENDAP_PARALLEL_SLICES))
+
+        async def fetch_slice(item: _Slice):
+            async with semaphore:
+                payload = await get('.dods', quote(item.request_path + hyperslab(item.source), safe=',.'))
+            arrays = await loop.run_in_executor(None, parse_dods, payload)
+            data = arrays.get(item.request_path)
+            if data is None or data.shape != item.shape:
+                raise Exception(f"OPeNDAP 服务器返回的 {item.variable} 切片形状与请求不一致")
+            await loop.run_in_executor(None, self._write_slice, nc, item, data)
+            entry['slices'].append(item.key)
+            progress.add(item.nbytes)
+            progress.checkpoint_metadata(item.nbytes)
+            await progress.tick()
+
+        tasks = [asyncio.ensure_future(fetch_slice(item)) for item in pending]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for pending_task in tasks:
+                pending_task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            await loop.run_in_executor(None, self._close_output, nc)
+
+        part_path.replace(filepath)
+        size = filepath.stat().st_size
+        resume_state[url] = {'filename': filepath.name, 'completed': True, 'size': size}
+        progress.set_metadata('resume', resume_state)
+        return size
+
+    # ------------------------------------------------------------ 下标换算
+
+    def _select_variables(self, dataset: DapDataset, names: List[str]) -> Dict[str, DapArray]:
+        """返回 {请求路径: 数组声明}；未指定变量时选取所有非坐标的数值变量"""
+        selected: Dict[str, DapArray] = {}
+        if names:
+            for name in names:
+                member = dataset.get(name)
+                if isinstance(member, DapGrid):
+                    member = member.array
+                if not isinstance(member, DapArray) or not member.is_numeric:
+                    raise ValueError(f"数据集中没有数值变量 '{name}'")
+                selected[name] = member
+            return selected
+
+        for member in dataset.members:
+            if isinstance(member, DapGrid) and member.array.is_numeric:
+                selected[member.name] = member.array
+            elif isinstance(member, DapArray) and member.is_numeric and member.dims and not (
+                len(member.dims) == 1 and member.dims[0][0] == member.name
+            ):
+                selected[member.name] = member
+        if not selected:
+            raise ValueError("数据集中没有可下载的数值变量")
+        return selected
+
+    def _coordinate_paths(self, dataset: DapDataset) -> Dict[str, str]:
+        """维度名 -> 坐标变量的请求路径，优先使用顶层一维变量，其次使用 Grid 的 maps"""
+        paths: Dict[str, str] = {}
+        for member in dataset.members:
+            if isinstance(member, DapGrid):
+                for map_array in member.maps:
+                    paths.setdefault(map_array.name, f"{member.name}.{map_array.name}")
+        for member in dataset.members:
+            if isinstance(member, DapArray) and len(member.dims) == 1 and member.dims[0][0] == member.name:
+                paths[member.name] = member.name
+        return paths
+
+    def _coordinate_attributes(self, attributes: Dict[str, Dict[str, Any]], path: str) -> Dict[str, Any]:
+        return attributes.get(path) or attributes.get(path.rsplit('.', 1)[-1]) or {}
+
+    def _axis(self, name: str, attrs: Dict[str, Any]) -> Optional[str]:
+        standard_name = str(attrs.get('standard_name', '')).lower()
+        units = str(attrs.get('units', '')).lower()
+        lowered = name.lower()
+        if standard_name == 'latitude' or units in _LAT_UNITS or lowered in ('lat', 'latitude'):
+            return 'lat'
+        if standard_name == 'longitude' or units in _LON_UNITS or lowered in ('lon', 'long', 'longitude'):
+            return 'lon'
+        if standard_name == 'time' or str(attrs.get('axis', '')).upper() == 'T' or ' since ' in units:
+            return 'time'
+        return None
+
+    def _dimension_ranges(
+        self,
+        dims: Dict[str, int],
+        coordinates: Dict[str, np.ndarray],
+        coordinate_paths: Dict[str, str],
+        attributes: Dict[str, Dict[str, Any]],
+        request: SubsetRequest
+    ) -> Dict[str, List[Tuple[int, int, float]]]:
+        """每个维度选取的下标范围 [(start, stop, 坐标偏移)]；跨越经度接缝时经度维有两段"""
+        ranges: Dict[str, List[Tuple[int, int, float]]] = {}
+        for dim, size in dims.items():
+            ranges[dim] = [(0, size - 1, 0.0)]
+            values = coordinates.get(dim)
+            if values is None:
+                continue
+            attrs = self._coordinate_attributes(attributes, coordinate_paths[dim])
+            axis = self._axis(dim, attrs)
+            if axis == 'lat' and request.bbox:
+                ranges[dim] = [(*self._index_range(values, request.bbox[1], request.bbox[3], dim), 0.0)]
+            elif axis == 'lon' and request.bbox:
+                ranges[dim] = self._longitude_ranges(values, request.bbox[0], request.bbox[2], dim)
+            elif axis == 'time' and (request.time_start or request.time_end):
+                low, high = self._time_bounds(attrs, request.time_start, request.time_end)
+                ranges[dim] = [(*self._index_range(values, low, high, dim), 0.0)]
+        return ranges
+
+    def _index_range(self, values: np.ndarray, low: float, high: float, name: str) -> Tuple[int, int]:
+        indices = np.nonzero((values >= min(low, high)) & (values <= max(low, high)))[0]
+        if not len(indices):
+            raise ValueError(f"坐标 {name} 中没有落在 [{low}, {high}] 范围内的值")
+        return int(indices[0]), int(indices[-1])
+
+    def _longitude_ranges(self, values: np.ndarray, west: float, east: float,
+                          name: str) -> List[Tuple[int, int, float]]:
+        """按数据集的经度约定（0~360 或 -180~180）换算经度范围，west > east 表示跨越 180° 经线"""
+        width = (east - west) % 360
+        if width == 0 and east != west:
+            return [(0, len(values) - 1, 0.0)]
+        base = 0.0 if float(np.nanmax(values)) > 180 else -180.0
+        low = (west - base) % 360 + base
+        high = low + width
+        if high <= base + 360:
+            return [(*self._index_range(values, low, high, name), 0.0)]
+
+        # 范围跨越数据集的经度接缝：拼接 [low, 末尾] 与 [开头, high - 360]，后一段经度加 360 保持单调
+        ranges = []
+        head = np.nonzero(values >= low)[0]
+        tail = np.nonzero(values <= high - 360)[0]
+        if len(head):
+            ranges.append((int(head[0]), len(values) - 1, 0.0))
+        if len(tail):
+            ranges.append((0, int(tail[-1]), 360.0))
+        if not ranges:
+            raise ValueError(f"坐标 {name} 中没有落在 [{west}, {east}] 范围内的值")
+        return ranges
+
+    def _time_bounds(self, attrs: Dict[str, Any], start: Optional[str], end: Optional[str]) -> Tuple[float, float]:
+        from netCDF4 import date2num
+
+        units = attrs.get('units')
+        if not units:
+            raise ValueError("时间坐标缺少 units 属性，无法按时间裁剪")
+        calendar = attrs.get('calendar', 'standard')
+        low = date2num(self._parse_time(start), units, calendar) if start else -np.inf
+        high = date2num(self._parse_time(end), units, calendar) if end else np.inf
+        return float(low), float(high)
+
+    def _parse_time(self, value: str) -> datetime:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        return parsed
+
+    def _plan_slices(self, variables: Dict[str, DapArray],
+                     dim_ranges: Dict[str, List[Tuple[int, int, float]]]) -> List[_Slice]:
+        """把每个变量的超立方体拆分为不超过 OPENDAP_SLICE_MAX_BYTES 的切片，沿最外层长度大于 1 的维度切分"""
+        max_bytes = max(1, settings.OPENDAP_SLICE_MAX_BYTES)
+        slices: List[_Slice] = []
+        for path, variable in variables.items():
+            itemsize = NATIVE_TYPES[variable.type].itemsize
+            # 经度跨接缝时一个变量由多个块组成，每个块在输出中的起点为前面各段长度之和
+            per_dim = []
+            for dim in variable.dim_names:
+                offset = 0
+                blocks = []
+                for start, stop, _ in dim_ranges[dim]:
+                    blocks.append((start, stop, offset))
+                    offset += stop - start + 1
+                per_dim.append(blocks)
+
+            for block in itertools.product(*per_dim):
+                extents = [stop - start + 1 for start, stop, _ in block]
+                axis = next((i for i, extent in enumerate(extents) if extent > 1), 0)
+                inner = int(np.prod(extents[axis + 1:], dtype=np.int64)) * itemsize if extents else itemsize
+                rows = max(1, max_bytes // max(inner, 1))
+                axis_start, axis_stop, axis_offset = block[axis] if block else (0, 0, 0)
+                for row in range(axis_start, axis_stop + 1, rows):
+                    row_stop = min(row + rows - 1, axis_stop)
+                    source = [(start, stop) for start, stop, _ in block]
+                    target = [slice(offset, offset + stop - start + 1) for start, stop, offset in block]
+                    if block:
+                        source[axis] = (row, row_stop)
+                        first = axis_offset + row - axis_start
+                        target[axis] = slice(first, first + row_stop - row + 1)
+                    slices.append(_Slice(
+                        variable=variable.name,
+                        request_path=path,
+                        source=source,
+                        target=tuple(target),
+                        nbytes=(row_stop - row + 1) * inner
+                    ))
+        return slices
+
+    # ------------------------------------------------------------ NetCDF 输出（在线程池中执行）
+
+    def _open_output(self, part_path: Path, resume: bool):
+        if not resume or not part_path.exists():
+            return None
+        import netCDF4 as nc
+
+        with _netcdf_lock:
+            try:
+                dataset = nc.Dataset(str(part_path), 'a')
+            except OSError as e:
+                logger.warning(f"Cannot reopen partial OPeNDAP subset {part_path}, starting over: {e}")
+                return None
+            dataset.set_auto_maskandscale(False)
+            return dataset
+
+    def _create_output(
+        self,
+        part_path: Path,
+        url: str,
+        dataset: DapDataset,
+        variables: Dict[str, DapArray],
+        dims: Dict[str, int],
+        coordinates: Dict[str, np.ndarray],
+        coordinate_paths: Dict[str, str],
+        dim_ranges: Dict[str, List[Tuple[int, int, float]]],
+        attributes: Dict[str, Dict[str, Any]],
+        request: SubsetRequest
+    ):
+        import netCDF4 as nc
+
+        with _netcdf_lock:
+            output = nc.Dataset(str(part_path), 'w', format='NETCDF4')
+            output.set_auto_maskandscale(False)
+            try:
+                for dim in dims:
+                    output.createDimension(dim, sum(stop - start + 1 for start, stop, _ in dim_ranges[dim]))
+
+                for dim, values in coordinates.items():
+                    if dim in variables:
+                        continue
+                    subset = np.concatenate([
+                        values[start:stop + 1] + offset if offset else values[start:stop + 1]
+                        for start, stop, offset in dim_ranges[dim]
+                    ])
+                    coordinate = output.createVariable(dim, subset.dtype, (dim,))
+                    self._copy_attributes(
+                        coordinate, self._coordinate_attributes(attributes, coordinate_paths[dim])
+                    )
+                    coordinate[:] = subset
+
+                for path, variable in variables.items():
+                    dtype = NATIVE_TYPES[variable.type]
+                    attrs = attributes.get(path) or attributes.get(variable.name) or {}
+                    fill_value = attrs.get('_FillValue')
+                    created = output.createVariable(
+                        variable.name, dtype, tuple(variable.dim_names), zlib=True, complevel=4,
+                        fill_value=np.array(fill_value).astype(dtype) if fill_value is not None else None
+                    )
+                    self._copy_attributes(created, attrs)
+
+                global_attrs = attributes.get('NC_GLOBAL') or next(
+                    (attrs for name, attrs in attributes.items() if name.endswith('_GLOBAL')), {}
+                )
+                self._copy_attributes(output, global_attrs)
+                if 'Conventions' not in output.ncattrs():
+                    output.setncattr('Conventions', 'CF-1.8')
+                history = (
+                    f"{datetime.utcnow().isoformat()}Z: subset from {url} "
+                    f"(variables={list(variables)}, bbox={request.bbox}, "
+                    f"time=[{request.time_start}, {request.time_end}])"
+                )
+                previous = global_attrs.get('history')
+                output.setncattr('history', f"{previous}\n{history}" if previous else history)
+            except Exception:
+                output.close()
+                raise
+            return output
+
+    def _copy_attributes(self, target, attrs: Dict[str, Any]):
+        for name, value in attrs.items():
+            # _FillValue 在创建变量时设置，其余以下划线开头的是 DAP/HDF 内部属性
+            if name.startswith('_') or name.startswith('DODS'):
+                continue
+            try:
+                target.setncattr(name, value)
+            except Exception as e:
+                logger.debug(f"Skipping attribute {name}: {e}")
+
+    def _write_slice(self, output, item: _Slice, data: np.ndarray):
+        with _netcdf_lock:
+            output.variables[item.variable][item.target] = data
+
+    def _close_output(self, output):
+        with _netcdf_lock:
+            if output.isopen():
+                output.close()
+
+
+# Global instance
+opendap_subsetter = OpendapSubsetter()
@@ -0,0 +1,186 @@
+import copy
+import time
+import threading
+import logging
+from typing import Optional, Dict, Any, Callable, Awaitable, List
+from sqlalchemy.orm import Session
+
+from app.crud.crud_download_task import download_task as crud_download_task
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressAggregator:
+    """下载进度聚合器
+
+    下载循环只在内存中累加字节数，达到时间或进度阈值时才合并写入数据库并推送WebSocket，
+    避免每个数据块都提交一次事务。FTP/SFTP工作线程只调用 add/update，写库始终在事件循环中完成。
+    """
+
+    def __init__(
+        self,
+        db: Session,
+        task_id: int,
+        send_update: Callable[[int, dict], Awaitable[None]],
+        total_size: int = 0,
+        flush_interval: Optional[float] = None,
+        flush_percent: Optional[float] = None,
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.db = db
+        self.task_id = task_id
+        self.send_update = send_update
+        self.total_size = total_size or 0
+        self.downloaded_size = 0
+        self.progress: Optional[float] = None  # 显式进度（目录下载按文件数计算）
+        self.fields: Dict[str, Any] = {}  # 随进度推送的附加字段，如 current_file
+        self.metadata: Dict[str, Any] = metadata or {}  # 随进度一起写入 task_metadata 的键
+        self.flush_interval = (
+            settings.DOWNLOAD_PROGRESS_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        )
+        self.flush_percent = (
+            settings.DOWNLOAD_PROGRESS_FLUSH_PERCENT if flush_percent is None else flush_percent
+        )
+        self._lock = threading.Lock()
+        self._total_size_dirty = False
+        self._metadata_dirty = False
+        self._checkpoint_pending = False
+        self._checkpoint_bytes = 0
+        self._last_checkpoint_time = time.monotonic()
+        self._last_flush_time = 0.0
+        self._last_flush_progress = 0.0
+        self._completion_hooks: List[Callable[[], Awaitable[Optional[Dict[str, Any]]]]] = []
+        self.status: Optional[str] = None  # finish 写入的最终状态
+
+    def add_completion_hook(self, hook: Callable[[], Awaitable[Optional[Dict[str, Any]]]]):
+        """登记在写入 completed 状态前等待的协程函数（如转换流水线排空），返回的字典并入最终推送字段"""
+        self._completion_hooks.append(hook)
+
+    def set_total_size(self, total_size: int):
+        """设置总字节数（首次得知文件大小时调用）"""
+        with self._lock:
+            if total_size and total_size != self.total_size:
+                self.total_size = total_size
+                self._total_size_dirty = True
+
+    def add(self, nbytes: int, **fields):
+        """累加已下载字节数，可在工作线程中调用"""
+        with self._lock:
+            self.downloaded_size += nbytes
+            if fields:
+                self.fields.update(fields)
+
+    def update(self, downloaded_size: Optional[int] = None, progress: Optional[float] = None, **fields):
+        """直接设置已下载字节数/进度及附加字段，可在工作线程中调用"""
+        with self._lock:
+            if downloaded_size is not None:
+                self.downloaded_size = downloaded_size
+            if progress is not None:
+                self.progress = progress
+            if fields:
+                self.fields.update(fields)
+
+    def set_metadata(self, key: str, value: Any):
+        """设置随下次刷新写入 task_metadata 的键（None 表示删除）"""
+        with self._lock:
+            self.metadata[key] = value
+            self._metadata_dirty = True
+
+    def set_metadata_item(self, key: str, item_key: str, value: Any):
+        """设置 task_metadata[key][item_key]，可在工作线程中调用"""
+        with self._lock:
+            self.metadata.setdefault(key, {})[item_key] = value
+            self._metadata_dirty = True
+
+    def checkpoint_metadata(self, nbytes: int = 0):
+        """数据块循环中就地修改了 metadata（如续传偏移量）后调用
+
+        不是每个数据块都把整份 task_metadata 写入数据库：写入量达到 DOWNLOAD_RESUME_CHECKPOINT_BYTES
+        或距上次检查点超过 DOWNLOAD_RESUME_CHECKPOINT_INTERVAL 秒时才随下次刷新写入，finish 时总会写入。
+        偏移量落后于 .part 文件只会导致少量数据重新下载。
+        """
+        with self._lock:
+            self._checkpoint_pending = True
+            self._checkpoint_bytes += nbytes
+            if (
+                self._checkpoint_bytes >= settings.DOWNLOAD_RESUME_CHECKPOINT_BYTES
+                or time.monotonic() - self._last_checkpoint_time >= settings.DOWNLOAD_RESUME_CHECKPOINT_INTERVAL
+            ):
+                self._metadata_dirty = True
+
+    @property
+    def current_progress(self) -> float:
+        if self.progress is not None:
+            return min(self.progress, 100.0)
+        if self.total_size > 0:
+            return min(self.downloaded_size / self.total_size * 100, 100.0)
+        return 0.0
+
+    def should_flush(self) -> bool:
+        """是否达到刷新阈值（时间间隔或进度增量任一满足）"""
+        if time.monotonic() - self._last_flush_time >= self.flush_interval:
+            return True
+        if self.flush_percent > 0:
+            return self.current_progress - self._last_flush_progress >= self.flush_percent
+        return False
+
+    async def tick(self):
+        """在数据块循环中调用，仅在达到阈值时刷新"""
+        if self.should_flush():
+            await self.flush()
+
+    async def flush(self, status: str = "running", **extra):
+        """将缓冲的进度写入数据库并推送WebSocket"""
+        with self._lock:
+            progress = self.current_progress
+            downloaded_size = self.downloaded_size
+            total_size = self.total_size
+            total_size_dirty = self._total_size_dirty
+            self._total_size_dirty = False
+            metadata = copy.deepcopy(self.metadata) if self._metadata_dirty else None
+            if self._metadata_dirty:
+                self._checkpoint_pending = False
+                self._checkpoint_bytes = 0
+                self._last_checkpoint_time = time.monotonic()
+            self._metadata_dirty = False
+            payload = dict(self.fields)
+
+        try:
+            if total_size_dirty:
+                fresh_task = crud_download_task.get(self.db, self.task_id)
+                if fresh_task:
+                    crud_download_task.update(self.db, db_obj=fresh_task, obj_in={"file_size": total_size})
+            crud_download_task.update_progress(
+                self.db, task_id=self.task_id, progress=progress, downloaded_size=downloaded_size, metadata=metadata
+            )
+        except Exception as e:
+            logger.error(f"Failed to persist progress for task {self.task_id}: {e}")
+
+        payload.update({
+            "progress": progress,
+            "downloaded_size": downloaded_size,
+            "status": status
+        })
+        if total_size > 0:
+            payload["total_size"] = total_size
+        payload.update(extra)
+        await self.send_update(self.task_id, payload)
+
+        self._last_flush_time = time.monotonic()
+        self._last_flush_progress = progress
+
+    async def finish(self, status: str = "completed", error_message: str = None, **extra):
+        """写入最终状态（完成/失败/取消/暂停）"""
+        if status == "completed":
+            for hook in self._completion_hooks:
+                extra.update(await hook() or {})
+            with self._lock:
+                self.progress = 100.0
+        with self._lock:
+            # 暂停/关闭/失败时写入最新的续传偏移量
+            if self._checkpoint_pending:
+                self._metadata_dirty = True
+        await self.flush(status=status, **extra)
+        crud_download_task.set_status(self.db, task_id=self.task_id, status=status, error_message=error_message)
+        self.status = status
@@ -0,0 +1,93 @@
+import threading
+import logging
+from typing import Dict, List
+
+import paramiko
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class SFTPTransportPool:
+    """按数据源缓存 SSH 连接
+
+    同一数据源的所有任务共享一条 SSH Transport（使用可调的窗口和包大小），
+    每个传输线程在其上打开独立的 SFTP 通道，从而在一次握手上并行传输多个文件。
+    """
+
+    def __init__(self):
+        self._clients: Dict[int, paramiko.SSHClient] = {}
+        # 配置变更后被替换的连接，可能仍有进行中的传输，关闭时统一释放
+        self._retired: List[paramiko.SSHClient] = []
+        self._lock = threading.Lock()
+
+    def _transport_factory(self, sock, **kwargs) -> paramiko.Transport:
+        return paramiko.Transport(
+            sock,
+            default_window_size=settings.SFTP_WINDOW_SIZE,
+            default_max_packet_size=settings.SFTP_MAX_PACKET_SIZE,
+            **kwargs
+        )
+
+    def get_transport(self, data_source, parsed_url) -> paramiko.Transport:
+        """获取（必要时建立）数据源对应的 SSH Transport"""
+        with self._lock:
+            client = self._clients.get(data_source.id)
+            if client is not None:
+                transport = client.get_transport()
+                if transport is not None and transport.is_active():
+                    return transport
+                client.close()
+
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(
+                hostname=parsed_url.hostname,
+                port=parsed_url.port or 22,
+                username=data_source.username,
+                password=data_source.password,
+                transport_factory=self._transport_factory
+            )
+            transport = client.get_transport()
+            transport.set_keepalive(settings.SFTP_KEEPALIVE_INTERVAL)
+            self._clients[data_source.id] = client
+            logger.info(f"Opened SSH transport to {parsed_url.hostname} for data source {data_source.id}")
+            return transport
+
+    def open_sftp(self, data_source, parsed_url) -> paramiko.SFTPClient:
+        """在共享 Transport 上打开一个新的 SFTP 通道，调用方负责关闭"""
+        transport = self.get_transport(data_source, parsed_url)
+        return paramiko.SFTPClient.from_transport(
+            transport,
+            window_size=settings.SFTP_WINDOW_SIZE,
+            max_packet_size=settings.SFTP_MAX_PACKET_SIZE
+        )
+
+    def close_source(self, source_id: int):
+        """替换某个数据源的 SSH 连接（数据源配置变更时调用），进行中的传输不受影响"""
+        with self._lock:
+            client = self._clients.pop(source_id, None)
+            if client is not None:
+                self._retired.append(client)
+
+    def close_all(self):
+        """关闭所有 SSH 连接"""
+        with self._lock:
+            clients = list(self._clients.values()) + self._retired
+            self._clients.clear()
+            self._retired = []
+        for client in clients:
+            client.close()
+
+    def get_stats(self) -> Dict:
+        """连接池统计信息"""
+        with self._lock:
+            return {
+                source_id: bool(client.get_transport() and client.get_transport().is_active())
+                for source_id, client in self._clients.items()
+            }
+
+
+# Global instance
+sftp_pool = SFTPTransportPool()
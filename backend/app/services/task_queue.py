@@ -0,0 +1,282 @@
+import heapq
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+
+@dataclass(order=True)
+class QueuedTask:
+    """队列中的一个下载任务；排序键为 (老化后的优先级键, 入队序号)"""
+    sort_key: float
+    sequence: int
+    task_id: int = field(compare=False)
+    priority: int = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    group: Optional[int] = field(default=None, compare=False)  # 所属数据源
+    cost: float = field(default=0.0, compare=False)  # 按估计耗时附加的降级（sjf 策略）
+    removed: bool = field(default=False, compare=False)
+
+
+class PriorityTaskQueue:
+    """带优先级老化的下载任务堆队列（1=最高，10=最低）
+
+    任务每等待 aging_interval 秒，有效优先级提高一级，避免低优先级的批量下载被持续插队而饿死。
+    所有任务老化速度相同，因此有效优先级 priority - (now - enqueued_at) / aging_interval 的大小关系
+    等价于固定键 priority + enqueued_at / aging_interval，堆中无需随时间重排。
+    修改优先级或移除任务时只把旧条目标记为失效（出堆时跳过），入队、出队、改优先级均为 O(log n)。
+    cost 为额外降低的优先级级数（如按估计耗时计算的作业代价），同样在入队时计入固定键。
+    """
+
+    def __init__(self, aging_interval: Optional[float] = None):
+        self.aging_interval = (
+            settings.DOWNLOAD_PRIORITY_AGING_INTERVAL if aging_interval is None else aging_interval
+        )
+        self._heap: List[QueuedTask] = []
+        self._entries: Dict[int, QueuedTask] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self._entries
+
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+
+    def _sort_key(self, priority: int, enqueued_at: float, cost: float = 0.0) -> float:
+        if self.aging_interval and self.aging_interval > 0:
+            return priority + cost + enqueued_at / self.aging_interval
+        return priority + cost
+
+    def push(
+        self,
+        task_id: int,
+        priority: int,
+        enqueued_at: Optional[float] = None,
+        group: Optional[int] = None,
+        cost: Optional[float] = None
+    ):
+        """加入任务；已在队列中时更新其优先级（保留原入队时间和未指定的代价）"""
+        existing = self._entries.get(task_id)
+        if existing is not None:
+            enqueued_at = existing.enqueued_at if enqueued_at is None else enqueued_at
+            group = existing.group if group is None else group
+            cost = existing.cost if cost is None else cost
+            existing.removed = True
+        enqueued_at = time.time() if enqueued_at is None else enqueued_at
+        cost = cost or 0.0
+        entry = QueuedTask(
+            sort_key=self._sort_key(priority, enqueued_at, cost),
+            sequence=next(self._counter),
+            task_id=task_id,
+            priority=priority,
+            enqueued_at=enqueued_at,
+            group=group,
+            cost=cost
+        )
+        self._entries[task_id] = entry
+        heapq.heappush(self._heap, entry)
+        self._compact()
+
+    def update_priority(self, task_id: int, priority: int) -> bool:
+        """修改排队任务的优先级，任务不在队列中时返回 False"""
+        if task_id not in self._entries:
+            return False
+        self.push(task_id, priority)
+        return True
+
+    def remove(self, task_id: int) -> bool:
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return False
+        entry.removed = True
+        return True
+
+    def peek(self) -> Optional[QueuedTask]:
+        """查看有效优先级最高的任务（不出队）"""
+        while self._heap and self._heap[0].removed:
+            heapq.heappop(self._heap)
+        return self._heap[0] if self._heap else None
+
+    def pop(self) -> Optional[QueuedTask]:
+        """取出有效优先级最高的任务，队列为空时返回 None"""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if not entry.removed:
+                del self._entries[entry.task_id]
+                return entry
+        return None
+
+    def update_cost(self, task_id: int, cost: float) -> bool:
+        """修改排队任务的代价（如预检得到大小后），任务不在队列中时返回 False"""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return False
+        self.push(task_id, entry.priority, cost=cost)
+        return True
+
+    def requeue(self, entry: QueuedTask):
+        """放回暂不能启动的任务，保持原优先级、代价和入队时间（即原来的位置）"""
+        self.push(entry.task_id, entry.priority, entry.enqueued_at, entry.group, entry.cost)
+
+    def get(self, task_id: int) -> Optional[QueuedTask]:
+        return self._entries.get(task_id)
+
+    def effective_priority(self, task_id: int, now: Optional[float] = None) -> Optional[float]:
+        """计入代价和老化后的当前优先级"""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return None
+        return self.aged_priority(entry, time.time() if now is None else now)
+
+    def priority_level(self, entry: QueuedTask, now: float) -> int:
+        """条目在 now 时刻所处的优先级档：计入代价的优先级取整后，每等待满一个 aging_interval 提高一档
+
+        与 aged_priority 不同，档位在两次老化之间保持不变，同一档的任务不会因入队先后落入不同的档。
+        """
+        level = math.floor(entry.priority + entry.cost)
+        if not self.aging_interval or self.aging_interval <= 0:
+            return level
+        return level - math.floor(max(now - entry.enqueued_at, 0.0) / self.aging_interval)
+
+    def aged_priority(self, entry: QueuedTask, now: float) -> float:
+        """条目在 now 时刻计入代价和老化后的优先级"""
+        if not self.aging_interval or self.aging_interval <= 0:
+            return entry.priority + entry.cost
+        return entry.priority + entry.cost - max(now - entry.enqueued_at, 0.0) / self.aging_interval
+
+    def ordered(self) -> List[QueuedTask]:
+        """按出队顺序排列的排队任务快照（O(n log n)，仅用于状态查询）"""
+        return sorted(self._entries.values())
+
+    def task_ids(self) -> List[int]:
+        return [entry.task_id for entry in self.ordered()]
+
+    def __iter__(self) -> Iterator[QueuedTask]:
+        return iter(self.ordered())
+
+    def _compact(self):
+        """失效条目过多时重建堆，限制内存占用"""
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [entry for entry in self._heap if not entry.removed]
+            heapq.heapify(self._heap)
+
+
+class FairTaskQueue:
+    """按数据源分组的公平队列
+
+    每个数据源一个 PriorityTaskQueue。出队时在允许启动的数据源中比较各自队首任务：
+    先比较所处的优先级档（见 PriorityTaskQueue.priority_level），同一档内轮流选择最久未被调度的数据源，
+    使排队任务多的数据源不会独占空闲槽位。单次出队 O(数据源数 + log n)。
+    """
+
+    def __init__(self, aging_interval: Optional[float] = None):
+        self.aging_interval = aging_interval
+        self._queues: Dict[int, PriorityTaskQueue] = {}
+        self._group_of: Dict[int, int] = {}
+        self._last_served: Dict[int, int] = {}
+        self._turn = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._group_of)
+
+    def __contains__(self, task_id: int) -> bool:
+        return task_id in self._group_of
+
+    def __bool__(self) -> bool:
+        return bool(self._group_of)
+
+    def push(
+        self,
+        task_id: int,
+        priority: int,
+        enqueued_at: Optional[float] = None,
+        group: int = 0,
+        cost: Optional[float] = None
+    ):
+        """加入任务；已在队列中时更新优先级，数据源变化时移到新数据源的队列"""
+        previous = self._group_of.get(task_id)
+        if previous is not None and previous != group:
+            existing = self._queues[previous].get(task_id)
+            enqueued_at = existing.enqueued_at if enqueued_at is None else enqueued_at
+            cost = existing.cost if cost is None else cost
+            self._remove_from(previous, task_id)
+        queue = self._queues.get(group)
+        if queue is None:
+            queue = self._queues[group] = PriorityTaskQueue(self.aging_interval)
+        queue.push(task_id, priority, enqueued_at, group, cost)
+        self._group_of[task_id] = group
+
+    def update_priority(self, task_id: int, priority: int) -> bool:
+        group = self._group_of.get(task_id)
+        return group is not None and self._queues[group].update_priority(task_id, priority)
+
+    def update_cost(self, task_id: int, cost: float) -> bool:
+        group = self._group_of.get(task_id)
+        return group is not None and self._queues[group].update_cost(task_id, cost)
+
+    def remove(self, task_id: int) -> bool:
+        group = self._group_of.get(task_id)
+        if group is None:
+            return False
+        self._remove_from(group, task_id)
+        return True
+
+    def _remove_from(self, group: int, task_id: int):
+        queue = self._queues[group]
+        queue.remove(task_id)
+        del self._group_of[task_id]
+        if not queue:
+            del self._queues[group]
+
+    def pop(self, eligible: Optional[Callable[[int], bool]] = None) -> Optional[QueuedTask]:
+        """按优先级档 + 数据源轮转取出下一个任务；eligible(group) 为 False 的数据源本次跳过"""
+        best = None
+        best_rank = None
+        now = time.time()
+        for group, queue in self._queues.items():
+            head = queue.peek()
+            if head is None or (eligible is not None and not eligible(group)):
+                continue
+            rank = (queue.priority_level(head, now), self._last_served.get(group, -1), head.sort_key, head.sequence)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = group, rank
+        if best is None:
+            return None
+        entry = self._queues[best].pop()
+        del self._group_of[entry.task_id]
+        if not self._queues[best]:
+            del self._queues[best]
+        self._last_served[best] = next(self._turn)
+        return entry
+
+    def requeue(self, entry: QueuedTask):
+        """放回暂不能启动的任务，保持原优先级、代价、入队时间和数据源"""
+        self.push(entry.task_id, entry.priority, entry.enqueued_at, entry.group, entry.cost)
+
+    def get(self, task_id: int) -> Optional[QueuedTask]:
+        group = self._group_of.get(task_id)
+        return self._queues[group].get(task_id) if group is not None else None
+
+    def effective_priority(self, task_id: int, now: Optional[float] = None) -> Optional[float]:
+        group = self._group_of.get(task_id)
+        return self._queues[group].effective_priority(task_id, now) if group is not None else None
+
+    def groups(self) -> List[int]:
+        return list(self._queues)
+
+    def group_size(self, group: int) -> int:
+        queue = self._queues.get(group)
+        return len(queue) if queue else 0
+
+    def ordered(self) -> List[QueuedTask]:
+        """所有排队任务按优先级排序的快照（不体现数据源轮转，仅用于状态查询）"""
+        return sorted(entry for queue in self._queues.values() for entry in queue.ordered())
+
+    def task_ids(self) -> List[int]:
+        return [entry.task_id for entry in self.ordered()]
@@ -1,49 +1,123 @@
 import asyncio
+import heapq
 import logging
+import shutil
+import time
+from collections import Counter
+from dataclasses import dataclass
 from typing import Dict, List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
+from urllib.parse import urlparse
 from sqlalchemy.orm import Session
 from app.crud.crud_download_task import download_task as crud_download_task
+from app.crud.crud_data_source import data_source as crud_data_source
+from app.db.session import SessionLocal
 from app.services.data_download_service import download_service
+from app.services.bandwidth_limiter import bandwidth_limiter
+from app.services.throughput_tracker import throughput_tracker
+from app.services.task_queue import FairTaskQueue, QueuedTask
 from app.core.config import settings
+from app.utils.cron import CronSchedule, CronError
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class RunningTask:
+    started_at: datetime
+    source_id: int
+    host: Optional[str]
+
+
+@dataclass
+class SourceSlots:
+    """数据源的并发槽位配置（每轮调度从数据库刷新）"""
+    host: Optional[str]
+    limit: int  # 0 表示不限
+
+
 class TaskScheduler:
-    """Download task scheduler with priority queue and concurrency control"""
+    """Download task scheduler with priority queue and concurrency control
+
+    事件驱动：任务入队、预检完成或 DownloadService 报告任务结束时唤醒调度循环，立即填补空出的槽位。
+
+    多个副本（进程或主机）可共享同一数据库：各自的内存队列只决定尝试顺序，启动前用
+    SELECT ... FOR UPDATE SKIP LOCKED 原子认领任务，同一任务只会被一个进程启动。各进程每隔
+    DOWNLOAD_QUEUE_SYNC_INTERVAL 秒与数据库同步队列，并接管租约已过期（持有进程已失联）的运行中任务。
+    并发槽位和数据源/主机限制按进程计算。
+
+    设置了 cron 计划的任务到期时由调度器入队运行；上一次运行仍在排队或进行中时跳过本次，同一计划的运行不会重叠。
+    """
     
     def __init__(self, max_concurrent_tasks: int = None):
         self.max_concurrent_tasks = max_concurrent_tasks or settings.MAX_CONCURRENT_TASKS
-        self.running_tasks: Dict[int, asyncio.Task] = {}
-        self.pending_queue: List[int] = []  # Task IDs in priority order
+        self.running_tasks: Dict[int, RunningTask] = {}
+        # 按数据源分组的堆队列：按老化后的优先级出队，同一优先级档内各数据源轮流
+        self.pending_queue = FairTaskQueue()
+        self.source_slots: Dict[int, SourceSlots] = {}
         self.scheduler_running = False
+        # 正在预检大小的任务，完成前不启动
+        self.preflight_tasks: Dict[int, asyncio.Task] = {}
+        # 因磁盘剩余空间不足以容纳运行中任务的剩余数据而推迟的任务
+        self.waiting_for_space: List[int] = []
+        self._wakeup = asyncio.Event()
+        # 每次启动递增；停止后立即重新启动时，旧的调度循环据此退出
+        self._generation = 0
+        self._last_sync = 0.0
+        self._last_schedule_check = 0.0
+        # 同时预检的任务数，避免批量入队后同时打开大量数据库会话和远端连接
+        self._preflight_slots = asyncio.Semaphore(max(1, settings.DOWNLOAD_PREFLIGHT_MAX_TASKS))
+        download_service.add_finish_listener(self._on_download_finished)
         
-    async def start_scheduler(self, db: Session):
-        """Start the task scheduler"""
+    async def start_scheduler(self):
+        """Start the task scheduler（每轮调度使用独立的数据库会话）"""
         if self.scheduler_running:
             return
             
         self.scheduler_running = True
+        self._generation += 1
+        generation = self._generation
         logger.info("Task scheduler started")
+        # 启动后先处理一次已有队列
+        self._wakeup.set()
         
-        while self.scheduler_running:
+        while self.scheduler_running and generation == self._generation:
             try:
-                await self._process_queue(db)
-                await asyncio.sleep(5)  # Check every 5 seconds
+                # 除事件外，定期与数据库同步队列、检查到期的定时任务；等待磁盘空间的任务定期复查（空间可能被外部释放）
+                intervals = [settings.DOWNLOAD_QUEUE_SYNC_INTERVAL, settings.DOWNLOAD_SCHEDULE_CHECK_INTERVAL]
+                if self.waiting_for_space:
+                    intervals.append(settings.DOWNLOAD_SPACE_RECHECK_INTERVAL)
+                timeout = min((interval for interval in intervals if interval and interval > 0), default=None)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                if not self.scheduler_running or generation != self._generation:
+                    break
+                db = SessionLocal()
+                try:
+                    check_interval = settings.DOWNLOAD_SCHEDULE_CHECK_INTERVAL
+                    if check_interval and time.monotonic() - self._last_schedule_check >= check_interval:
+                        self._materialise_schedules(db)
+                    sync_interval = settings.DOWNLOAD_QUEUE_SYNC_INTERVAL
+                    if sync_interval and time.monotonic() - self._last_sync >= sync_interval:
+                        self._sync_queue(db)
+                    await self._process_queue(db)
+                finally:
+                    db.close()
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
-                await asyncio.sleep(10)
+                await asyncio.sleep(1)
     
     async def stop_scheduler(self):
-        """Stop the task scheduler"""
+        """Stop the task scheduler（不再启动新任务，已在运行的下载继续完成）"""
         self.scheduler_running = False
+        self._wake()
         
-        # Cancel all running tasks
-        for task_id, task in self.running_tasks.items():
-            task.cancel()
-            logger.info(f"Cancelled task {task_id}")
-            
-        self.running_tasks.clear()
+        for preflight_task in self.preflight_tasks.values():
+            preflight_task.cancel()
+        self.preflight_tasks.clear()
         logger.info("Task scheduler stopped")
     
     async def add_task_to_queue(self, db: Session, task_id: int, priority: int = 5):
@@ -53,106 +127,475 @@ class TaskScheduler:
         if not task:
             raise ValueError(f"Task {task_id} not found")
             
-        # Add task metadata with priority
-        if not task.task_metadata:
-            task.task_metadata = {}
-        task.task_metadata['priority'] = priority
-        task.task_metadata['queued_at'] = datetime.utcnow().isoformat()
-        
-        crud_download_task.update(db, db_obj=task, obj_in={"task_metadata": task.task_metadata})
+        # Add task metadata with priority（已在队列中的任务保留原入队时间，不丢失已累积的老化）
+        queued = self.pending_queue.get(task_id)
+        queued_at = (
+            datetime.fromtimestamp(queued.enqueued_at, timezone.utc) if queued else datetime.now(timezone.utc)
+        )
+        # 排队的任务状态统一为 pending（暂停/失败的任务重新入队），与 queued_at 一起持久化，重启后据此恢复队列
+        crud_download_task.update_metadata(db, task_id=task_id, metadata={
+            "priority": priority,
+            "queued_at": queued_at.replace(tzinfo=None).isoformat()
+        }, status="pending")
         
         # Insert into queue based on priority
-        self._insert_by_priority(task_id, priority)
+        self._enqueue(task, priority, queued_at.timestamp())
         
         logger.info(f"Task {task_id} added to queue with priority {priority}")
+        self._wake()
+    
+    async def add_tasks_to_queue(self, db: Session, task_ids: List[int], priority: int = 5) -> Dict[int, Optional[str]]:
+        """批量入队，返回 {task_id: 失败原因或 None}
+
+        一次查询加载并校验任务，再以带状态条件的 UPDATE 置为 pending（按入队时间分组，新入队的任务共用一条语句），
+        只合并 priority/queued_at 两个元数据键。校验之后被其他副本认领的任务保持原状态、不加入队列。
+        随后一并加入内存队列并只唤醒一次调度。
+        """
+        task_ids = list(dict.fromkeys(task_ids))
+        tasks = {task.id: task for task in crud_download_task.get_by_ids(db, ids=task_ids)}
+        now = datetime.now(timezone.utc)
+        results: Dict[int, Optional[str]] = {}
+        # 入队时间 -> 任务 ID；已在队列中的任务保留原入队时间
+        by_queued_at: Dict[datetime, List[int]] = {}
+        statuses = set()
+        for task_id in task_ids:
+            task = tasks.get(task_id)
+            if task is None:
+                results[task_id] = "not found"
+                continue
+            if not download_service.is_startable(task):
+                results[task_id] = f"invalid status {task.status}"
+                continue
+            queued = self.pending_queue.get(task_id)
+            queued_at = datetime.fromtimestamp(queued.enqueued_at, timezone.utc) if queued else now
+            by_queued_at.setdefault(queued_at, []).append(task_id)
+            statuses.add(task.status)
+            results[task_id] = None
+        for queued_at, ids in by_queued_at.items():
+            crud_download_task.enqueue_bulk(
+                db, ids=ids, priority=priority, queued_at=queued_at.replace(tzinfo=None).isoformat(),
+                from_statuses=sorted(statuses)
+            )
+        
+        # 重新读取，只把确实已置为 pending 的任务加入内存队列
+        db.expire_all()
+        queued_tasks = {
+            task.id: task for task in crud_download_task.get_by_ids(db, ids=[
+                task_id for ids in by_queued_at.values() for task_id in ids
+            ])
+        }
+        accepted = []
+        for queued_at, ids in by_queued_at.items():
+            for task_id in ids:
+                task = queued_tasks.get(task_id)
+                if task is None:
+                    results[task_id] = "not found"
+                elif task.status != "pending":
+                    results[task_id] = f"invalid status {task.status}"
+                else:
+                    accepted.append((task, queued_at.timestamp()))
+        
+        for task, enqueued_at in accepted:
+            self._enqueue(task, priority, enqueued_at)
+        if accepted:
+            logger.info(f"{len(accepted)} tasks added to queue with priority {priority}")
+            self._wake()
+        return results
+    
+    def remove_tasks_from_queue(self, task_ids: List[int]) -> int:
+        """从内存队列批量移除任务，返回实际移除的数量"""
+        return sum(1 for task_id in task_ids if self.pending_queue.remove(task_id))
+    
+    def _enqueue(self, task, priority: int, enqueued_at: float):
+        self.pending_queue.push(task.id, priority, enqueued_at, group=task.source_id, cost=self._job_cost(task))
+        # 排队期间预检文件大小，供磁盘空间检查和进度计算使用
+        if settings.DOWNLOAD_PREFLIGHT_ENABLED and task.file_size is None and task.id not in self.preflight_tasks:
+            self.preflight_tasks[task.id] = asyncio.create_task(self._run_preflight(task.id))
+    
+    async def restore_queue(self) -> int:
+        """应用启动时从 download_tasks 重建队列，返回队列中的任务数
+
+        已入队（pending 且记录了 queued_at）的任务按原优先级和入队时间恢复；中断的 running 任务（租约过期，
+        或由本进程以相同 DOWNLOAD_WORKER_ID 持有）改回 pending 重新排队，启动后按 task_metadata['resume']
+        中持久化的偏移量续传。
+        """
+        db = SessionLocal()
+        try:
+            throughput_tracker.load(db)
+            self._sync_queue(db)
+        finally:
+            db.close()
+        
+        if self.pending_queue:
+            self._wake()
+        return len(self.pending_queue)
+    
+    def _sync_queue(self, db: Session):
+        """与数据库同步本地队列：接管失去持有者的运行中任务，加入其他副本入队的任务，移除已在别处启动或取消的任务"""
+        self._last_sync = time.monotonic()
+        released = crud_download_task.release_stale_leases(
+            db, worker_id=download_service.worker_id, exclude_ids=list(download_service.active_downloads)
+        )
+        if released:
+            logger.info(f"Re-queued download tasks {released} whose worker lease had expired")
+        
+        pending = crud_download_task.get_by_status(db, status="pending")
+        pending_ids = {task.id for task in pending}
+        for task_id in self.pending_queue.task_ids():
+            if task_id not in pending_ids:
+                self.pending_queue.remove(task_id)
+        
+        added = 0
+        for task in pending:
+            metadata = task.task_metadata or {}
+            if task.id in self.pending_queue or not metadata.get('queued_at'):
+                continue
+            self._enqueue(task, int(metadata.get('priority') or 5), self._queued_timestamp(metadata))
+            added += 1
+        if added:
+            logger.info(f"Synced {added} queued download tasks from the database")
+    
+    def _materialise_schedules(self, db: Session):
+        """把到期的定时任务物化为一次运行（入队），并推进 next_run_at
+
+        停机期间错过的多次触发合并为一次运行。上一次运行仍在排队或进行中时跳过本次（计入 skipped_runs）；
+        暂停或取消的任务不产生新运行，直到被手动重新启动。到期任务行在同一事务中加锁修改，多个副本不会重复物化。
+        """
+        self._last_schedule_check = time.monotonic()
+        now = datetime.utcnow()
+        runs = []
+        for task in crud_download_task.get_due_schedules(db, now=now):
+            metadata = dict(task.task_metadata or {})
+            state = dict(metadata.get('schedule_state') or {})
+            try:
+                task.next_run_at = CronSchedule.parse(task.schedule).next_after(now)
+            except CronError as e:
+                logger.error(f"Disabling invalid schedule of task {task.id}: {e}")
+                task.next_run_at = None
+                continue
+            if task.status == "running" or (task.status == "pending" and metadata.get('queued_at')):
+                state['skipped_runs'] = state.get('skipped_runs', 0) + 1
+                logger.info(f"Skipping scheduled run of task {task.id}: the previous run is still {task.status}")
+            elif task.status in ("paused", "cancelled"):
+                continue
+            else:
+                state['runs'] = state.get('runs', 0) + 1
+                state['last_run_at'] = now.isoformat()
+                metadata['queued_at'] = now.isoformat()
+                # 新一次运行重新预检大小，磁盘空间检查、sjf 代价和耗时估计按本次运行计算，进度从 0 开始
+                metadata.pop('preflight', None)
+                task.file_size = None
+                task.downloaded_size = 0
+                task.progress = 0.0
+                task.status = "pending"
+                task.error_message = None
+                runs.append(task)
+            metadata['schedule_state'] = state
+            task.task_metadata = metadata
+        db.commit()
+        
+        enqueued_at = now.replace(tzinfo=timezone.utc).timestamp()
+        for task in runs:
+            self._enqueue(task, int((task.task_metadata or {}).get('priority') or 5), enqueued_at)
+            logger.info(f"Scheduled task {task.id} queued (next run at {task.next_run_at})")
+        if runs:
+            self._wake()
+    
+    def _queued_timestamp(self, metadata: Dict) -> float:
+        """task_metadata['queued_at']（UTC）对应的时间戳，缺失或无法解析时取当前时间"""
+        try:
+            return datetime.fromisoformat(metadata['queued_at']).replace(tzinfo=timezone.utc).timestamp()
+        except (KeyError, TypeError, ValueError):
+            return time.time()
+    
+    def _wake(self):
+        """唤醒调度循环"""
+        self._wakeup.set()
+    
+    def _on_download_finished(self, task_id: int, status: str):
+        """DownloadService 的任务结束回调：释放槽位并立即调度下一个任务"""
+        if self.running_tasks.pop(task_id, None) is not None:
+            logger.info(f"Task {task_id} finished with status {status}, slot released")
+        self._wake()
+    
+    async def _run_preflight(self, task_id: int):
+        """在独立会话中预检任务大小；失败时不影响任务启动（按大小未知处理）"""
+        async with self._preflight_slots:
+            await self._preflight(task_id)
+    
+    async def _preflight(self, task_id: int):
+        db = SessionLocal()
+        try:
+            await download_service.preflight(db, task_id)
+            if settings.DOWNLOAD_QUEUE_POLICY == "sjf" and task_id in self.pending_queue:
+                # 得知大小后按估计耗时调整在队列中的位置
+                task = crud_download_task.get(db, task_id)
+                if task:
+                    self.pending_queue.update_cost(task_id, self._job_cost(task))
+        except Exception as e:
+            logger.warning(f"Pre-flight sizing of task {task_id} failed: {e}")
+        finally:
+            db.close()
+            self.preflight_tasks.pop(task_id, None)
+            self._wake()
     
     async def remove_task_from_queue(self, task_id: int):
         """Remove task from queue"""
-        if task_id in self.pending_queue:
-            self.pending_queue.remove(task_id)
+        if self.pending_queue.remove(task_id):
             logger.info(f"Task {task_id} removed from queue")
     
+    async def update_task_priority(self, db: Session, task_id: int, priority: int) -> bool:
+        """修改任务优先级并写入 task_metadata；任务在队列中时 O(log n) 调整位置，返回是否在队列中"""
+        crud_download_task.update_metadata(db, task_id=task_id, metadata={"priority": priority})
+        queued = self.pending_queue.update_priority(task_id, priority)
+        if queued:
+            logger.info(f"Task {task_id} reprioritised to {priority}")
+        return queued
+    
     async def _process_queue(self, db: Session):
         """Process pending tasks based on concurrency limits"""
-        # Clean up completed/failed tasks
-        completed_tasks = []
-        for task_id, task in self.running_tasks.items():
-            if task.done():
-                completed_tasks.append(task_id)
-        
-        for task_id in completed_tasks:
-            del self.running_tasks[task_id]
-            logger.info(f"Task {task_id} completed and removed from running tasks")
-        
         # Start new tasks if we have capacity
         available_slots = self.max_concurrent_tasks - len(self.running_tasks)
+        # 预检未完成或等待磁盘空间的任务保留在队列中原来的位置
+        deferred: List[QueuedTask] = []
+        waiting_for_space: List[int] = []
+        self._refresh_source_slots(db)
+        running_by_source = Counter(running.source_id for running in self.running_tasks.values())
+        running_by_host = Counter(running.host for running in self.running_tasks.values() if running.host)
+        
+        def has_free_slot(source_id: int) -> bool:
+            """数据源及其主机是否还有空闲槽位"""
+            slots = self.source_slots.get(source_id)
+            if slots is None:
+                return True
+            if slots.limit and running_by_source[source_id] >= slots.limit:
+                return False
+            host_limit = settings.DOWNLOAD_MAX_TASKS_PER_HOST
+            return not (slots.host and host_limit and running_by_host[slots.host] >= host_limit)
         
         while available_slots > 0 and self.pending_queue:
-            task_id = self.pending_queue.pop(0)  # Get highest priority task
+            # Get highest priority task among sources with free slots
+            entry = self.pending_queue.pop(has_free_slot)
+            if entry is None:
+                break
+            task_id = entry.task_id
             
             # Verify task is still pending
             task = crud_download_task.get(db, task_id)
             if not task or task.status != "pending":
                 continue
+            
+            if task_id in self.preflight_tasks:
+                deferred.append(entry)
+                continue
+            
+            admission = self._check_disk_space(db, task)
+            if admission == "delay":
+                deferred.append(entry)
+                waiting_for_space.append(task_id)
+                continue
+            if admission:
+                logger.warning(f"Refusing task {task_id}: {admission}")
+                crud_download_task.set_status(db, task_id=task_id, status="failed", error_message=admission)
+                continue
                 
+            # 原子认领：其他副本已认领（或正在认领）的任务跳过
+            if not crud_download_task.claim(
+                db, task_id=task_id, worker_id=download_service.worker_id,
+                lease_seconds=settings.DOWNLOAD_LEASE_SECONDS
+            ):
+                logger.info(f"Task {task_id} was claimed by another worker")
+                continue
+            
             # Start the task
             try:
                 success = await download_service.start_download(db, task_id)
                 if success:
-                    # Track the running task (the actual async task is managed by download_service)
-                    self.running_tasks[task_id] = asyncio.create_task(self._monitor_task(db, task_id))
+                    # 下载协程由 download_service 管理，结束时通过 _on_download_finished 释放槽位
+                    slots = self.source_slots.get(task.source_id)
+                    host = slots.host if slots else None
+                    self.running_tasks[task_id] = RunningTask(datetime.utcnow(), task.source_id, host)
+                    running_by_source[task.source_id] += 1
+                    if host:
+                        running_by_host[host] += 1
                     available_slots -= 1
                     logger.info(f"Started task {task_id} ({len(self.running_tasks)}/{self.max_concurrent_tasks} slots used)")
                 else:
                     logger.error(f"Failed to start task {task_id}")
+                    self._fail_claimed_task(db, task_id, "下载任务启动失败")
             except Exception as e:
                 logger.error(f"Error starting task {task_id}: {e}")
+                self._fail_claimed_task(db, task_id, f"下载任务启动失败: {e}")
+        
+        for entry in deferred:
+            self.pending_queue.requeue(entry)
+        self.waiting_for_space = waiting_for_space
     
-    async def _monitor_task(self, db: Session, task_id: int):
-        """Monitor task completion"""
-        while True:
-            try:
-                task = crud_download_task.get(db, task_id)
-                if not task:
-                    break
-                    
-                if task.status in ["completed", "failed", "cancelled"]:
-                    break
-                    
-                await asyncio.sleep(10)  # Check every 10 seconds
-            except Exception as e:
-                logger.error(f"Error monitoring task {task_id}: {e}")
-                break
+    def _fail_claimed_task(self, db: Session, task_id: int, error_message: str):
+        """已认领但未能启动的任务标记为失败并释放租约，避免被续约或接管后反复重试同一失败"""
+        db.expire_all()
+        task = crud_download_task.get(db, task_id)
+        if task and task.status == "running" and task.worker_id == download_service.worker_id:
+            crud_download_task.set_status(db, task_id=task_id, status="failed", error_message=error_message)
     
-    def _insert_by_priority(self, task_id: int, priority: int):
-        """Insert task into queue maintaining priority order"""
-        # For now, simple insertion - could be optimized with heapq
-        inserted = False
-        for i, existing_task_id in enumerate(self.pending_queue):
-            # Lower number = higher priority
-            if priority < self._get_task_priority(existing_task_id):
-                self.pending_queue.insert(i, task_id)
-                inserted = True
-                break
-        
-        if not inserted:
-            self.pending_queue.append(task_id)
+    def _refresh_source_slots(self, db: Session):
+        """一次查询加载排队和运行中任务所属数据源的槽位配置"""
+        source_ids = set(self.pending_queue.groups())
+        source_ids.update(running.source_id for running in self.running_tasks.values())
+        slots: Dict[int, SourceSlots] = {}
+        for source in crud_data_source.get_by_ids(db, ids=list(source_ids)):
+            limit = source.max_concurrent_tasks
+            slots[source.id] = SourceSlots(
+                host=(urlparse(source.url).hostname or '').lower() or None,
+                limit=settings.DOWNLOAD_MAX_TASKS_PER_SOURCE if limit is None else limit
+            )
+        self.source_slots = slots
     
-    def _get_task_priority(self, task_id: int) -> int:
-        """Get task priority (would need to query DB in real implementation)"""
-        # This is a simplified implementation
-        # In practice, you'd cache task metadata or query the database
-        return 5  # Default priority
+    def _check_disk_space(self, db: Session, task) -> Optional[str]:
+        """按预检大小检查 DOWNLOAD_DIR 所在卷的剩余空间
+
+        返回 None 表示可以启动；"delay" 表示当前空间够用但需为运行中任务的剩余数据预留，等其完成后再启动；
+        其他字符串为拒绝原因（即使不考虑运行中任务也放不下）。
+        """
+        if not task.file_size:
+            return None
+        needed = max(task.file_size - (task.downloaded_size or 0), 0)
+        try:
+            free = shutil.disk_usage(settings.DOWNLOAD_DIR).free - settings.DOWNLOAD_MIN_FREE_SPACE
+        except OSError as e:
+            logger.warning(f"Cannot determine free space of {settings.DOWNLOAD_DIR}: {e}")
+            return None
+        if needed > free:
+            return (
+                f"磁盘空间不足: 任务预计还需 {needed} 字节，"
+                f"{settings.DOWNLOAD_DIR} 所在卷可用 {max(free, 0)} 字节"
+            )
+        reserved = sum(
+            max((running.file_size or 0) - (running.downloaded_size or 0), 0)
+            for running in crud_download_task.get_by_ids(db, ids=list(self.running_tasks))
+        )
+        if needed > free - reserved:
+            return "delay"
+        return None
     
-    def get_queue_status(self) -> Dict:
-        """Get current queue status"""
-        return {
+    def _remaining_bytes(self, task) -> Optional[int]:
+        if not task.file_size:
+            return None
+        return max(task.file_size - (task.downloaded_size or 0), 0)
+    
+    def _job_cost(self, task) -> float:
+        """sjf 策略下按估计耗时计算的降级级数（每 DOWNLOAD_SJF_SECONDS_PER_LEVEL 秒降一级，有上限）
+
+        大小未知的任务不降级；老化仍对所有任务生效，降级有上限保证大任务最终能够启动。
+        """
+        if settings.DOWNLOAD_QUEUE_POLICY != "sjf" or settings.DOWNLOAD_SJF_SECONDS_PER_LEVEL <= 0:
+            return 0.0
+        seconds = throughput_tracker.estimate_seconds(task.source_id, self._remaining_bytes(task))
+        if not seconds:
+            return 0.0
+        return min(seconds / settings.DOWNLOAD_SJF_SECONDS_PER_LEVEL, settings.DOWNLOAD_SJF_MAX_LEVELS)
+    
+    def _estimates(self, db: Session, queued: List[QueuedTask]) -> Dict[int, Dict]:
+        """估算运行中和排队任务的剩余耗时及预计开始/完成时间（相对当前的秒数）
+
+        运行中任务按当前实测速率（尚无速率时按数据源吞吐历史），排队任务按数据源吞吐历史估算；
+        排队任务按出队顺序依次分配给最先空出的并发槽位。模拟不考虑数据源/主机限制和磁盘空间等待，
+        大小未知的任务耗时为 None，且在模拟中按 0 计，其后任务的估计偏乐观。
+        """
+        task_ids = list(self.running_tasks) + [entry.task_id for entry in queued]
+        tasks = {task.id: task for task in crud_download_task.get_by_ids(db, ids=task_ids)}
+        estimates: Dict[int, Dict] = {}
+        
+        def estimate(task_id: int, live_rate: float = 0.0) -> Optional[float]:
+            task = tasks.get(task_id)
+            if task is None:
+                return None
+            remaining = self._remaining_bytes(task)
+            if live_rate > 0:
+                rate, rate_source = live_rate, "live"
+            else:
+                rate, rate_source = throughput_tracker.rate(task.source_id)
+            seconds = remaining / rate if remaining is not None and rate > 0 else None
+            estimates[task_id] = {
+                "remaining_bytes": remaining,
+                "rate": round(rate, 1),
+                "rate_source": rate_source,
+                "estimated_seconds": round(seconds, 1) if seconds is not None else None
+            }
+            return seconds
+        
+        # 各并发槽位的空闲时刻
+        slots: List[float] = []
+        for task_id in self.running_tasks:
+            seconds = estimate(task_id, bandwidth_limiter.get_task_rate(task_id))
+            if task_id in estimates:
+                estimates[task_id]["estimated_finish"] = round(seconds, 1) if seconds is not None else None
+            slots.append(seconds or 0.0)
+        slots.extend([0.0] * max(self.max_concurrent_tasks - len(slots), 0))
+        heapq.heapify(slots)
+        
+        for entry in queued:
+            seconds = estimate(entry.task_id)
+            start = heapq.heappop(slots) if slots else 0.0
+            heapq.heappush(slots, start + (seconds or 0.0))
+            if entry.task_id in estimates:
+                estimates[entry.task_id]["estimated_start"] = round(start, 1)
+                estimates[entry.task_id]["estimated_finish"] = round(start + seconds, 1) if seconds is not None else None
+        return estimates
+    
+    def get_queue_status(self, db: Optional[Session] = None) -> Dict:
+        """Get current queue status（传入数据库会话时附带各任务的耗时估计）"""
+        now = time.time()
+        queued = self.pending_queue.ordered()
+        status = {
             "running_tasks": len(self.running_tasks),
             "pending_tasks": len(self.pending_queue),
             "max_concurrent": self.max_concurrent_tasks,
             "scheduler_running": self.scheduler_running,
+            "worker_id": download_service.worker_id,
             "running_task_ids": list(self.running_tasks.keys()),
-            "pending_task_ids": self.pending_queue.copy()
+            "pending_task_ids": [entry.task_id for entry in queued],
+            "pending_priorities": {
+                entry.task_id: {
+                    "priority": entry.priority,
+                    "cost": round(entry.cost, 2),
+                    "effective_priority": round(self.pending_queue.effective_priority(entry.task_id, now), 2)
+                }
+                for entry in queued
+            },
+            "sources": self._source_status(),
+            "hosts": self._host_status(),
+            "preflight_task_ids": list(self.preflight_tasks.keys()),
+            "waiting_for_space_task_ids": self.waiting_for_space.copy(),
+            "queue_policy": settings.DOWNLOAD_QUEUE_POLICY,
+            "throughput": throughput_tracker.get_status()
+        }
+        if db is not None:
+            status["estimates"] = self._estimates(db, queued)
+        return status
+
+    def _source_status(self) -> Dict[int, Dict]:
+        """各数据源的运行/排队任务数和槽位上限"""
+        running = Counter(task.source_id for task in self.running_tasks.values())
+        source_ids = set(running) | set(self.pending_queue.groups())
+        status = {}
+        for source_id in sorted(source_ids):
+            slots = self.source_slots.get(source_id)
+            status[source_id] = {
+                "running": running[source_id],
+                "pending": self.pending_queue.group_size(source_id),
+                "limit": slots.limit if slots else settings.DOWNLOAD_MAX_TASKS_PER_SOURCE,
+                "host": slots.host if slots else None
+            }
+        return status
+    
+    def _host_status(self) -> Dict[str, Dict]:
+        """各主机的运行任务数和槽位上限"""
+        running = Counter(task.host for task in self.running_tasks.values() if task.host)
+        hosts = set(running) | {slots.host for slots in self.source_slots.values() if slots.host}
+        return {
+            host: {"running": running[host], "limit": settings.DOWNLOAD_MAX_TASKS_PER_HOST}
+            for host in sorted(hosts)
         }
 
 # Global scheduler instance
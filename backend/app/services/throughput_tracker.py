@@ -0,0 +1,81 @@
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.crud.crud_download_task import download_task as crud_download_task
+
+logger = logging.getLogger(__name__)
+
+# 传输量过小的运行（如目录无新文件、立即失败）不计入吞吐统计
+MIN_SAMPLE_BYTES = 1024 * 1024
+
+
+class ThroughputTracker:
+    """按数据源统计的下载吞吐历史，用于估算任务耗时
+
+    每次下载运行结束时记录实际传输的字节数和耗时，按数据源做指数平滑。样本同时写入
+    task_metadata['throughput']，启动时从最近的任务中恢复，多副本共享同一份历史。
+    """
+
+    def __init__(self, smoothing: Optional[float] = None):
+        self.smoothing = settings.DOWNLOAD_THROUGHPUT_SMOOTHING if smoothing is None else smoothing
+        self._lock = threading.Lock()
+        # source_id -> (平滑后的速率 字节/秒, 样本数)
+        self._rates: Dict[int, Tuple[float, int]] = {}
+
+    def record(self, source_id: int, nbytes: int, seconds: float) -> bool:
+        """记录一次运行的传输量，样本过小时忽略并返回 False"""
+        if nbytes < MIN_SAMPLE_BYTES or seconds <= 0:
+            return False
+        rate = nbytes / seconds
+        with self._lock:
+            previous = self._rates.get(source_id)
+            if previous is None:
+                self._rates[source_id] = (rate, 1)
+            else:
+                average, samples = previous
+                self._rates[source_id] = (self.smoothing * rate + (1 - self.smoothing) * average, samples + 1)
+        return True
+
+    def load(self, db: Session) -> int:
+        """从最近任务的 task_metadata['throughput'] 恢复历史（按时间先后重放），返回样本数"""
+        tasks = crud_download_task.get_recent(db, limit=settings.DOWNLOAD_THROUGHPUT_HISTORY_TASKS)
+        loaded = 0
+        for task in reversed(tasks):
+            sample = (task.task_metadata or {}).get('throughput') or {}
+            if self.record(task.source_id, int(sample.get('bytes') or 0), float(sample.get('seconds') or 0)):
+                loaded += 1
+        if loaded:
+            logger.info(f"Loaded {loaded} download throughput samples for {len(self._rates)} data sources")
+        return loaded
+
+    def rate(self, source_id: int) -> Tuple[float, str]:
+        """数据源的估计速率及其来源：source（该数据源历史）、global（所有数据源平均）或 default（配置默认值）"""
+        with self._lock:
+            entry = self._rates.get(source_id)
+            if entry is not None:
+                return entry[0], "source"
+            if self._rates:
+                return sum(rate for rate, _ in self._rates.values()) / len(self._rates), "global"
+        return float(settings.DOWNLOAD_THROUGHPUT_DEFAULT_RATE), "default"
+
+    def estimate_seconds(self, source_id: int, remaining_bytes: Optional[int]) -> Optional[float]:
+        """按数据源吞吐估算传输 remaining_bytes 所需秒数，大小未知时返回 None"""
+        if remaining_bytes is None:
+            return None
+        rate, _ = self.rate(source_id)
+        return max(remaining_bytes, 0) / rate if rate > 0 else None
+
+    def get_status(self) -> Dict[int, Dict]:
+        with self._lock:
+            return {
+                source_id: {"rate": round(rate, 1), "samples": samples}
+                for source_id, (rate, samples) in self._rates.items()
+            }
+
+
+# Global instance
+throughput_tracker = ThroughputTracker()
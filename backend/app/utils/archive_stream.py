@@ -0,0 +1,464 @@
+"""下载流式解压/解包工具：数据块到达时即解压，直接写出最终文件，无需先保存压缩包"""
+import bz2
+import lzma
+import re
+import struct
+import tarfile
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 压缩包扩展名 -> (容器格式, 压缩算法)，按最长匹配优先排列
+ARCHIVE_SUFFIXES: List[Tuple[str, str, Optional[str]]] = [
+    ('.tar.gz', 'tar', 'gz'),
+    ('.tgz', 'tar', 'gz'),
+    ('.tar.bz2', 'tar', 'bz2'),
+    ('.tbz2', 'tar', 'bz2'),
+    ('.tar.xz', 'tar', 'xz'),
+    ('.txz', 'tar', 'xz'),
+    ('.tar', 'tar', None),
+    ('.zip', 'zip', None),
+    ('.gz', 'file', 'gz'),
+    ('.bz2', 'file', 'bz2'),
+    ('.xz', 'file', 'xz'),
+]
+
+_TAR_BLOCK = 512
+_ZIP_LOCAL_HEADER = 0x04034b50
+_ZIP_DATA_DESCRIPTOR = 0x08074b50
+_ZIP_END_SIGNATURES = (0x02014b50, 0x06054b50, 0x06064b50)  # 中央目录、目录结束记录（含 zip64）
+
+
+class ArchiveFormatError(Exception):
+    """压缩包损坏、被截断或使用了无法流式处理的格式"""
+    pass
+
+
+def detect_archive(filename: str) -> Optional[Tuple[str, Optional[str], str]]:
+    """按扩展名识别压缩包，返回 (容器格式, 压缩算法, 去掉扩展名后的文件名)；不是压缩包时返回 None"""
+    lower = filename.lower()
+    for suffix, container, compression in ARCHIVE_SUFFIXES:
+        if lower.endswith(suffix) and len(filename) > len(suffix):
+            return container, compression, filename[:-len(suffix)]
+    return None
+
+
+class _Decompressor:
+    """gzip/bzip2/xz 增量解压，支持多个压缩流首尾相接的文件（如 pigz、pbzip2 的输出）"""
+
+    def __init__(self, compression: str):
+        self.compression = compression
+        self._obj = self._new()
+        self._started = False
+
+    def _new(self):
+        if self.compression == 'gz':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self.compression == 'bz2':
+            return bz2.BZ2Decompressor()
+        return lzma.LZMADecompressor()
+
+    def _is_eof(self) -> bool:
+        return self._obj.eof
+
+    def decompress(self, data: bytes) -> bytes:
+        output = []
+        while data:
+            if self._started and self._is_eof():
+                self._obj = self._new()
+            self._started = True
+            try:
+                output.append(self._obj.decompress(data))
+            except (zlib.error, OSError, EOFError, lzma.LZMAError) as e:
+                raise ArchiveFormatError(f"解压失败: {e}")
+            data = self._obj.unused_data if self._is_eof() else b''
+        return b''.join(output)
+
+    def finish(self):
+        if self._started and not self._is_eof():
+            raise ArchiveFormatError("压缩流不完整")
+
+
+class StreamExtractor:
+    """把压缩包的数据块依次 feed 进来，边接收边解压/解包，将成员直接写入 dest_dir
+
+    - .gz/.bz2/.xz：解压为去掉扩展名的单个文件；
+    - .tar(.gz/.bz2/.xz)：按 512 字节块流式解析（支持 GNU 长文件名和 pax 扩展头）；
+    - .zip：按本地文件头顺序解析 stored/deflate 成员，校验 CRC32，遇到中央目录即结束。
+
+    成员先写入 .part 文件，完整写出后才改为最终文件名；member_filter 按成员文件名决定是否解出，
+    目录、链接等非普通文件以及包含绝对路径或 '..' 的成员一律跳过。该类不是线程安全的。
+    """
+
+    def __init__(self, archive_name: str, dest_dir: Path, member_filter: Optional[Callable[[str], bool]] = None):
+        detected = detect_archive(archive_name)
+        if detected is None:
+            raise ArchiveFormatError(f"无法识别的压缩包格式: {archive_name}")
+        self.container, compression, stem = detected
+        self.archive_name = archive_name
+        self.dest_dir = dest_dir
+        self.member_filter = member_filter
+        self.outputs: List[Path] = []
+        self.skipped_members = 0
+        self._decompressor = _Decompressor(compression) if compression else None
+        self._member_file = None
+        self._member_path: Optional[Path] = None
+        self._member_crc = 0
+        if self.container == 'tar':
+            self._parser = _TarParser(self)
+        elif self.container == 'zip':
+            self._parser = _ZipParser(self)
+        else:
+            self._parser = _SingleFileParser(self, stem)
+
+    def feed(self, data: bytes):
+        """写入一块压缩包数据"""
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        if data:
+            self._parser.feed(data)
+
+    def finish(self) -> List[Path]:
+        """压缩包数据已全部到达：检查完整性并返回解出的文件"""
+        if self._decompressor is not None:
+            self._decompressor.finish()
+        self._parser.finish()
+        return self.outputs
+
+    def discard(self):
+        """删除已解出的文件和未完成的 .part 文件（传输失败或校验不通过时调用）"""
+        self._abort_member()
+        for path in self.outputs:
+            path.unlink(missing_ok=True)
+        self.outputs = []
+
+    def relative_outputs(self, base: Path) -> List[str]:
+        return [str(path.relative_to(base)) for path in self.outputs]
+
+    # 以下由格式解析器调用
+
+    def open_member(self, name: str) -> bool:
+        """开始一个成员，返回是否需要写出"""
+        parts = [part for part in PurePosixPath(name.replace('\\', '/')).parts if part not in ('', '.')]
+        unsafe = not parts or name.startswith('/') or '..' in parts
+        if unsafe or (self.member_filter and not self.member_filter(parts[-1])):
+            self.skipped_members += 1
+            return False
+        path = self.dest_dir.joinpath(*parts)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._member_path = path
+        self._member_file = open(path.with_name(path.name + '.part'), 'wb')
+        self._member_crc = 0
+        return True
+
+    def write_member(self, data: bytes):
+        if self._member_file is not None:
+            self._member_file.write(data)
+            self._member_crc = zlib.crc32(data, self._member_crc)
+
+    def close_member(self, expected_crc: Optional[int] = None):
+        if self._member_file is None:
+            return
+        self._member_file.close()
+        self._member_file = None
+        part_path = self._member_path.with_name(self._member_path.name + '.part')
+        if expected_crc is not None and expected_crc != self._member_crc:
+            part_path.unlink(missing_ok=True)
+            raise ArchiveFormatError(f"{self._member_path.name} CRC32 校验失败")
+        part_path.replace(self._member_path)
+        self.outputs.append(self._member_path)
+        self._member_path = None
+
+    def _abort_member(self):
+        if self._member_file is not None:
+            self._member_file.close()
+            self._member_file = None
+            self._member_path.with_name(self._member_path.name + '.part').unlink(missing_ok=True)
+            self._member_path = None
+
+
+class _SingleFileParser:
+    """单文件压缩（.gz/.bz2/.xz）：解压结果即为一个文件"""
+
+    def __init__(self, extractor: StreamExtractor, name: str):
+        self.extractor = extractor
+        self.wanted = extractor.open_member(name)
+
+    def feed(self, data: bytes):
+        if self.wanted:
+            self.extractor.write_member(data)
+
+    def finish(self):
+        if self.wanted:
+            self.extractor.close_member()
+
+
+class _TarParser:
+    """流式 tar 解析：头块 -> 数据 -> 补齐到 512 字节 -> 下一个头块"""
+
+    def __init__(self, extractor: StreamExtractor):
+        self.extractor = extractor
+        self.buffer = bytearray()
+        self.done = False
+        self.remaining = 0  # 当前成员剩余数据字节数
+        self.padding = 0  # 当前成员数据之后的补齐字节数
+        self.target: Optional[str] = None  # 'member' / 'longname' / 'pax' / None（跳过）
+        self.collected = bytearray()
+        self.next_name: Optional[str] = None  # GNU 长文件名或 pax path
+        self.next_size: Optional[int] = None  # pax size（超过 8GB 的成员）
+
+    def feed(self, data: bytes):
+        if self.done:
+            return
+        self.buffer += data
+        while not self.done:
+            if self.remaining:
+                if not self.buffer:
+                    return
+                chunk = bytes(self.buffer[:self.remaining])
+                del self.buffer[:len(chunk)]
+                self.remaining -= len(chunk)
+                if self.target == 'member':
+                    self.extractor.write_member(chunk)
+                elif self.target in ('longname', 'pax'):
+                    self.collected += chunk
+                if self.remaining == 0:
+                    self._end_entry()
+                continue
+            if self.padding:
+                skipped = min(self.padding, len(self.buffer))
+                del self.buffer[:skipped]
+                self.padding -= skipped
+                if self.padding:
+                    return
+                continue
+            if len(self.buffer) < _TAR_BLOCK:
+                return
+            block = bytes(self.buffer[:_TAR_BLOCK])
+            del self.buffer[:_TAR_BLOCK]
+            self._start_entry(block)
+
+    def _start_entry(self, block: bytes):
+        if block.count(0) == _TAR_BLOCK:
+            # 全零块表示归档结束
+            self.done = True
+            return
+        try:
+            info = tarfile.TarInfo.frombuf(block, 'utf-8', 'surrogateescape')
+        except tarfile.HeaderError as e:
+            raise ArchiveFormatError(f"tar 头损坏: {e}")
+
+        size = info.size
+        name = info.name
+        if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE):
+            self.target = 'longname' if info.type == tarfile.GNUTYPE_LONGNAME else 'pax'
+            self.collected = bytearray()
+        elif info.type in (tarfile.REGTYPE, tarfile.AREGTYPE, tarfile.CONTTYPE):
+            if self.next_size is not None:
+                size = self.next_size
+            if self.next_name is not None:
+                name = self.next_name
+            self.next_name = None
+            self.next_size = None
+            self.target = 'member' if self.extractor.open_member(name) else None
+        else:
+            # 目录、链接、设备文件及全局 pax 头：跳过
+            if info.type not in (tarfile.XGLTYPE, tarfile.DIRTYPE):
+                self.extractor.skipped_members += 1
+            self.next_name = None
+            self.next_size = None
+            self.target = None
+
+        self.remaining = size
+        self.padding = -size % _TAR_BLOCK
+        if size == 0:
+            self._end_entry()
+
+    def _end_entry(self):
+        if self.target == 'member':
+            self.extractor.close_member()
+        elif self.target == 'longname':
+            self.next_name = self.collected.rstrip(b'\0').decode('utf-8', 'surrogateescape')
+        elif self.target == 'pax':
+            records = _parse_pax(bytes(self.collected))
+            if 'path' in records:
+                self.next_name = records['path']
+            if 'size' in records:
+                self.next_size = int(records['size'])
+        self.target = None
+
+    def finish(self):
+        # 部分归档没有结尾的全零块，只要停在成员边界上即视为完整
+        if self.remaining or self.padding or self.target or (self.buffer and not self.done):
+            raise ArchiveFormatError("tar 数据不完整")
+
+
+def _parse_pax(data: bytes) -> Dict[str, str]:
+    """解析 pax 扩展头记录（"长度 键=值\\n"）"""
+    records = {}
+    pos = 0
+    while pos < len(data):
+        match = re.match(rb'(\d+) ', data[pos:])
+        if not match:
+            break
+        length = int(match.group(1))
+        record = data[pos + len(match.group(0)):pos + length - 1]
+        key, _, value = record.partition(b'=')
+        records[key.decode('utf-8', 'replace')] = value.decode('utf-8', 'surrogateescape')
+        pos += length
+    return records
+
+
+class _ZipParser:
+    """按本地文件头顺序流式解析 zip；中央目录位于文件末尾，读到即结束"""
+
+    def __init__(self, extractor: StreamExtractor):
+        self.extractor = extractor
+        self.buffer = bytearray()
+        self.done = False
+        self.state = 'header'
+        self.member: Dict = {}
+        self.inflater = None
+
+    def feed(self, data: bytes):
+        if self.done:
+            return
+        self.buffer += data
+        while not self.done:
+            if self.state == 'header':
+                if not self._read_header():
+                    return
+            elif self.state == 'data':
+                if not self._read_data():
+                    return
+            elif self.state == 'descriptor':
+                if not self._read_descriptor():
+                    return
+
+    def _read_header(self) -> bool:
+        if len(self.buffer) < 4:
+            return False
+        signature = struct.unpack('<I', self.buffer[:4])[0]
+        if signature in _ZIP_END_SIGNATURES:
+            self.done = True
+            return True
+        if signature != _ZIP_LOCAL_HEADER:
+            raise ArchiveFormatError("zip 本地文件头损坏")
+        if len(self.buffer) < 30:
+            return False
+        (_, _, flags, method, _, _, crc, csize, usize, name_length, extra_length) = struct.unpack(
+            '<IHHHHHIIIHH', self.buffer[:30]
+        )
+        header_length = 30 + name_length + extra_length
+        if len(self.buffer) < header_length:
+            return False
+        raw_name = bytes(self.buffer[30:30 + name_length])
+        extra = bytes(self.buffer[30 + name_length:header_length])
+        del self.buffer[:header_length]
+
+        name = raw_name.decode('utf-8' if flags & 0x800 else 'cp437', 'replace')
+        zip64 = False
+        if csize == 0xFFFFFFFF or usize == 0xFFFFFFFF:
+            zip64 = True
+            usize, csize = self._zip64_sizes(extra, usize, csize)
+        if flags & 0x1:
+            raise ArchiveFormatError(f"不支持加密的 zip 成员: {name}")
+        has_descriptor = bool(flags & 0x8)
+        if method not in (0, 8):
+            raise ArchiveFormatError(f"不支持的 zip 压缩方法 {method}: {name}")
+        if method == 0 and has_descriptor and not csize:
+            raise ArchiveFormatError(f"无法流式读取未记录长度的 stored 成员: {name}")
+
+        is_file = not name.endswith('/')
+        wanted = is_file and self.extractor.open_member(name)
+        self.member = {
+            'name': name,
+            'method': method,
+            'crc': crc,
+            'remaining': csize,
+            'descriptor': has_descriptor,
+            'zip64': zip64,
+            'wanted': wanted,
+        }
+        self.inflater = zlib.decompressobj(-15) if method == 8 else None
+        self.state = 'data'
+        return True
+
+    def _zip64_sizes(self, extra: bytes, usize: int, csize: int) -> Tuple[int, int]:
+        pos = 0
+        while pos + 4 <= len(extra):
+            header_id, length = struct.unpack('<HH', extra[pos:pos + 4])
+            if header_id == 0x0001:
+                data = extra[pos + 4:pos + 4 + length]
+                offset = 0
+                if usize == 0xFFFFFFFF and len(data) >= offset + 8:
+                    usize = struct.unpack('<Q', data[offset:offset + 8])[0]
+                    offset += 8
+                if csize == 0xFFFFFFFF and len(data) >= offset + 8:
+                    csize = struct.unpack('<Q', data[offset:offset + 8])[0]
+                break
+            pos += 4 + length
+        return usize, csize
+
+    def _read_data(self) -> bool:
+        member = self.member
+        # 不需要解出且已知压缩长度时直接跳过原始数据
+        if self.inflater is not None and (member['wanted'] or member['descriptor']):
+            if not self.buffer:
+                return False
+            data = bytes(self.buffer)
+            self.buffer.clear()
+            try:
+                output = self.inflater.decompress(data)
+            except zlib.error as e:
+                raise ArchiveFormatError(f"zip 成员 {member['name']} 解压失败: {e}")
+            if member['wanted'] and output:
+                self.extractor.write_member(output)
+            if self.inflater.eof:
+                self.buffer[:0] = self.inflater.unused_data
+                self._end_data()
+            return True
+
+        if member['remaining']:
+            if not self.buffer:
+                return False
+            chunk = bytes(self.buffer[:member['remaining']])
+            del self.buffer[:len(chunk)]
+            member['remaining'] -= len(chunk)
+            if member['wanted']:
+                self.extractor.write_member(chunk)
+            if member['remaining']:
+                return True
+        self._end_data()
+        return True
+
+    def _end_data(self):
+        if self.member['descriptor']:
+            self.state = 'descriptor'
+        else:
+            self._close_member(self.member['crc'])
+
+    def _read_descriptor(self) -> bool:
+        size_length = 16 if self.member['zip64'] else 8
+        if len(self.buffer) < 4:
+            return False
+        has_signature = struct.unpack('<I', self.buffer[:4])[0] == _ZIP_DATA_DESCRIPTOR
+        descriptor_length = (4 if has_signature else 0) + 4 + size_length
+        if len(self.buffer) < descriptor_length:
+            return False
+        crc_offset = 4 if has_signature else 0
+        crc = struct.unpack('<I', self.buffer[crc_offset:crc_offset + 4])[0]
+        del self.buffer[:descriptor_length]
+        self._close_member(crc)
+        return True
+
+    def _close_member(self, crc: int):
+        if self.member['wanted']:
+            self.extractor.close_member(expected_crc=crc)
+        self.member = {}
+        self.inflater = None
+        self.state = 'header'
+
+    def finish(self):
+        if not self.done:
+            raise ArchiveFormatError("zip 数据不完整")
@@ -0,0 +1,72 @@
+"""下载文件校验和工具函数"""
+import hashlib
+import re
+from pathlib import Path
+from typing import Dict, Optional
+
+# 校验文件（sidecar）扩展名与哈希算法的对应关系，按优先级排列
+SIDECAR_ALGORITHMS: Dict[str, str] = {
+    '.sha256': 'sha256',
+    '.md5': 'md5',
+}
+
+
+class ChecksumMismatchError(Exception):
+    """下载文件的摘要与远端校验文件不一致"""
+    pass
+
+
+_HEX_LENGTHS = {
+    'md5': 32,
+    'sha256': 64,
+}
+
+# 从磁盘补算摘要时的读取块大小
+_READ_BLOCK_SIZE = 1024 * 1024
+
+
+def new_hasher(algorithm: str):
+    """创建增量哈希对象"""
+    return hashlib.new(algorithm)
+
+
+def update_from_file(hasher, path: Path, length: Optional[int] = None):
+    """将文件的前 length 字节（默认整个文件）读入哈希对象，用于续传或分段下载后补算"""
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining is None or remaining > 0:
+            block = f.read(_READ_BLOCK_SIZE if remaining is None else min(_READ_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+
+def hash_file(path: Path, algorithm: str) -> str:
+    """计算整个文件的十六进制摘要"""
+    return update_from_file(new_hasher(algorithm), path).hexdigest()
+
+
+def parse_sidecar(content: str, filename: str, algorithm: str) -> Optional[str]:
+    """解析 .md5/.sha256 校验文件内容
+
+    支持仅包含摘要的格式以及 md5sum/sha256sum 的 "摘要  文件名" 格式（多行时按文件名匹配）。
+    """
+    length = _HEX_LENGTHS.get(algorithm)
+    if not length:
+        return None
+    pattern = re.compile(rf'\b([0-9a-fA-F]{{{length}}})\b')
+
+    candidates = []
+    for line in content.splitlines():
+        match = pattern.search(line)
+        if not match:
+            continue
+        if filename in line:
+            return match.group(1).lower()
+        candidates.append(match.group(1).lower())
+
+    # 没有按文件名匹配的行时，仅在校验文件只有一个摘要时采用
+    return candidates[0] if len(candidates) == 1 else None
@@ -0,0 +1,103 @@
+"""五段式 cron 表达式（分 时 日 月 周）解析与下次触发时间计算，时间均为 UTC"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import FrozenSet
+
+ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *',
+    '@yearly': '0 0 1 1 *',
+    '@annually': '0 0 1 1 *',
+}
+# 字段名, 最小值, 最大值（星期 0 和 7 都表示周日）
+_FIELDS = [('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 7)]
+# 找不到下次触发时间时放弃搜索的范围（如 2 月 30 日）
+_SEARCH_LIMIT = timedelta(days=366 * 5)
+
+
+class CronError(ValueError):
+    """cron 表达式无效"""
+    pass
+
+
+def _parse_field(text: str, name: str, low: int, high: int) -> FrozenSet[int]:
+    values = set()
+    for part in text.split(','):
+        range_text, _, step_text = part.partition('/')
+        try:
+            step = int(step_text) if step_text else 1
+            if range_text == '*':
+                start, end = low, high
+            elif '-' in range_text:
+                start, end = (int(value) for value in range_text.split('-', 1))
+            else:
+                start = int(range_text)
+                end = high if step_text else start
+        except ValueError:
+            raise CronError(f"Invalid {name} field '{text}'")
+        if step < 1 or start < low or end > high or start > end:
+            raise CronError(f"{name} field '{text}' is out of range {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+@dataclass(frozen=True)
+class CronSchedule:
+    expression: str
+    minutes: FrozenSet[int]
+    hours: FrozenSet[int]
+    days: FrozenSet[int]
+    months: FrozenSet[int]
+    weekdays: FrozenSet[int]  # 0=周日
+    day_restricted: bool
+    weekday_restricted: bool
+
+    @classmethod
+    def parse(cls, expression: str) -> "CronSchedule":
+        """解析 '分 时 日 月 周' 或 @hourly/@daily/@weekly/@monthly/@yearly；支持 *、列表、范围和步长"""
+        text = ALIASES.get(expression.strip().lower(), expression.strip())
+        parts = text.split()
+        if len(parts) != len(_FIELDS):
+            raise CronError(f"Cron expression '{expression}' must have 5 fields")
+        minutes, hours, days, months, weekdays = (
+            _parse_field(part, name, low, high) for part, (name, low, high) in zip(parts, _FIELDS)
+        )
+        return cls(
+            expression=expression.strip(),
+            minutes=minutes,
+            hours=hours,
+            days=days,
+            months=months,
+            weekdays=frozenset(day % 7 for day in weekdays),
+            day_restricted=parts[2] != '*',
+            weekday_restricted=parts[4] != '*'
+        )
+
+    def _matches_day(self, moment: datetime) -> bool:
+        in_month = moment.day in self.days
+        in_week = (moment.weekday() + 1) % 7 in self.weekdays
+        # 与标准 cron 一致：日和周都有限定时满足其一即可
+        if self.day_restricted and self.weekday_restricted:
+            return in_month or in_week
+        return in_month and in_week
+
+    def next_after(self, after: datetime) -> datetime:
+        """严格晚于 after 的下一次触发时间（精确到分钟）"""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + _SEARCH_LIMIT
+        while moment < limit:
+            if moment.month not in self.months:
+                year, month = divmod(moment.month, 12)
+                moment = moment.replace(year=moment.year + year, month=month + 1, day=1, hour=0, minute=0)
+            elif not self._matches_day(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise CronError(f"Cron expression '{self.expression}' never fires")
@@ -0,0 +1,324 @@
+"""OPeNDAP (DAP2) 协议解析：DDS 结构描述、DAS 属性和 .dods 二进制数据"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# DAP2 基本类型对应的 XDR 编码（大端）；Byte 按字节紧凑排列，Int16/UInt16 在传输中占 4 字节
+DAP_TYPES = {
+    'byte': np.dtype('u1'),
+    'int16': np.dtype('>i4'),
+    'uint16': np.dtype('>u4'),
+    'int32': np.dtype('>i4'),
+    'uint32': np.dtype('>u4'),
+    'float32': np.dtype('>f4'),
+    'float64': np.dtype('>f8'),
+}
+# 写入本地文件时使用的数据类型
+NATIVE_TYPES = {
+    'byte': np.dtype('u1'),
+    'int16': np.dtype('i2'),
+    'uint16': np.dtype('u2'),
+    'int32': np.dtype('i4'),
+    'uint32': np.dtype('u4'),
+    'float32': np.dtype('f4'),
+    'float64': np.dtype('f8'),
+}
+STRING_TYPES = {'string', 'url'}
+
+_TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\];=,:]|[^\s{}\[\];=,:"]+')
+_DATA_MARKER = b'\nData:\n'
+
+
+class DapError(Exception):
+    """OPeNDAP 响应无法解析"""
+    pass
+
+
+@dataclass
+class DapArray:
+    """基本类型变量（标量或多维数组）"""
+    name: str
+    type: str
+    dims: List[Tuple[str, int]] = field(default_factory=list)
+
+    @property
+    def shape(self) -> Tuple[int, ...]:
+        return tuple(size for _, size in self.dims)
+
+    @property
+    def dim_names(self) -> List[str]:
+        return [name for name, _ in self.dims]
+
+    @property
+    def is_numeric(self) -> bool:
+        return self.type in DAP_TYPES
+
+
+@dataclass
+class DapGrid:
+    """Grid：一个数据数组及其各维度的坐标数组（maps）"""
+    name: str
+    array: DapArray
+    maps: List[DapArray]
+
+
+@dataclass
+class DapStructure:
+    """Structure/Sequence 容器"""
+    name: str
+    kind: str
+    members: List["DapNode"]
+
+
+DapNode = Union[DapArray, DapGrid, DapStructure]
+
+
+@dataclass
+class DapDataset:
+    name: str
+    members: List[DapNode]
+
+    def __getitem__(self, name: str) -> DapNode:
+        for member in self.members:
+            if member.name == name:
+                return member
+        raise KeyError(name)
+
+    def get(self, name: str) -> Optional[DapNode]:
+        try:
+            return self[name]
+        except KeyError:
+            return None
+
+
+class _Tokens:
+    def __init__(self, text: str):
+        self.tokens = _TOKEN_RE.findall(text)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> str:
+        token = self.peek()
+        if token is None:
+            raise DapError("Unexpected end of DAP document")
+        self.pos += 1
+        return token
+
+    def expect(self, expected: str):
+        token = self.next()
+        if token.lower() != expected.lower():
+            raise DapError(f"Expected '{expected}' but found '{token}'")
+
+
+def _unquote(token: str) -> str:
+    if token.startswith('"') and token.endswith('"'):
+        return re.sub(r'\\(.)', r'\1', token[1:-1])
+    return token
+
+
+# ---------------------------------------------------------------- DDS
+
+def parse_dds(text: str) -> DapDataset:
+    """解析 DDS 文本"""
+    tokens = _Tokens(text)
+    tokens.expect('Dataset')
+    tokens.expect('{')
+    members = _parse_declarations(tokens)
+    name = tokens.next() if tokens.peek() not in (None, ';') else ''
+    return DapDataset(name=name, members=members)
+
+
+def _parse_declarations(tokens: _Tokens) -> List[DapNode]:
+    """解析到匹配的 '}' 为止的声明列表"""
+    members: List[DapNode] = []
+    while tokens.peek() != '}':
+        members.append(_parse_declaration(tokens))
+    tokens.expect('}')
+    return members
+
+
+def _parse_declaration(tokens: _Tokens) -> DapNode:
+    keyword = tokens.next()
+    kind = keyword.lower()
+    if kind == 'grid':
+        tokens.expect('{')
+        tokens.expect('ARRAY')
+        tokens.expect(':')
+        array = _parse_declaration(tokens)
+        tokens.expect('MAPS')
+        tokens.expect(':')
+        maps = _parse_declarations(tokens)
+        name = _unquote(tokens.next())
+        tokens.expect(';')
+        return DapGrid(name=name, array=array, maps=maps)
+    if kind in ('structure', 'sequence'):
+        tokens.expect('{')
+        members = _parse_declarations(tokens)
+        name = _unquote(tokens.next())
+        tokens.expect(';')
+        return DapStructure(name=name, kind=kind, members=members)
+    if kind not in DAP_TYPES and kind not in STRING_TYPES:
+        raise DapError(f"Unsupported DAP type '{keyword}'")
+
+    name = _unquote(tokens.next())
+    dims: List[Tuple[str, int]] = []
+    while tokens.peek() == '[':
+        tokens.next()
+        first = tokens.next()
+        if tokens.peek() == '=':
+            tokens.next()
+            dim_name, size = _unquote(first), int(tokens.next())
+        else:
+            # 匿名维度
+            dim_name, size = f"{name}_dim{len(dims)}", int(first)
+        tokens.expect(']')
+        dims.append((dim_name, size))
+    tokens.expect(';')
+    return DapArray(name=name, type=kind, dims=dims)
+
+
+# ---------------------------------------------------------------- DAS
+
+def parse_das(text: str) -> Dict[str, Dict[str, Any]]:
+    """解析 DAS 文本，返回 {变量名或 NC_GLOBAL: {属性名: 值}}；嵌套容器以 '.' 连接名称"""
+    tokens = _Tokens(text)
+    tokens.expect('Attributes')
+    tokens.expect('{')
+    result: Dict[str, Dict[str, Any]] = {}
+    while tokens.peek() != '}':
+        container = _unquote(tokens.next())
+        tokens.expect('{')
+        _parse_attribute_container(tokens, container, result)
+    tokens.expect('}')
+    return result
+
+
+def _parse_attribute_container(tokens: _Tokens, container: str, result: Dict[str, Dict[str, Any]]):
+    attributes = result.setdefault(container, {})
+    while tokens.peek() != '}':
+        attr_type = tokens.next()
+        if tokens.peek() == '{':
+            # 嵌套容器（如 Grid 的 maps 或 HDF 分组）
+            tokens.next()
+            _parse_attribute_container(tokens, f"{container}.{_unquote(attr_type)}", result)
+            continue
+        name = _unquote(tokens.next())
+        values = []
+        while True:
+            values.append(tokens.next())
+            separator = tokens.next()
+            if separator == ';':
+                break
+            if separator != ',':
+                raise DapError(f"Unexpected token '{separator}' in attribute {container}.{name}")
+        attributes[name] = _convert_attribute(attr_type.lower(), values)
+    tokens.expect('}')
+
+
+def _convert_attribute(attr_type: str, values: List[str]) -> Any:
+    if attr_type in STRING_TYPES:
+        strings = [_unquote(value) for value in values]
+        return strings[0] if len(strings) == 1 else '\n'.join(strings)
+    dtype = NATIVE_TYPES.get(attr_type)
+    if dtype is None:
+        return _unquote(values[0])
+    converted = np.array([float(_unquote(value)) for value in values]).astype(dtype)
+    return converted[0] if len(converted) == 1 else converted
+
+
+# ---------------------------------------------------------------- .dods
+
+def parse_dods(payload: bytes) -> Dict[str, np.ndarray]:
+    """解码 .dods 响应，返回 {变量路径: 数组}
+
+    Grid 内的数组和坐标分别以 'grid.array'、'grid.map' 为键，同时数组本身也以 grid 名为键。
+    """
+    marker = payload.find(_DATA_MARKER)
+    if marker < 0:
+        raise DapError(_error_message(payload))
+    dataset = parse_dds(payload[:marker].decode('utf-8', errors='replace'))
+    decoder = _XdrDecoder(payload, marker + len(_DATA_MARKER))
+    arrays: Dict[str, np.ndarray] = {}
+    for member in dataset.members:
+        decoder.decode(member, '', arrays)
+    return arrays
+
+
+def _error_message(payload: bytes) -> str:
+    text = payload[:2048].decode('utf-8', errors='replace')
+    match = re.search(r'message\s*=\s*"((?:[^"\\]|\\.)*)"', text)
+    return match.group(1) if match else f"Invalid DAP data response: {text[:200]}"
+
+
+class _XdrDecoder:
+    def __init__(self, payload: bytes, offset: int):
+        self.payload = payload
+        self.offset = offset
+
+    def _read(self, nbytes: int) -> bytes:
+        end = self.offset + nbytes
+        if end > len(self.payload):
+            raise DapError("Truncated DAP data response")
+        data = self.payload[self.offset:end]
+        self.offset = end
+        return data
+
+    def _uint32(self) -> int:
+        return int.from_bytes(self._read(4), 'big')
+
+    def decode(self, node: DapNode, prefix: str, arrays: Dict[str, np.ndarray]):
+        path = f"{prefix}{node.name}"
+        if isinstance(node, DapGrid):
+            arrays[path] = self._decode_array(node.array)
+            arrays[f"{path}.{node.array.name}"] = arrays[path]
+            for map_node in node.maps:
+                arrays[f"{path}.{map_node.name}"] = self._decode_array(map_node)
+        elif isinstance(node, DapStructure):
+            if node.kind == 'sequence':
+                raise DapError(f"DAP Sequence '{node.name}' is not supported")
+            for member in node.members:
+                self.decode(member, f"{path}.", arrays)
+            # 投影单个 Grid 数组时服务器可能将其包装为同名 Structure
+            if len(node.members) == 1 and path not in arrays:
+                arrays[path] = arrays[f"{path}.{node.members[0].name}"]
+        else:
+            arrays[path] = self._decode_array(node)
+
+    def _decode_array(self, node: DapArray) -> np.ndarray:
+        if not node.dims:
+            return self._decode_values(node.type, 1, scalar=True).reshape(())
+        count = self._uint32()
+        return self._decode_values(node.type, count).reshape(node.shape)
+
+    def _decode_values(self, dap_type: str, count: int, scalar: bool = False) -> np.ndarray:
+        if dap_type in STRING_TYPES:
+            # 字符串数组的长度只出现一次，每个元素为 长度 + 内容（补齐到 4 字节）
+            values = []
+            for _ in range(count):
+                length = self._uint32()
+                values.append(self._read(length).decode('utf-8', errors='replace'))
+                self._read(-length % 4)
+            return np.array(values, dtype=object)
+
+        dtype = DAP_TYPES[dap_type]
+        if not scalar:
+            # 数值数组的长度在 XDR 数据前重复一次
+            if self._uint32() != count:
+                raise DapError("Inconsistent DAP array length")
+        if dap_type == 'byte' and not scalar:
+            data = np.frombuffer(self._read(count), dtype=dtype)
+            self._read(-count % 4)
+        elif dap_type == 'byte':
+            data = np.frombuffer(self._read(4)[3:], dtype=dtype)
+        else:
+            data = np.frombuffer(self._read(count * dtype.itemsize), dtype=dtype)
+        return data.astype(NATIVE_TYPES[dap_type])
+
+
+def hyperslab(ranges: List[Tuple[int, int]]) -> str:
+    """将 [(start, stop_inclusive), ...] 转为 DAP2 约束表达式中的下标，如 [0:1:9][20:1:30]"""
+    return ''.join(f"[{start}:1:{stop}]" for start, stop in ranges)
@@ -0,0 +1,106 @@
+"""下载重试策略：带随机抖动的指数退避"""
+import asyncio
+import ftplib
+import logging
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 视为临时故障、值得重试的 HTTP 状态码
+TRANSIENT_HTTP_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class HttpStatusError(Exception):
+    """HTTP 请求返回了非预期的状态码"""
+
+    def __init__(self, status: int, reason: Optional[str] = None, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}: {reason}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RemoteFileChangedError(Exception):
+    """续传过程中远端文件发生变化，需要从头下载"""
+    pass
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），返回需等待的秒数"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断错误是否可能是临时性的：远端明确拒绝（4xx、FTP 5xx、文件不存在/无权限）时不重试"""
+    if isinstance(exc, HttpStatusError):
+        return exc.status in TRANSIENT_HTTP_STATUSES
+    if isinstance(exc, (ftplib.error_perm, FileNotFoundError, PermissionError)):
+        return False
+    return True
+
+
+def backoff_delay(attempt: int, base: Optional[float] = None, cap: Optional[float] = None) -> float:
+    """第 attempt 次重试（从 1 开始）前的等待秒数：在 [0, min(cap, base * 2^(attempt-1))] 内均匀取值（full jitter）
+
+    随机抖动使同时失败的多个连接/任务错开重试时间，不会在服务器恢复时一起涌入。
+    """
+    base = settings.DOWNLOAD_RETRY_BASE_DELAY if base is None else base
+    cap = settings.DOWNLOAD_RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+class RetryPolicy:
+    """单个请求或文件的重试策略，重试次数取自 DownloadTask.max_retries"""
+
+    def __init__(self, max_retries: int):
+        self.max_retries = max(0, max_retries or 0)
+
+    @classmethod
+    def for_task(cls, task) -> "RetryPolicy":
+        return cls(task.max_retries)
+
+    def delay(self, attempt: int, exc: BaseException) -> Optional[float]:
+        """第 attempt 次重试前的等待时间；不应重试时返回 None
+
+        服务器通过 Retry-After 要求等待更久时以其为准（不超过 DOWNLOAD_RETRY_MAX_DELAY）。
+        """
+        if attempt > self.max_retries or not is_retryable(exc):
+            return None
+        delay = backoff_delay(attempt)
+        retry_after = getattr(exc, 'retry_after', None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, settings.DOWNLOAD_RETRY_MAX_DELAY))
+        return delay
+
+    async def run(self, operation: Callable[[int], Awaitable[Any]], description: str) -> Any:
+        """执行 operation(attempt)，失败时按退避时间重试；attempt 从 0 开始，大于 0 时调用方可从已接收的字节续传"""
+        attempt = 0
+        while True:
+            try:
+                return await operation(attempt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = self.delay(attempt + 1, e)
+                if delay is None:
+                    raise
+                attempt += 1
+                logger.warning(
+                    f"Retrying {description} ({attempt}/{self.max_retries}) in {delay:.1f}s after error: {e}"
+                )
+                await asyncio.sleep(delay)
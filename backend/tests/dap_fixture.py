@@ -0,0 +1,193 @@
+"""测试用 DAP2 编码工具和本地 OPeNDAP 服务器
+
+服务器只实现本项目用到的部分协议：.dds、.das，以及按投影和下标约束返回的 .dods。
+"""
+import asyncio
+import re
+from typing import Dict, List, Optional, Set
+from urllib.parse import unquote
+
+import numpy as np
+from aiohttp import web
+
+_CONSTRAINT_RE = re.compile(r'^([\w.]+)((?:\[\d+:\d+:\d+\])*)$')
+_XDR_TYPES = {
+    'Byte': np.dtype('u1'),
+    'Int16': np.dtype('>i4'),
+    'UInt16': np.dtype('>u4'),
+    'Int32': np.dtype('>i4'),
+    'UInt32': np.dtype('>u4'),
+    'Float32': np.dtype('>f4'),
+    'Float64': np.dtype('>f8'),
+}
+
+
+def _pad(data: bytes) -> bytes:
+    return data + b'\0' * (-len(data) % 4)
+
+
+def xdr_array(dap_type: str, values) -> bytes:
+    """数值数组的 XDR 编码：长度写两次，Byte 紧凑排列并补齐到 4 字节，Int16/UInt16 占 4 字节"""
+    values = np.asarray(values).reshape(-1)
+    count = len(values).to_bytes(4, 'big')
+    return count + count + _pad(values.astype(_XDR_TYPES[dap_type]).tobytes())
+
+
+def xdr_scalar(dap_type: str, value) -> bytes:
+    """标量没有长度前缀，Byte 也占 4 字节"""
+    if dap_type == 'Byte':
+        return b'\0\0\0' + np.uint8(value).tobytes()
+    return np.array([value]).astype(_XDR_TYPES[dap_type]).tobytes()
+
+
+def xdr_strings(values: List[str]) -> bytes:
+    """字符串数组：长度只写一次，每个元素为 长度 + 内容（补齐到 4 字节）"""
+    data = len(values).to_bytes(4, 'big')
+    for value in values:
+        encoded = value.encode('utf-8')
+        data += len(encoded).to_bytes(4, 'big') + _pad(encoded)
+    return data
+
+
+def dods_payload(dds: str, data: bytes) -> bytes:
+    return dds.encode('utf-8') + b'\nData:\n' + data
+
+
+class FixtureDataset:
+    """一个 Grid 变量 sst[time][lat][lon]（Int16），经度为 0~360 约定"""
+
+    def __init__(self):
+        self.time = np.array([0.0, 1.0])
+        self.lat = np.array([-30.0, -10.0, 10.0, 30.0])
+        self.lon = np.arange(0.0, 360.0, 45.0)
+        # 含负数，用于检查 Int16 在传输中按 4 字节有符号整数编码
+        self.sst = (np.arange(2 * 4 * 8) - 20).astype(np.int16).reshape(2, 4, 8)
+        self.maps = {'time': self.time, 'lat': self.lat, 'lon': self.lon}
+
+    def dds(self) -> str:
+        return (
+            "Dataset {\n"
+            "    Grid {\n"
+            "      ARRAY:\n"
+            "        Int16 sst[time = 2][lat = 4][lon = 8];\n"
+            "      MAPS:\n"
+            "        Float64 time[time = 2];\n"
+            "        Float64 lat[lat = 4];\n"
+            "        Float64 lon[lon = 8];\n"
+            "    } sst;\n"
+            "} fixture;\n"
+        )
+
+    def das(self) -> str:
+        return (
+            "Attributes {\n"
+            "    sst {\n"
+            "        String units \"degC\";\n"
+            "        Int16 _FillValue -999;\n"
+            "    }\n"
+            "    time {\n"
+            "        String units \"days since 2000-01-01\";\n"
+            "    }\n"
+            "    lat {\n"
+            "        String units \"degrees_north\";\n"
+            "    }\n"
+            "    lon {\n"
+            "        String units \"degrees_east\";\n"
+            "    }\n"
+            "    NC_GLOBAL {\n"
+            "        String title \"fixture\";\n"
+            "    }\n"
+            "}\n"
+        )
+
+    def dods(self, constraint: str) -> bytes:
+        """按约束表达式返回 .dods 响应：投影 sst 返回裁剪后的 Grid，投影 sst.<map> 返回同名 Structure"""
+        declarations, data = [], b''
+        for item in constraint.split(','):
+            match = _CONSTRAINT_RE.match(item)
+            if not match:
+                raise ValueError(f"Unsupported constraint {item}")
+            path = match.group(1)
+            ranges = [tuple(int(part) for part in text.split(':')) for text in re.findall(r'\[([^\]]+)\]', match.group(2))]
+            index = tuple(slice(start, stop + 1, step) for start, step, stop in ranges)
+            if path == 'sst':
+                values = self.sst[index]
+                names = ('time', 'lat', 'lon')
+                dims = ''.join(f"[{name} = {size}]" for name, size in zip(names, values.shape))
+                maps = ''.join(
+                    f"Float64 {name}[{name} = {size}]; " for name, size in zip(names, values.shape)
+                )
+                declarations.append(f"Grid {{ ARRAY: Int16 sst{dims}; MAPS: {maps}}} sst;")
+                data += xdr_array('Int16', values)
+                for name, selector in zip(names, index or (slice(None),) * 3):
+                    data += xdr_array('Float64', self.maps[name][selector])
+            else:
+                name = path.split('.', 1)[1]
+                values = self.maps[name][index[0]] if index else self.maps[name]
+                declarations.append(f"Structure {{ Float64 {name}[{name} = {len(values)}]; }} sst;")
+                data += xdr_array('Float64', values)
+        return dods_payload("Dataset { " + ' '.join(declarations) + " } fixture;", data)
+
+
+class FixtureServer:
+    """在 aiohttp 测试服务器上提供 FixtureDataset，记录收到的 .dods 约束，可让指定约束返回 500"""
+
+    def __init__(self, dataset: Optional[FixtureDataset] = None):
+        self.dataset = dataset or FixtureDataset()
+        self.requests: List[str] = []
+        self.fail: Set[str] = set()
+        self.fail_delay = 0.0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get('/data/{name}', self.handle)
+        return app
+
+    async def handle(self, request: web.Request) -> web.Response:
+        name = request.match_info['name']
+        if name.endswith('.dds'):
+            return web.Response(text=self.dataset.dds())
+        if name.endswith('.das'):
+            return web.Response(text=self.dataset.das())
+        if name.endswith('.dods'):
+            constraint = unquote(request.rel_url.raw_query_string)
+            self.requests.append(constraint)
+            if constraint in self.fail:
+                # 让先发出的切片有时间写入，再使当前切片失败
+                await asyncio.sleep(self.fail_delay)
+                return web.Response(status=500, text='Error { code = 500; message = "injected"; }')
+            return web.Response(body=self.dataset.dods(constraint))
+        return web.Response(status=404)
+
+
+class FakeProgress:
+    """只记录进度和续传元数据的 ProgressAggregator 替身，不访问数据库"""
+
+    def __init__(self, task_id: int = 1, metadata: Optional[Dict] = None):
+        self.task_id = task_id
+        self.metadata = metadata if metadata is not None else {}
+        self.total_size = 0
+        self.downloaded_size = 0
+        self.flushes = 0
+        self.checkpoints = 0
+
+    def set_total_size(self, total_size: int):
+        self.total_size = total_size
+
+    def add(self, nbytes: int, **fields):
+        self.downloaded_size += nbytes
+
+    def set_metadata(self, key: str, value):
+        self.metadata[key] = value
+
+    def set_metadata_item(self, key: str, item_key: str, value):
+        self.metadata.setdefault(key, {})[item_key] = value
+
+    def checkpoint_metadata(self, nbytes: int = 0):
+        self.checkpoints += 1
+
+    async def tick(self):
+        pass
+
+    async def flush(self, status: str = "running", **extra):
+        self.flushes += 1
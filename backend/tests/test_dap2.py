@@ -0,0 +1,94 @@
+import numpy as np
+import pytest
+
+from app.utils.dap2 import DapError, DapGrid, hyperslab, parse_das, parse_dds, parse_dods
+from tests.dap_fixture import FixtureDataset, dods_payload, xdr_array, xdr_scalar, xdr_strings
+
+
+def test_parse_dods_decodes_xdr_types():
+    dds = (
+        "Dataset {\n"
+        "    Byte flags[n = 5];\n"
+        "    Int16 depth[m = 3];\n"
+        "    UInt16 counts[m = 3];\n"
+        "    String names[k = 2];\n"
+        "    Int32 level;\n"
+        "    Byte mask;\n"
+        "} sample;"
+    )
+    payload = dods_payload(dds, b''.join([
+        xdr_array('Byte', [1, 2, 3, 254, 255]),
+        xdr_array('Int16', [-1, 2, -32768]),
+        xdr_array('UInt16', [0, 1, 65535]),
+        xdr_strings(['a', 'ocean']),
+        xdr_scalar('Int32', -7),
+        xdr_scalar('Byte', 9),
+    ]))
+
+    arrays = parse_dods(payload)
+
+    # Byte 紧凑排列，5 个字节之后的 3 字节填充不能被当作下一个变量的数据
+    assert arrays['flags'].dtype == np.uint8
+    assert arrays['flags'].tolist() == [1, 2, 3, 254, 255]
+    # Int16/UInt16 在传输中占 4 字节，解码后收窄为本地类型且保留符号
+    assert arrays['depth'].dtype == np.int16
+    assert arrays['depth'].tolist() == [-1, 2, -32768]
+    assert arrays['counts'].dtype == np.uint16
+    assert arrays['counts'].tolist() == [0, 1, 65535]
+    assert arrays['names'].tolist() == ['a', 'ocean']
+    assert arrays['level'].shape == ()
+    assert int(arrays['level']) == -7
+    assert int(arrays['mask']) == 9
+
+
+def test_parse_dods_rejects_inconsistent_length():
+    count = (3).to_bytes(4, 'big')
+    payload = dods_payload("Dataset { Int32 x[n = 3]; } bad;", count + (2).to_bytes(4, 'big') + b'\0' * 12)
+    with pytest.raises(DapError):
+        parse_dods(payload)
+
+
+def test_parse_dods_reports_truncated_and_error_responses():
+    with pytest.raises(DapError, match='Truncated'):
+        parse_dods(dods_payload("Dataset { Float64 x[n = 4]; } short;", xdr_array('Float64', [1.0, 2.0])[:16]))
+    with pytest.raises(DapError, match='no such variable'):
+        parse_dods(b'Error {\n    code = 404;\n    message = "no such variable";\n};')
+
+
+def test_parse_dods_grid_keys():
+    fixture = FixtureDataset()
+    arrays = parse_dods(fixture.dods('sst[1:1:1][0:1:1][6:1:7]'))
+
+    expected = fixture.sst[1:2, 0:2, 6:8]
+    np.testing.assert_array_equal(arrays['sst'], expected)
+    np.testing.assert_array_equal(arrays['sst.sst'], expected)
+    np.testing.assert_array_equal(arrays['sst.lon'], [270.0, 315.0])
+    np.testing.assert_array_equal(arrays['sst.lat'], [-30.0, -10.0])
+
+
+def test_parse_dods_projected_maps():
+    fixture = FixtureDataset()
+    arrays = parse_dods(fixture.dods('sst.time,sst.lat,sst.lon'))
+
+    np.testing.assert_array_equal(arrays['sst.time'], fixture.time)
+    np.testing.assert_array_equal(arrays['sst.lat'], fixture.lat)
+    np.testing.assert_array_equal(arrays['sst.lon'], fixture.lon)
+
+
+def test_parse_dds_and_das():
+    fixture = FixtureDataset()
+    dataset = parse_dds(fixture.dds())
+    grid = dataset['sst']
+    assert isinstance(grid, DapGrid)
+    assert grid.array.dims == [('time', 2), ('lat', 4), ('lon', 8)]
+    assert [item.name for item in grid.maps] == ['time', 'lat', 'lon']
+
+    attributes = parse_das(fixture.das())
+    assert attributes['sst']['units'] == 'degC'
+    assert attributes['sst']['_FillValue'] == -999
+    assert attributes['NC_GLOBAL']['title'] == 'fixture'
+
+
+def test_hyperslab():
+    assert hyperslab([(0, 1), (1, 2), (7, 7)]) == '[0:1:1][1:1:2][7:1:7]'
+    assert hyperslab([]) == ''
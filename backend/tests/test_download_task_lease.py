@@ -0,0 +1,162 @@
+"""任务认领与租约：两个工作进程共用同一个数据库
+
+SQLite 不支持 FOR UPDATE SKIP LOCKED，这里验证的是认领条件本身（只认领 pending、只续约自己持有的租约、
+只接管过期租约）；行锁在 MySQL 上进一步保证并发认领时不会互相等待。
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  注册所有表
+from app.crud.crud_download_task import download_task as crud_download_task
+from app.db.base_class import Base
+from app.models.data_source import DataSource
+from app.models.download_task import DownloadTask
+
+LEASE_SECONDS = 60
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tasks.db'}")
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    worker_a, worker_b = factory(), factory()
+    try:
+        yield worker_a, worker_b
+    finally:
+        worker_a.close()
+        worker_b.close()
+        engine.dispose()
+
+
+def _create_tasks(db, count: int):
+    source = DataSource(name="source", url="http://example.com/data/")
+    db.add(source)
+    db.commit()
+    tasks = [DownloadTask(source_id=source.id, save_path="/tmp", status="pending") for _ in range(count)]
+    db.add_all(tasks)
+    db.commit()
+    return [task.id for task in tasks]
+
+
+def _expire_lease(db, task_id: int):
+    """模拟持有者失联：租约到期且未再续约"""
+    db.query(DownloadTask).filter(DownloadTask.id == task_id).update(
+        {DownloadTask.lease_expires_at: datetime.utcnow() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_only_one_worker_claims(sessions):
+    db_a, db_b = sessions
+    task_id, = _create_tasks(db_a, 1)
+
+    claimed = crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS)
+    assert claimed is not None
+    assert claimed.status == "running"
+    assert claimed.worker_id == "a"
+    assert claimed.lease_expires_at.replace(tzinfo=None) > datetime.utcnow()
+
+    assert crud_download_task.claim(db_b, task_id=task_id, worker_id="b", lease_seconds=LEASE_SECONDS) is None
+    assert crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS) is None
+    # 直接启动/恢复也不能抢走未过期的租约，持有者自己可以重新获取
+    assert crud_download_task.acquire_lease(db_b, task_id=task_id, worker_id="b", lease_seconds=LEASE_SECONDS) is None
+    assert crud_download_task.acquire_lease(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS) is not None
+
+    db_b.expire_all()
+    assert crud_download_task.get(db_b, task_id).worker_id == "a"
+
+
+def test_renew_leases(sessions):
+    db_a, db_b = sessions
+    first, second = _create_tasks(db_a, 2)
+    for task_id in (first, second):
+        crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=1)
+    before = crud_download_task.get(db_a, first).lease_expires_at
+
+    held = crud_download_task.renew_leases(db_a, ids=[first, second], worker_id="a", lease_seconds=LEASE_SECONDS)
+    assert sorted(held) == [first, second]
+    db_a.expire_all()
+    assert crud_download_task.get(db_a, first).lease_expires_at > before
+
+    # 其他进程不能续约不属于自己的任务
+    assert crud_download_task.renew_leases(db_b, ids=[first], worker_id="b", lease_seconds=LEASE_SECONDS) == []
+
+    # 任务在别处被暂停后不再由本进程持有
+    crud_download_task.set_status(db_b, task_id=second, status="paused")
+    assert crud_download_task.renew_leases(
+        db_a, ids=[first, second], worker_id="a", lease_seconds=LEASE_SECONDS
+    ) == [first]
+
+
+def test_expired_lease_is_taken_over(sessions):
+    db_a, db_b = sessions
+    live, dead = _create_tasks(db_a, 2)
+    for task_id in (live, dead):
+        crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS)
+    _expire_lease(db_a, dead)
+
+    # 只有过期的租约被释放回 pending，仍在续约的任务不受影响
+    assert crud_download_task.release_stale_leases(db_b, worker_id="b", exclude_ids=[]) == [dead]
+    db_b.expire_all()
+    released = crud_download_task.get(db_b, dead)
+    assert released.status == "pending"
+    assert released.worker_id is None
+    assert released.task_metadata.get("queued_at")
+    assert crud_download_task.get(db_b, live).worker_id == "a"
+
+    claimed = crud_download_task.claim(db_b, task_id=dead, worker_id="b", lease_seconds=LEASE_SECONDS)
+    assert claimed is not None and claimed.worker_id == "b"
+    # 原持有者恢复后发现租约已丢失
+    assert crud_download_task.renew_leases(db_a, ids=[live, dead], worker_id="a", lease_seconds=LEASE_SECONDS) == [live]
+
+
+def test_acquire_expired_lease(sessions):
+    db_a, db_b = sessions
+    task_id, = _create_tasks(db_a, 1)
+    crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS)
+    _expire_lease(db_a, task_id)
+
+    acquired = crud_download_task.acquire_lease(db_b, task_id=task_id, worker_id="b", lease_seconds=LEASE_SECONDS)
+    assert acquired is not None
+    assert acquired.worker_id == "b"
+    assert acquired.lease_expires_at.replace(tzinfo=None) > datetime.utcnow()
+
+
+def test_release_stale_leases_skips_own_running_tasks(sessions):
+    db_a, _ = sessions
+    running, orphaned = _create_tasks(db_a, 2)
+    for task_id in (running, orphaned):
+        crud_download_task.claim(db_a, task_id=task_id, worker_id="a", lease_seconds=LEASE_SECONDS)
+
+    # 以相同 worker_id 重启后，不在本进程下载列表中的任务被释放
+    assert crud_download_task.release_stale_leases(db_a, worker_id="a", exclude_ids=[running]) == [orphaned]
+
+
+def test_enqueue_bulk_skips_claimed_tasks_and_keeps_metadata(sessions):
+    db_a, db_b = sessions
+    paused, claimed = _create_tasks(db_a, 2)
+    crud_download_task.set_status(db_a, task_id=paused, status="paused")
+    crud_download_task.set_status(db_a, task_id=claimed, status="pending")
+    # 校验之后：另一个副本认领了任务，预检写入了元数据
+    crud_download_task.claim(db_b, task_id=claimed, worker_id="b", lease_seconds=LEASE_SECONDS)
+    crud_download_task.update_metadata(db_b, task_id=paused, metadata={"preflight": {"total_size": 10}})
+
+    count = crud_download_task.enqueue_bulk(
+        db_a, ids=[paused, claimed], priority=3, queued_at="2024-01-01T00:00:00",
+        from_statuses=["paused", "pending"]
+    )
+
+    assert count == 1
+    db_a.expire_all()
+    queued = crud_download_task.get(db_a, paused)
+    assert queued.status == "pending"
+    assert queued.task_metadata == {
+        "preflight": {"total_size": 10}, "priority": 3, "queued_at": "2024-01-01T00:00:00"
+    }
+    running = crud_download_task.get(db_a, claimed)
+    assert running.status == "running"
+    assert running.worker_id == "b"
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.data_download_service import download_service
+
+
+class HookProgress:
+    """只记录 task_metadata 和完成回调的进度替身"""
+
+    def __init__(self, metadata=None):
+        self.metadata = metadata or {}
+        self.hooks = []
+
+    def set_metadata(self, key, value):
+        self.metadata[key] = value
+
+    def add_completion_hook(self, hook):
+        self.hooks.append(hook)
+
+    async def complete(self):
+        for hook in self.hooks:
+            await hook()
+
+
+def _scheduled_task():
+    return SimpleNamespace(id=1, schedule='@daily', task_metadata={})
+
+
+NAMES = ['sst_20240101.nc', 'sst_20240102.nc', 'sst_20240103.nc', 'sst_20240104.nc']
+
+
+@pytest.mark.asyncio
+async def test_high_water_mark_advances_over_all_files():
+    progress = HookProgress({'high_water_mark': 'sst_20231231.nc'})
+    failed = []
+
+    selected = download_service._after_high_water_mark(_scheduled_task(), progress, NAMES, lambda name: name, failed)
+    await progress.complete()
+
+    assert selected == NAMES
+    assert progress.metadata['high_water_mark'] == 'sst_20240104.nc'
+
+
+@pytest.mark.asyncio
+async def test_high_water_mark_stops_before_failed_file():
+    progress = HookProgress({'high_water_mark': 'sst_20231231.nc'})
+    failed = []
+
+    selected = download_service._after_high_water_mark(_scheduled_task(), progress, NAMES, lambda name: name, failed)
+    # 目录运行中一个文件失败，其余文件成功，任务仍以 completed 结束
+    failed.append('sst_20240102.nc')
+    await progress.complete()
+
+    assert progress.metadata['high_water_mark'] == 'sst_20240101.nc'
+    # 下次运行重新获取失败的文件及其后的文件
+    next_run = download_service._after_high_water_mark(
+        _scheduled_task(), HookProgress(dict(progress.metadata)), NAMES, lambda name: name, []
+    )
+    assert next_run == NAMES[1:]
+
+
+@pytest.mark.asyncio
+async def test_high_water_mark_unchanged_when_first_file_fails():
+    progress = HookProgress({'high_water_mark': 'sst_20231231.nc'})
+    failed = []
+
+    download_service._after_high_water_mark(_scheduled_task(), progress, NAMES, lambda name: name, failed)
+    failed.append('sst_20240101.nc')
+    await progress.complete()
+
+    assert progress.metadata['high_water_mark'] == 'sst_20231231.nc'
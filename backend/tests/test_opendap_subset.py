@@ -0,0 +1,157 @@
+import copy
+
+import aiohttp
+import numpy as np
+import pytest
+from aiohttp.test_utils import TestServer
+
+from app.core.config import settings
+from app.services.opendap_subset import SubsetRequest, opendap_subsetter
+from app.utils.dap2 import parse_dds
+from app.utils.retry import HttpStatusError, RetryPolicy
+from tests.dap_fixture import FakeProgress, FixtureDataset, FixtureServer
+
+# bbox 为 [west, south, east, north]；west > east 表示跨越经度接缝（数据集经度为 0~315）
+SEAM_REQUEST = SubsetRequest(variables=['sst'], bbox=[300.0, -20.0, 50.0, 20.0])
+# 4 字节一片：接缝东侧的一列合为一片，西侧两列按时间拆为两片
+SLICE_MAX_BYTES = 8
+
+
+@pytest.fixture
+def small_slices(monkeypatch):
+    monkeypatch.setattr(settings, 'OPENDAP_SLICE_MAX_BYTES', SLICE_MAX_BYTES)
+    monkeypatch.setattr(settings, 'OPENDAP_PARALLEL_SLICES', 1)
+
+
+def _expected_sst(fixture: FixtureDataset) -> np.ndarray:
+    return np.concatenate([fixture.sst[:, 1:3, 7:8], fixture.sst[:, 1:3, 0:2]], axis=2)
+
+
+def test_longitude_ranges_across_seam():
+    lon = FixtureDataset().lon
+
+    assert opendap_subsetter._longitude_ranges(lon, 300.0, 50.0, 'lon') == [(7, 7, 0.0), (0, 1, 360.0)]
+    # -180~180 的请求换算到 0~360 约定的数据集
+    assert opendap_subsetter._longitude_ranges(lon, -60.0, 50.0, 'lon') == [(7, 7, 0.0), (0, 1, 360.0)]
+    assert opendap_subsetter._longitude_ranges(lon, 40.0, 100.0, 'lon') == [(1, 2, 0.0)]
+    # 跨度为整圈时取全部经度
+    assert opendap_subsetter._longitude_ranges(lon, -180.0, 180.0, 'lon') == [(0, 7, 0.0)]
+
+
+def test_longitude_ranges_for_signed_dataset():
+    lon = np.arange(-180.0, 180.0, 45.0)
+
+    assert opendap_subsetter._longitude_ranges(lon, 170.0, -100.0, 'lon') == [(0, 1, 360.0)]
+    assert opendap_subsetter._longitude_ranges(lon, 90.0, -90.0, 'lon') == [(6, 7, 0.0), (0, 2, 360.0)]
+    with pytest.raises(ValueError):
+        opendap_subsetter._longitude_ranges(lon, 140.0, 170.0, 'lon')
+
+
+def test_plan_slices(small_slices):
+    dataset = parse_dds(FixtureDataset().dds())
+    variables = opendap_subsetter._select_variables(dataset, ['sst'])
+    dim_ranges = {
+        'time': [(0, 1, 0.0)],
+        'lat': [(1, 2, 0.0)],
+        'lon': [(7, 7, 0.0), (0, 1, 360.0)],
+    }
+
+    slices = opendap_subsetter._plan_slices(variables, dim_ranges)
+
+    assert [(item.key, item.source, item.target, item.nbytes) for item in slices] == [
+        ('sst:0,1,7', [(0, 1), (1, 2), (7, 7)], (slice(0, 2), slice(0, 2), slice(0, 1)), 8),
+        ('sst:0,1,0', [(0, 0), (1, 2), (0, 1)], (slice(0, 1), slice(0, 2), slice(1, 3)), 8),
+        ('sst:1,1,0', [(1, 1), (1, 2), (0, 1)], (slice(1, 2), slice(0, 2), slice(1, 3)), 8),
+    ]
+    assert all(item.request_path == 'sst' for item in slices)
+
+
+@pytest.mark.asyncio
+async def test_download_subset_across_seam(tmp_path, small_slices):
+    import netCDF4
+
+    server = FixtureServer()
+    filepath = tmp_path / 'sst_subset.nc'
+    progress = FakeProgress()
+
+    async with TestServer(server.app()) as test_server:
+        # 服务器关闭后无法再生成 URL，需在上下文内取得
+        url = str(test_server.make_url('/data/sst.nc'))
+        async with aiohttp.ClientSession() as session:
+            size = await opendap_subsetter.download(
+                session, url + '.html', SEAM_REQUEST, filepath, progress, RetryPolicy(0)
+            )
+
+    assert size == filepath.stat().st_size
+    assert server.requests == [
+        'sst.time,sst.lat,sst.lon',
+        'sst[0:1:1][1:1:2][7:1:7]',
+        'sst[0:1:0][1:1:2][0:1:1]',
+        'sst[1:1:1][1:1:2][0:1:1]',
+    ]
+    assert progress.total_size == progress.downloaded_size == 24
+    # 每个切片只登记检查点，续传条目由聚合器按节奏写入
+    assert progress.checkpoints == 3
+    entry = progress.metadata['resume'][url]
+    assert entry == {'filename': filepath.name, 'completed': True, 'size': size}
+
+    with netCDF4.Dataset(str(filepath)) as output:
+        np.testing.assert_array_equal(output.variables['lon'][:], [315.0, 360.0, 405.0])
+        np.testing.assert_array_equal(output.variables['lat'][:], [-10.0, 10.0])
+        np.testing.assert_array_equal(output.variables['sst'][:], _expected_sst(server.dataset))
+        assert output.variables['sst'].units == 'degC'
+        assert output.title == 'fixture'
+
+
+@pytest.mark.asyncio
+async def test_download_resumes_remaining_slices(tmp_path, small_slices):
+    import netCDF4
+
+    server = FixtureServer()
+    server.fail = {'sst[1:1:1][1:1:2][0:1:1]'}
+    server.fail_delay = 0.2
+    filepath = tmp_path / 'sst_subset.nc'
+    first = FakeProgress()
+
+    async with TestServer(server.app()) as test_server:
+        url = str(test_server.make_url('/data/sst.nc'))
+        async with aiohttp.ClientSession() as session:
+            with pytest.raises(HttpStatusError):
+                await opendap_subsetter.download(session, url, SEAM_REQUEST, filepath, first, RetryPolicy(0))
+
+            entry = first.metadata['resume'][url]
+            assert entry['subset'] == SEAM_REQUEST.signature()
+            assert sorted(entry['slices']) == ['sst:0,1,0', 'sst:0,1,7']
+            assert filepath.with_name(filepath.name + '.part').exists()
+            assert not filepath.exists()
+
+            # 再次运行时从数据库中恢复的元数据开始，只请求失败的切片
+            server.fail = set()
+            server.requests.clear()
+            second = FakeProgress(metadata=copy.deepcopy(first.metadata))
+            await opendap_subsetter.download(session, url, SEAM_REQUEST, filepath, second, RetryPolicy(0))
+
+    assert server.requests == ['sst.time,sst.lat,sst.lon', 'sst[1:1:1][1:1:2][0:1:1]']
+    assert second.downloaded_size == second.total_size == 24
+    assert second.metadata['resume'][url]['completed'] is True
+    assert not filepath.with_name(filepath.name + '.part').exists()
+    with netCDF4.Dataset(str(filepath)) as output:
+        np.testing.assert_array_equal(output.variables['sst'][:], _expected_sst(server.dataset))
+
+
+@pytest.mark.asyncio
+async def test_download_restarts_when_subset_changes(tmp_path, small_slices):
+    server = FixtureServer()
+    filepath = tmp_path / 'sst_subset.nc'
+
+    async with TestServer(server.app()) as test_server:
+        url = str(test_server.make_url('/data/sst.nc'))
+        previous = SubsetRequest(variables=['sst'], bbox=[0.0, -90.0, 90.0, 90.0])
+        progress = FakeProgress(metadata={'resume': {url: {
+            'filename': filepath.name, 'subset': previous.signature(), 'slices': ['sst:0,1,7']
+        }}})
+        async with aiohttp.ClientSession() as session:
+            await opendap_subsetter.download(session, url, SEAM_REQUEST, filepath, progress, RetryPolicy(0))
+
+    # 裁剪条件变化后旧的切片记录作废，全部重新请求
+    assert len(server.requests) == 4
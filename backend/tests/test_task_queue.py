@@ -0,0 +1,54 @@
+import time
+
+from app.services.task_queue import FairTaskQueue
+
+AGING = 60.0
+
+
+def test_fair_queue_rotates_sources_within_priority_level():
+    queue = FairTaskQueue(aging_interval=AGING)
+    now = time.time()
+    # 同一优先级、都未等待满一个老化周期：不论入队先后都处于同一档，按数据源轮转
+    for index in range(3):
+        queue.push(task_id=index, priority=5, enqueued_at=now - 50 + index, group=1)
+    queue.push(task_id=10, priority=5, enqueued_at=now - 10, group=2)
+    queue.push(task_id=11, priority=5, enqueued_at=now - 9, group=2)
+
+    assert [queue.pop().task_id for _ in range(5)] == [0, 10, 1, 11, 2]
+
+
+def test_fair_queue_prefers_higher_priority_level():
+    queue = FairTaskQueue(aging_interval=AGING)
+    now = time.time()
+    queue.push(task_id=1, priority=5, enqueued_at=now, group=1)
+    queue.push(task_id=2, priority=3, enqueued_at=now, group=2)
+    queue.push(task_id=3, priority=3, enqueued_at=now, group=2)
+
+    assert queue.pop().task_id == 2
+    # 数据源 2 刚被调度过，但它的队首仍处于更高的优先级档
+    assert queue.pop().task_id == 3
+    assert queue.pop().task_id == 1
+
+
+def test_fair_queue_aging_moves_task_into_higher_level():
+    queue = FairTaskQueue(aging_interval=AGING)
+    now = time.time()
+    # 等待满两个老化周期的低优先级任务升入高优先级任务所在的档，与之轮转
+    queue.push(task_id=1, priority=5, enqueued_at=now - 2 * AGING - 1, group=1)
+    queue.push(task_id=4, priority=3, enqueued_at=now, group=1)
+    queue.push(task_id=2, priority=3, enqueued_at=now, group=2)
+    queue.push(task_id=3, priority=3, enqueued_at=now, group=2)
+
+    assert [queue.pop().task_id for _ in range(4)] == [1, 2, 4, 3]
+
+
+def test_fair_queue_level_does_not_drift_within_aging_interval():
+    queue = FairTaskQueue(aging_interval=AGING)
+    now = time.time()
+    # 两个任务的等待时间都不足一个老化周期，档位保持为原优先级
+    queue.push(task_id=1, priority=3, enqueued_at=now - AGING + 1, group=1)
+    queue.push(task_id=2, priority=3, enqueued_at=now, group=2)
+    queue.push(task_id=3, priority=3, enqueued_at=now, group=2)
+    queue.push(task_id=4, priority=3, enqueued_at=now, group=1)
+
+    assert [queue.pop().task_id for _ in range(4)] == [1, 2, 4, 3]
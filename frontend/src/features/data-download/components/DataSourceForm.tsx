@@ -176,12 +176,13 @@ export const DataSourceForm: React.FC<DataSourceFormProps> = ({
                   </label>
                   <select
                     value={formData.protocol}
-                    onChange={(e) => handleChange('protocol', e.target.value as 'HTTP' | 'FTP' | 'SFTP')}
+                    onChange={(e) => handleChange('protocol', e.target.value as 'HTTP' | 'FTP' | 'SFTP' | 'OPENDAP')}
                     className="w-full px-3 py-2 border border-gray-300 rounded-lg focus:ring-ocean-500 focus:border-ocean-500"
                   >
                     <option value="HTTP">HTTP/HTTPS</option>
                     <option value="FTP">FTP</option>
                     <option value="SFTP">SFTP</option>
+                    <option value="OPENDAP">OPeNDAP/THREDDS</option>
                   </select>
                 </div>
 
@@ -5,7 +5,7 @@ export interface DataSource {
   name: string
   url: string
   description?: string
-  protocol: 'HTTP' | 'FTP' | 'SFTP'
+  protocol: 'HTTP' | 'FTP' | 'SFTP' | 'OPENDAP'
   auth_required: boolean
   username?: string
   password?: string
@@ -18,7 +18,7 @@ export interface DataSourceCreate {
   name: string
   url: string
   description?: string
-  protocol?: 'HTTP' | 'FTP' | 'SFTP'
+  protocol?: 'HTTP' | 'FTP' | 'SFTP' | 'OPENDAP'
   auth_required?: boolean
   username?: string
   password?: string
@@ -42,6 +42,8 @@ export interface DownloadTask {
   created_at: string
   started_at?: string
   completed_at?: string
+  schedule?: string
+  next_run_at?: string
 }
 
 export interface DownloadTaskCreate {
@@ -50,6 +52,7 @@ export interface DownloadTaskCreate {
   filename_pattern?: string
   max_retries?: number
   timeout?: number
+  schedule?: string
 }
 
 export interface NetCDFFile {